@@ -1,4 +1,18 @@
+import bisect
+import collections
+import hashlib
+import heapq
+import importlib.util
 import json
+import marshal
+import mmap
+import multiprocessing
+import os
+import re
+import struct
+import sys
+import threading
+import time
 
 
 
@@ -8,6 +22,8 @@ REF_ROOT = "root"
 REF_UNIQUE = "unique"
 REF_SHARED = "shared"
 
+UNSET = object() #the content of a field which has no value
+
 
 def parse_assert(cond, reason = None):
     if reason is None:
@@ -16,8 +32,74 @@ def parse_assert(cond, reason = None):
         raise Exception(reason)
 
 
+class SourceWriter():
+    #accumulates generated python source along with the constants it refers to
+    def __init__(self):
+        self.lines = []
+        self.consts = {}
+        self._n = 0
+
+    def line(self, indent, text):
+        self.lines.append("    " * indent + text)
+
+    def var(self, prefix):
+        self._n += 1
+        return f"{prefix}{self._n}"
+
+    def const(self, value):
+        name = self.var("c")
+        self.consts[name] = value
+        return name
+
+    def source(self):
+        return "\n".join(self.lines) + "\n"
+
+
+class FieldIndex():
+    #value -> idents index over one basic field, optionally keeping the distinct values sorted for range queries
+    def __init__(self, field, value_type, ordered):
+        self.field = field
+        self.value_type = value_type
+        self.ordered = ordered
+        self.idents = {} #value -> set of idents
+        self.values = [] #sorted distinct values, only kept if ordered
+
+    def add(self, value, ident):
+        if type(value) != self.value_type:
+            return #invalid content is left for validation to report and is not indexed
+        if value in self.idents:
+            self.idents[value].add(ident)
+        else:
+            self.idents[value] = set([ident])
+            if self.ordered:
+                bisect.insort(self.values, value)
+
+    def remove(self, value, ident):
+        if type(value) != self.value_type:
+            return
+        idents = self.idents[value]
+        idents.remove(ident)
+        if len(idents) == 0:
+            del self.idents[value]
+            if self.ordered:
+                del self.values[bisect.bisect_left(self.values, value)]
+
+    def find(self, value):
+        return self.idents.get(value, ())
+
+    def find_range(self, low, high):
+        start = 0 if low is None else bisect.bisect_left(self.values, low)
+        end = len(self.values) if high is None else bisect.bisect_right(self.values, high)
+        found = []
+        for value in self.values[start:end]:
+            found.extend(sorted(self.idents[value]))
+        return found
+
+
 class TypeContext():
-    def __init__(self, structure):
+    #structure is not modified
+    #compiled, from the compiled() of a TypeContext made from the same structure, skips checking the types and compiling validators
+    def __init__(self, structure, compiled = None):
         assert type(structure) == list
 
         type_ctx = self
@@ -30,16 +112,34 @@ class TypeContext():
                 raise NotImplementedError()
             def get_refs(self, obj_ctx, content):
                 raise NotImplementedError()
-            def change_content(self, obj_ctx, ident, content, action):
+            def compile_check(self, writer, value, indent):
+                #emit source which returns False from the enclosing function if value is invalid
+                raise NotImplementedError()
+            def copy_content(self, content):
+                return content
+            def intern_content(self, content):
+                #content with its idents replaced by interned strs, so that every pointer to an object shares one str
+                #any lists and dicts are new, so the objects don't share containers with the json they were made from
+                return content
+            def change_content(self, obj_ctx, ident, content, action, delta):
+                #content may be changed in place, the new content is returned
+                #delta is a pair of lists (added refs, removed refs) which gets extended with the refs this change adds and removes
                 parse_assert("opp" in action, "change objects need an \"opp\" field")
                 opp = action["opp"]
                 if opp == "replace":
                     for key in action:
                         parse_assert(key in {"opp", "value"}, "invalid field \"{key}\"")
-                    return action["value"]
+                    #copied since the new content may later be changed in place
+                    changed_content = self.copy_content(action["value"])
+                    delta[0].extend(self.get_refs(obj_ctx, changed_content))
+                    if not content is UNSET:
+                        delta[1].extend(self.get_refs(obj_ctx, content))
+                    return changed_content
                 return None #None is a signal to the calling object to try applying type-specific changes
 
         class RefTypePtr(TypePtr):
+            kind = "ptr"
+
             def __init__(self, struct):
                 parse_assert(type(struct) == dict, "content type should be specified by a json object")
                 assert struct["kind"] == "ptr"
@@ -61,7 +161,7 @@ class TypeContext():
                 parse_assert(type(content) == str, "a pointer to an object should be an str containing the ident of the object")
                 parse_assert(content in obj_ctx._objects, f"pointer to object with id \"{content}\" not found")
                 target_object = obj_ctx._objects[content]
-                parse_assert(self.ptr_type in target_object.get_type().super_names, f"pointer to object of type \"{self.ptr_type}\" contains id of object of non super type \"{obj_ctx._objects[content].typename}\"")
+                parse_assert(type_ctx.is_subtype(target_object.typename, self.ptr_type), f"pointer to object of type \"{self.ptr_type}\" contains id of object of non super type \"{obj_ctx._objects[content].typename}\"")
                 if self.unique:
                     parse_assert(target_object.reftypestr() == REF_UNIQUE, "unique pointer must point to a unique with ref=unique")
                     assert ident == target_object.owner
@@ -73,14 +173,37 @@ class TypeContext():
                 assert type(content) == str #idents are strs
                 yield content
 
-            def change_content(self, obj_ctx, ident, content, action):
-                changed_content = super().change_content(obj_ctx, ident, content, action)
+            def copy_content(self, content):
+                return self.intern_content(content)
+
+            def intern_content(self, content):
+                if type(content) == str:
+                    return sys.intern(content)
+                return content
+
+            def compile_check(self, writer, value, indent):
+                target = writer.var("t")
+                writer.line(indent, f"if type({value}) != str:")
+                writer.line(indent + 1, "return False")
+                writer.line(indent, f"{target} = objects.get({value}, None)")
+                writer.line(indent, f"if {target} is None or not {target}.typename in {writer.const(type_ctx._types[self.ptr_type].sub_names)}:")
+                writer.line(indent + 1, "return False")
+                if self.unique:
+                    writer.line(indent, f"if type({target}).reftypestr() != REF_UNIQUE or {target}.owner != ident:")
+                else:
+                    writer.line(indent, f"if type({target}).reftypestr() != REF_SHARED or not ident in {target}.owners:")
+                writer.line(indent + 1, "return False")
+
+            def change_content(self, obj_ctx, ident, content, action, delta):
+                changed_content = super().change_content(obj_ctx, ident, content, action, delta)
                 if changed_content is None:
                     parse_assert(False, f"unknown basic type action {action['opp']}")
                 #self.validate_object(obj_ctx, ident, changed_content)
                 return changed_content
 
         class BasicTypePtr(TypePtr):
+            kind = "basic"
+
             def __init__(self, struct):
                 parse_assert(type(struct) == dict, "content type should be specified by a json object")
                 assert struct["kind"] == "basic"
@@ -101,14 +224,20 @@ class TypeContext():
             def get_refs(self, obj_ctx, content):
                 return; yield
 
-            def change_content(self, obj_ctx, ident, content, action):
-                changed_content = super().change_content(obj_ctx, ident, content, action)
+            def compile_check(self, writer, value, indent):
+                writer.line(indent, f"if type({value}) != {writer.const(BUILTIN_TYPES[self.builtin_type])}:")
+                writer.line(indent + 1, "return False")
+
+            def change_content(self, obj_ctx, ident, content, action, delta):
+                changed_content = super().change_content(obj_ctx, ident, content, action, delta)
                 if changed_content is None:
                     parse_assert(False, f"unknown basic type action {action['opp']}")
                 #self.validate_object(obj_ctx, ident, changed_content)
                 return changed_content
 
         class ListTypePtr(TypePtr):
+            kind = "list"
+
             def __init__(self, struct):
                 parse_assert(type(struct) == dict, "content type should be specified by a json object")
                 assert struct["kind"] == "list"
@@ -131,27 +260,59 @@ class TypeContext():
                 for item in content:
                     yield from self.listed_type.get_refs(obj_ctx, item)
 
-            def change_content(self, obj_ctx, ident, content, action):
-                changed_content = super().change_content(obj_ctx, ident, content, action)
+            def compile_check(self, writer, value, indent):
+                item = writer.var("v")
+                writer.line(indent, f"if type({value}) != list:")
+                writer.line(indent + 1, "return False")
+                writer.line(indent, f"for {item} in {value}:")
+                self.listed_type.compile_check(writer, item, indent + 1)
+
+            def copy_content(self, content):
+                if type(content) != list:
+                    return content #invalid, left for validation to report
+                return [self.listed_type.copy_content(item) for item in content]
+
+            def intern_content(self, content):
+                if type(content) != list:
+                    return content #invalid, left for validation to report
+                return [self.listed_type.intern_content(item) for item in content]
+
+            def change_content(self, obj_ctx, ident, content, action, delta):
+                changed_content = super().change_content(obj_ctx, ident, content, action, delta)
                 if changed_content is None:
                     opp = action["opp"]
-                    changed_content = list(content)
+                    changed_content = content #list actions are applied in place
                     if opp == "append":
                         for key in action:
                             parse_assert(key in {"opp", "value"}, f"unknown field \"{key}\" in list append action")
-                        changed_content.append(action["value"])
+                        item = self.listed_type.copy_content(action["value"])
+                        delta[0].extend(self.listed_type.get_refs(obj_ctx, item))
+                        obj_ctx._change(ident, (changed_content, "pop"), changed_content.append, item)
+                        if obj_ctx._undo_log is not None:
+                            obj_ctx._undo_log.append(lambda: obj_ctx._change(ident, (changed_content, "append", item), changed_content.pop))
                     elif opp == "modify":
                         for key in action:
                             parse_assert(key in {"opp", "idx", "action"}, f"unknown field \"{key}\" in list modify action")
                         parse_assert(type(action["idx"]) == int, "list idx should be an int")
                         parse_assert(0 <= action["idx"] < len(changed_content), "list idx out of range")
-                        changed_content[action["idx"]] = self.listed_type.change_content(obj_ctx, ident, changed_content[action["idx"]], action["action"])
+                        idx = action["idx"]
+                        item = changed_content[idx]
+                        new_item = self.listed_type.change_content(obj_ctx, ident, item, action["action"], delta)
+                        if not new_item is item: #otherwise a list item changed in place
+                            obj_ctx._change(ident, (changed_content, "set", idx, item), changed_content.__setitem__, idx, new_item)
+                            if obj_ctx._undo_log is not None:
+                                obj_ctx._undo_log.append(lambda: obj_ctx._change(ident, (changed_content, "set", idx, new_item), changed_content.__setitem__, idx, item))
                     elif opp == "remove":
                         for key in action:
                             parse_assert(key in {"opp", "idx"}, f"unknown field \"{key}\" in list modify action")
                         parse_assert(type(action["idx"]) == int, "list idx should be an int")
                         parse_assert(0 <= action["idx"] < len(changed_content), "list idx out of range")
-                        del changed_content[action["idx"]]
+                        idx = action["idx"]
+                        item = changed_content[idx]
+                        delta[1].extend(self.listed_type.get_refs(obj_ctx, item))
+                        obj_ctx._change(ident, (changed_content, "insert", idx, item), changed_content.pop, idx)
+                        if obj_ctx._undo_log is not None:
+                            obj_ctx._undo_log.append(lambda: obj_ctx._change(ident, (changed_content, "delete", idx), changed_content.insert, idx, item))
                     else:
                         parse_assert(False, f"unknown list opperation \"{opp}\"")
                 #self.validate_object(obj_ctx, ident, changed_content)
@@ -177,10 +338,10 @@ class TypeContext():
                 self.keys = set([])
                 self.content = {} #name -> TypePtr
                 self.optional = {} #name -> bool
-                structure["super"] = structure.get("super", [])
-                parse_assert(type(structure["super"]) == list, "super types should be provided as a list")
+                super_type_names = structure.get("super", [])
+                parse_assert(type(super_type_names) == list, "super types should be provided as a list")
                 self._imm_super_types = [] #used to compute all the types we inherit from
-                for super_type_name in structure["super"]:
+                for super_type_name in super_type_names:
                     parse_assert(type(super_type_name) == str, "super type names should be strings")
                     parse_assert(super_type_name in super_types, f"type of name \"{super_type_name}\" not found in definition of type \"{self.name}\"")
                     super_type = super_types[super_type_name]
@@ -191,28 +352,26 @@ class TypeContext():
                         self.content[n] = super_type.content[n]
                         self.optional[n] = super_type.optional[n]
                         self.keys.add(n)
-                structure["content"] = structure.get("content", {})
-                assert type(structure["content"]) == dict
-                for n, t_struct in structure["content"].items():
+                content_structure = structure.get("content", {})
+                assert type(content_structure) == dict
+                for n, t_struct in content_structure.items():
                     parse_assert(not n in self.content, f"duplicate content key {n} not allowed in definition of type\"{self.name}\"")
                     assert "optional" in t_struct
                     self.optional[n] = t_struct["optional"]
-                    del t_struct["optional"]
-                    self.content[n] = make_type_ptr(t_struct)
+                    self.content[n] = make_type_ptr({key : value for key, value in t_struct.items() if key != "optional"})
                     self.keys.add(n)
 
                 assert self.keys == self.content.keys() == self.optional.keys()
+                self.required = tuple(n for n, opt in self.optional.items() if not opt)
+
+                #all types which we inherit from, including ourself
+                #super types are always defined before us so their closures are already complete
+                super_names = set([self.name])
+                for super_type in self._imm_super_types:
+                    super_names.update(super_type.super_names)
+                self.super_names = frozenset(super_names)
+                self.sub_names = None #all types which inherit from us, filled in by the TypeContext once every type is known
 
-            #return all types which we inherit from
-            @property
-            def super_names(self):
-                super_types = set([self.name])
-                for imm_super_type in self._imm_super_types:
-                    super_types.add(imm_super_type.name)
-                    for super_type in imm_super_type.super_names:
-                        super_types.add(super_type)
-                return super_types
-            
             def __str__(self):
                 return str(self.name) + "[" + ", ".join(str(st) for st in self.super_names) + "]" + "(" + ", ".join(n + ':' + str(t) for n, t in self.content.items()) + ")"
 
@@ -221,16 +380,57 @@ class TypeContext():
                     t.validate_kinds(ptr_type_names)
 
             def validate_object(self, obj_ctx, ident, content):
+                #the compiled check only says whether content is valid
+                #on failure the interpreted check is rerun to raise the appropriate error
+                if not self.check(obj_ctx._objects, ident, content):
+                    self.interpret_object(obj_ctx, ident, content)
+                    assert False, f"compiled validator for type \"{self.name}\" disagrees with the interpreted one"
+
+            def copy_content(self, content):
+                if type(content) != dict:
+                    return content #invalid, left for validation to report
+                return {key : self.content[key].copy_content(value) if key in self.content else value for key, value in content.items()}
+
+            def intern_content(self, content):
+                if type(content) != dict:
+                    return content #invalid, left for validation to report
+                interned = {}
+                for key, value in content.items():
+                    if key in self.content:
+                        interned[sys.intern(key)] = self.content[key].intern_content(value)
+                    else:
+                        interned[key] = value
+                return interned
+
+            def interpret_object(self, obj_ctx, ident, content):
                 for key in content.keys():
                     parse_assert(key in self.keys, f"content has an unknown key {key}")
-                for key, opt in self.optional.items():
-                    if not opt:
-                        parse_assert(key in content, f"content is missing non-optional key {key}")
+                for key in self.required:
+                    parse_assert(key in content, f"content is missing non-optional key {key}")
                 for key in content.keys():
                     self.content[key].validate_object(obj_ctx, ident, content[key])
-                
 
-            
+            def compile_check(self, writer, func_name):
+                writer.line(0, f"def {func_name}(objects, ident, content):")
+                writer.line(1, "if type(content) != dict:")
+                writer.line(2, "return False")
+                writer.line(1, "for key in content:")
+                writer.line(2, f"if not key in {writer.const(frozenset(self.keys))}:")
+                writer.line(3, "return False")
+                for key in self.required:
+                    writer.line(1, f"if not {json.dumps(key)} in content:")
+                    writer.line(2, "return False")
+                for key, t in self.content.items():
+                    value = writer.var("v")
+                    if self.optional[key]:
+                        writer.line(1, f"{value} = content.get({json.dumps(key)}, content)")
+                        writer.line(1, f"if not {value} is content:")
+                        t.compile_check(writer, value, 2)
+                    else:
+                        writer.line(1, f"{value} = content[{json.dumps(key)}]")
+                        t.compile_check(writer, value, 1)
+                writer.line(1, "return True")
+                writer.line(0, "")
 
         self._types = {} #name -> Type
         for typedef in structure:
@@ -238,25 +438,152 @@ class TypeContext():
             parse_assert(not name in self._types, f"multiples definitions of type with name \"{name}\" is not allowed")
             self._types[name] = Type(typedef, self._types)
 
-        #check pointer types are valid
-        for t in self._types.values():
-            t.validate_kinds(set(self._types.keys()))
+        if compiled is None:
+            #check pointer types are valid
+            for t in self._types.values():
+                t.validate_kinds(set(self._types.keys()))
+
+            sub_names = {name : set() for name in self._types}
+            for t in self._types.values():
+                for super_name in t.super_names:
+                    sub_names[super_name].add(t.name)
+            for name, t in self._types.items():
+                t.sub_names = frozenset(sub_names[name])
+
+            #compile each type into a single flat validation function
+            writer = SourceWriter()
+            func_names = {}
+            for name, t in self._types.items():
+                func_names[name] = writer.var("validate_")
+                t.compile_check(writer, func_names[name])
+            self._validator_source = writer.source()
+            builtin_names = {builtin_type : name for name, builtin_type in BUILTIN_TYPES.items()}
+            #marshal can't store types, so builtin types used as constants are stored by name
+            self._compiled = {"sub_names" : {name : t.sub_names for name, t in self._types.items()},
+                              "func_names" : func_names,
+                              "consts" : {name : value for name, value in writer.consts.items() if type(value) != type},
+                              "builtin_consts" : {name : builtin_names[value] for name, value in writer.consts.items() if type(value) == type},
+                              "source" : self._validator_source,
+                              "code" : compile(self._validator_source, "<validators>", "exec")}
+        else:
+            parse_assert(compiled["sub_names"].keys() == self._types.keys(), "compiled types don't match the structure")
+            for name, t in self._types.items():
+                t.sub_names = compiled["sub_names"][name]
+            self._validator_source = compiled["source"]
+            self._compiled = compiled
+
+        namespace = dict(self._compiled["consts"])
+        namespace.update({name : BUILTIN_TYPES[builtin_name] for name, builtin_name in self._compiled["builtin_consts"].items()})
+        namespace.update({"REF_UNIQUE" : REF_UNIQUE, "REF_SHARED" : REF_SHARED})
+        exec(self._compiled["code"], namespace)
+        for name, t in self._types.items():
+            t.check = namespace[self._compiled["func_names"][name]]
 
 ##        for n, t in self._types.items():
 ##            print(t)
 
+    @classmethod
+    def load(cls, path, cache_dir = None, metrics = None):
+        #load the structure json file at path, caching the checked and compiled types in cache_dir, by default __pycache__ beside it
+        #the cache is keyed by a hash of the structure, this module's source and the python bytecode version
+        #the time taken is recorded in metrics, if given, as "type_context.cache_load" or "type_context.build"
+        if metrics is not None:
+            start = metrics.timer()
+        with open(path, "rb") as f:
+            text = f.read()
+        structure = json.loads(text)
+        if cache_dir is None:
+            cache_dir = os.path.join(os.path.dirname(os.path.abspath(path)), "__pycache__")
+        key = hashlib.sha256()
+        key.update(json.dumps(structure, sort_keys = True).encode())
+        with open(__file__, "rb") as f:
+            key.update(f.read())
+        key.update(importlib.util.MAGIC_NUMBER)
+        cache_path = os.path.join(cache_dir, f"types-{key.hexdigest()[:32]}.marshal")
+
+        try:
+            with open(cache_path, "rb") as f:
+                compiled = marshal.loads(f.read())
+        except (OSError, EOFError, ValueError, TypeError):
+            compiled = None
+        if not compiled is None:
+            type_ctx = cls(structure, compiled)
+            if metrics is not None:
+                metrics.span("type_context.cache_load", start)
+            return type_ctx
+
+        type_ctx = cls(structure)
+        try:
+            os.makedirs(cache_dir, exist_ok = True)
+            tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                marshal.dump(type_ctx.compiled(), f)
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            pass #caching is only an optimization
+        if metrics is not None:
+            metrics.span("type_context.build", start)
+        return type_ctx
+
+    def compiled(self):
+        #the checked and compiled types, in a form which can be stored with marshal and passed back to the constructor
+        return self._compiled
+
     def __str__(self):
         return "TypeContext(" + ", ".join(self._types.keys()) + ")"
 
+    def get_super_types(self, name):
+        return self._types[name].super_names
+
+    def get_sub_types(self, name):
+        return self._types[name].sub_names
+
+    def is_subtype(self, name, super_name):
+        return super_name in self._types[name].super_names
+
 
 
 
 class ObjectContext():
-    def __init__(self, type_ctx, objects):
+    def __init__(self, type_ctx, objects, do_validate = True):
+        assert type(do_validate) == bool
+        self._setup(type_ctx)
+        self._add_objects(objects)
+        self._finish_adding(do_validate)
+
+    @classmethod
+    def load(cls, type_ctx, f, chunk_size = 1000, do_validate = True, ndjson = False):
+        #build an ObjectContext from a file containing a json object of ident -> object, as accepted by the constructor
+        #or with ndjson = True from a file with the json of one object per line, including its "id", as written by write_json
+        #objects are parsed and created chunk_size at a time without ever holding the whole json in memory
+        assert type(chunk_size) == int and chunk_size >= 1
+        assert type(do_validate) == bool
+        assert type(ndjson) == bool
+        obj_ctx = cls.__new__(cls)
+        obj_ctx._setup(type_ctx)
+        pending = {} #ident of an object not yet created -> idents of the objects pointing to it
+        chunk = {}
+        for ident, obj_data in (iter_ndjson_items(f) if ndjson else iter_json_items(f)):
+            parse_assert(not ident in chunk, f"multiple objects with id {ident} found")
+            chunk[ident] = obj_data
+            if len(chunk) >= chunk_size:
+                obj_ctx._add_streamed_objects(chunk, pending)
+                chunk = {}
+        obj_ctx._add_streamed_objects(chunk, pending)
+        for ident in pending:
+            parse_assert(False, f"pointer to object with id \"{ident}\" not found")
+        obj_ctx._finish_adding(do_validate)
+        return obj_ctx
+
+    def _setup(self, type_ctx):
         assert type(type_ctx) == TypeContext
+        self._type_ctx = type_ctx
         
         obj_ctx = self
         class Object():
+            #objects are numerous so they have no __dict__, and every ident, typename and field name they hold is interned
+            __slots__ = ("typename", "ident", "content", "refs", "support", "rank")
+
             @classmethod
             def reftypestr(cls):
                 assert False
@@ -267,23 +594,29 @@ class ObjectContext():
                     parse_assert(key in {"type", "id", "ref", "content"}, f"invalid object key \"{key}\"")
                 #validate type
                 parse_assert(data["type"] in type_ctx._types, f"unknown type \"{data['type']}\"")
-                self.typename = data["type"]
+                t = type_ctx._types[data["type"]]
+                self.typename = t.name
                 
                 #validate id
                 assert type(ident) == str
-                self.ident = ident
+                self.ident = sys.intern(ident)
 
 ##                self.ref = data["ref"]
 ##                assert type(self) == Object[self.ref]
 
                 #validate content is done after all objects are created
-                self.content = data["content"]
+                self.content = t.intern_content(data["content"])
 
-                self.refs = set()
+                self.refs = {} #ident -> number of times we point to it
                 #gets filled by self.update_refs()
                 #empty indicates that none of our actual references have referse references yet
                 #self.refs can be seen as a record of which of self.get_refs() have referse references
 
+                #reachability from the root, maintained by ObjectContext._find_unreachable: the support is an owner with a lower rank,
+                #so following supports always ends at the root, which has rank 0. None until the object is found to be reachable
+                self.support = None
+                self.rank = None
+
             def to_json(self):
                 return {"type" : self.typename,
                         "id" : self.ident,
@@ -294,41 +627,85 @@ class ObjectContext():
                 return type_ctx._types[self.typename]
 
             def get_refs(self):
-                refs = set([])
+                return set(self.count_refs())
+
+            def count_refs(self):
+                refs = {}
                 t = self.get_type()
                 for key in self.content.keys():
                     for r in t.content[key].get_refs(obj_ctx, self.content[key]):
-                        refs.add(r)
+                        refs[r] = refs.get(r, 0) + 1
                 return refs
 
             def add_reverse_ref(self, ident):
                 raise NotImplementedError()
             def remove_reverse_ref(self, ident):
                 raise NotImplementedError()
+            def get_reverse_refs(self):
+                raise NotImplementedError()
 
             def update_refs(self):
-                #update self.refs and all reverse references of objects we point to
-                now_refs = self.get_refs()
-
-                #add new reverse references
-                add_refs = set(now_refs)
-                for r in self.refs:
-                    if r in add_refs:
-                        add_refs.remove(r)
-
-                for r in add_refs:
-                    obj_ctx._objects[r].add_reverse_ref(self.ident)
-
-                #remove old reverse references 
-                rem_refs = set(self.refs)
-                for r in now_refs:
-                    if r in rem_refs:
-                        rem_refs.remove(r)
-
-                for r in rem_refs:
-                    obj_ctx._objects[r].remove_reverse_ref(self.ident)
-
-                self.refs = now_refs
+                #update self.refs and all reverse references of objects we point to by rescanning our content
+                now_refs = self.count_refs()
+                added = []
+                removed = []
+                for r, n in now_refs.items():
+                    n -= self.refs.get(r, 0)
+                    if n > 0:
+                        added.extend([r] * n)
+                for r, n in self.refs.items():
+                    n -= now_refs.get(r, 0)
+                    if n > 0:
+                        removed.extend([r] * n)
+                self.apply_ref_delta(added, removed)
+
+            def apply_ref_delta(self, added, removed):
+                #update self.refs and reverse references given the refs added to and removed from our content
+                #reverse references only change when the count of a ref goes between zero and nonzero
+                metrics = obj_ctx._metrics
+                if metrics is not None:
+                    start = metrics.timer()
+                if obj_ctx._undo_log is not None:
+                    old_counts = {r : self.refs.get(r, 0) for r in added}
+                    old_counts.update((r, self.refs.get(r, 0)) for r in removed)
+                    obj_ctx._undo_log.append(lambda: self.restore_ref_counts(old_counts))
+                for r in added:
+                    n = self.refs.get(r, 0)
+                    if n == 0:
+                        obj_ctx._objects[r].add_reverse_ref(self.ident)
+                        obj_ctx._dirty.add(r)
+                        if len(obj_ctx._closure_deps) != 0:
+                            obj_ctx._invalidate_closures((self.ident, r))
+                    self.refs[r] = n + 1
+
+                for r in removed:
+                    n = self.refs[r] - 1
+                    if n == 0:
+                        del self.refs[r]
+                        target = obj_ctx._objects[r]
+                        target.remove_reverse_ref(self.ident)
+                        obj_ctx._dirty.add(r)
+                        #losing its supporting owner is the only way an existing object can become unreachable
+                        if target.support == self.ident:
+                            obj_ctx._unrooted.add(r)
+                        if len(obj_ctx._closure_deps) != 0:
+                            obj_ctx._invalidate_closures((self.ident, r))
+                    else:
+                        self.refs[r] = n
+
+                if metrics is not None:
+                    metrics.refs_touched += len(added) + len(removed)
+                    metrics.touched.add(self.ident)
+                    metrics.touched.update(added)
+                    metrics.touched.update(removed)
+                    metrics.span("update_refs", start)
+
+            def restore_ref_counts(self, counts):
+                for r, n in counts.items():
+                    if n == 0:
+                        self.refs.pop(r, None)
+                    else:
+                        self.refs[r] = n
 
             def get_unique_owner(self):
                 raise NotImplementedError(f"get_unique_owner not implemented for {type(self)}")
@@ -344,6 +721,8 @@ class ObjectContext():
         self.Object = Object
 
         class RootObject(Object):
+            __slots__ = ()
+
             @classmethod
             def reftypestr(cls):
                 return "root"
@@ -355,12 +734,16 @@ class ObjectContext():
                 parse_assert(False, "The root object cannot be referenced")
             def remove_reverse_ref(self, ident):
                 assert False
+            def get_reverse_refs(self):
+                return ()
                 
             def validate(self):
                 super().validate()
 
 
         class UniqueObject(Object):
+            __slots__ = ("owner",)
+
             @classmethod
             def reftypestr(cls):
                 return "unique"
@@ -371,10 +754,22 @@ class ObjectContext():
 
             def add_reverse_ref(self, ident):
                 parse_assert(self.owner is None, f"unique objects should have exactly one reference, but unique object {ident} has more than one")
-                self.owner = ident
+                obj_ctx._change(self.ident, (self, "remove_owner", ident), setattr, self, "owner", ident)
+                if len(obj_ctx._subscriptions) != 0:
+                    obj_ctx._note_owner(self.ident, ident, True)
+                if obj_ctx._undo_log is not None:
+                    obj_ctx._undo_log.append(lambda: self.remove_reverse_ref(ident))
             def remove_reverse_ref(self, ident):
                 assert self.owner == ident
-                self.owner = None
+                obj_ctx._change(self.ident, (self, "add_owner", ident), setattr, self, "owner", None)
+                if len(obj_ctx._subscriptions) != 0:
+                    obj_ctx._note_owner(self.ident, ident, False)
+                if obj_ctx._undo_log is not None:
+                    obj_ctx._undo_log.append(lambda: self.add_reverse_ref(ident))
+            def get_reverse_refs(self):
+                if self.owner is None:
+                    return ()
+                return (self.owner,)
 
             def get_unique_owner(self):
                 return self.owner
@@ -382,11 +777,13 @@ class ObjectContext():
             def validate(self):
                 super().validate()
                 assert not self.owner is None
-                assert self.refs == self.get_refs()
+                assert self.refs == self.count_refs()
                 assert self.ident in obj_ctx._objects[self.owner].refs
 
 
         class SharedObject(Object):
+            __slots__ = ("owners",)
+
             @classmethod
             def reftypestr(cls):
                 return "shared"
@@ -396,17 +793,28 @@ class ObjectContext():
                 self.owners = set([])
 
             def add_reverse_ref(self, ident):
-                self.owners.add(ident)
+                assert not ident in self.owners
+                obj_ctx._change(self.ident, (self, "remove_owner", ident), self.owners.add, ident)
+                if len(obj_ctx._subscriptions) != 0:
+                    obj_ctx._note_owner(self.ident, ident, True)
+                if obj_ctx._undo_log is not None:
+                    obj_ctx._undo_log.append(lambda: self.remove_reverse_ref(ident))
             def remove_reverse_ref(self, ident):
                 assert ident in self.owners
-                self.owners.remove(ident)
+                obj_ctx._change(self.ident, (self, "add_owner", ident), self.owners.remove, ident)
+                if len(obj_ctx._subscriptions) != 0:
+                    obj_ctx._note_owner(self.ident, ident, False)
+                if obj_ctx._undo_log is not None:
+                    obj_ctx._undo_log.append(lambda: self.add_reverse_ref(ident))
+            def get_reverse_refs(self):
+                return self.owners
 
             def get_shared_owners(self):
                 return self.owners
 
             def validate(self):
                 super().validate()
-                assert self.refs == self.get_refs()
+                assert self.refs == self.count_refs()
                 for owner in self.owners:
                     assert self.ident in obj_ctx._objects[owner].refs
             
@@ -424,14 +832,77 @@ class ObjectContext():
 
         self._root = None
         self._objects = {} #ident -> objects
-        self.add_objects(objects)
+        #objects touched since the last validation, used by validate(incremental = True)
+        self._dirty = set() #idents whose content or reverse references need rechecking
+        self._unrooted = set() #idents which lost their supporting owner or are new, so may be unreachable from the root
+        #while applying an atomic change block this is a list of functions which undo each change made so far
+        self._undo_log = None
+        self._by_type = {name : set() for name in type_ctx._types} #typename -> idents of objects of exactly that type
+        self._field_indexes = {} #(typename, field) -> FieldIndex
+        self._indexes_by_type = {name : [] for name in type_ctx._types} #typename -> FieldIndexes covering objects of exactly that type
+        #snapshot isolation for ReadViews, see enable_snapshots
+        self._version = 0 #number of change blocks committed
+        self._history = None #ident -> ObjectHistory of the changes an open ReadView may need to undo
+        self._history_by_version = {} #version -> idents with a history entry for the change block making that version
+        #what the change block being applied changed, for the ChangeEvent sent to subscriptions, only kept if there are any
+        self._event_objects = {} #ident -> (typename, ref) at the start of the block, or None, for objects it added or removed
+        self._event_fields = {} #ident -> fields modified by the block
+        self._event_owners = {} #ident -> (owners gained, owners lost) by the block
+        self._subscriptions = [] #see subscribe
+        self._pinned = {} #version -> number of open ReadViews of that version
+        self._pin_lock = threading.Lock()
+        self._metrics = None #see enable_metrics
+        #cached results of closures, least recently used first, dropped when an object they examined is added, removed or relinked
+        self._closures = collections.OrderedDict() #(ident, direction, types, through, max_depth) -> (frozenset of idents found, idents examined)
+        self._closure_deps = {} #ident -> keys of the cached closures which examined it
+        self._closure_cache_used = 0 #total number of idents examined over the cached closures
+        self.set_closure_cache(1000000)
+
+    def _finish_adding(self, do_validate):
         parse_assert(not self._root is None, "no root object present")
         assert type(self._root) == str
         assert self._root in self._objects
 
-        self.validate()
+        if do_validate:
+            self.validate()
+
+    def _index_object(self, obj):
+        self._by_type[obj.typename].add(obj.ident)
+        for index in self._indexes_by_type[obj.typename]:
+            if index.field in obj.content:
+                index.add(obj.content[index.field], obj.ident)
+
+    def _unindex_object(self, obj):
+        self._by_type[obj.typename].discard(obj.ident)
+        for index in self._indexes_by_type[obj.typename]:
+            if index.field in obj.content:
+                index.remove(obj.content[index.field], obj.ident)
+
+    def _insert_object(self, ident, obj):
+        parse_assert(not ident in self._objects, f"multiple objects with id {obj.ident} found")
+        if len(self._subscriptions) != 0:
+            self._note_object(ident)
+        self._change(ident, None, self._objects.__setitem__, ident, obj)
+        self._index_object(obj)
+        if len(self._closure_deps) != 0:
+            self._invalidate_closures((ident,))
+        if self._undo_log is not None:
+            self._undo_log.append(lambda: self._unindex_object(self._objects.pop(ident)))
+        if type(obj).reftypestr() == "root":
+            parse_assert(self._root is None, "more than one root object present")
+            self._root = ident
+            obj.rank = 0
+            if self._undo_log is not None:
+                self._undo_log.append(lambda: setattr(self, "_root", None))
 
     def add_objects(self, objects):
+        #committed as a change block of its own, so ReadViews and subscribers see the objects added
+        try:
+            self._add_objects(objects)
+        finally:
+            self._commit()
+
+    def _add_objects(self, objects):
         parse_assert(type(objects) == dict, "structure should be a dict of ident -> objects")
         #must be done with collections of objects so that circular references can occur within the provided objects
         
@@ -439,45 +910,284 @@ class ObjectContext():
         new_idents = []
         for ident, obj_data in objects.items():
             obj = self._make_object(ident, obj_data)
-            parse_assert(not ident in self._objects, f"multiple objects with id {obj.ident} found")
-            self._objects[ident] = obj
-            if type(obj).reftypestr() == "root":
-                parse_assert(self._root is None, "more than one root object present")
-                self._root = ident
-            new_idents.append(ident)
+            self._insert_object(obj.ident, obj)
+            new_idents.append(obj.ident)
 
         #add reverse pointers
         for ident in new_idents:
             self._objects[ident].update_refs()
 
+        self._dirty.update(new_idents)
+        self._unrooted.update(new_idents)
+        if self._metrics is not None:
+            self._metrics.counts["objects_added"] += len(new_idents)
+
+    def _add_streamed_objects(self, objects, pending):
+        #like _add_objects, but pointers to objects which don't exist yet are recorded in pending
+        #and their reverse references are added once the object they point to arrives in a later chunk
+        new_idents = []
+        for ident, obj_data in objects.items():
+            obj = self._make_object(ident, obj_data)
+            self._insert_object(obj.ident, obj)
+            new_idents.append(obj.ident)
+
+        for ident in new_idents:
+            obj = self._objects[ident]
+            obj.refs = obj.count_refs()
+            for r in obj.refs:
+                target = self._objects.get(r, None)
+                if target is None:
+                    pending.setdefault(r, []).append(ident)
+                else:
+                    target.add_reverse_ref(ident)
+            for source in pending.pop(ident, ()):
+                obj.add_reverse_ref(source)
+
+        self._dirty.update(new_idents)
+        self._unrooted.update(new_idents)
+
     def __str__(self):
-        return json.dumps(self.to_json(), indent = 2)
+        return "".join(self.iter_json())
 
     def to_json(self):
         return {ident : obj.to_json() for ident, obj in self._objects.items()}
 
-    def validate(self):
-        #validate contents
-        for ident, obj in self._objects.items():
-            assert type(ident) == str
-            assert isinstance(obj, self.Object)
-            assert obj.ident == ident
-            obj.validate()
-
-        #validate reference reachability (everything should be reachable from the root element)
-        reachable_idents = set([self._root])
-        boundary = set([self._root])
+    def _iter_closure(self, ident):
+        #objects reachable from ident by following refs, in breadth first order
+        parse_assert(ident in self._objects, f"object with id {ident} does not exist")
+        seen = set([ident])
+        boundary = [ident]
         while len(boundary) != 0:
-            new_boundary = set()
+            new_boundary = []
             for b_ident in boundary:
-                for a_ident in self._objects[b_ident].refs:
-                    if not a_ident in reachable_idents:
-                        reachable_idents.add(a_ident)
-                        new_boundary.add(a_ident)
+                obj = self._objects[b_ident]
+                yield obj
+                for a_ident in obj.refs:
+                    if not a_ident in seen:
+                        seen.add(a_ident)
+                        new_boundary.append(a_ident)
             boundary = new_boundary
 
-        for ident in self._objects:
-            parse_assert(ident in reachable_idents, f"object with id {ident} is not reachable from the root object")
+    def iter_json(self, compact = False, ndjson = False, ident = None):
+        #generate the json of to_json() piece by piece without building it all in memory
+        #by default the output matches json.dumps(self.to_json(), indent = 2), and compact = True matches json.dumps(self.to_json())
+        #ndjson = True instead writes the json of one object per line, which ObjectContext.load can read back with ndjson = True
+        #ident restricts the output to the objects reachable from the object with that id
+        assert type(compact) == bool
+        assert type(ndjson) == bool
+        if ident is None:
+            objs = self._objects.values()
+        else:
+            objs = self._iter_closure(ident)
+
+        yield from iter_objects_json((obj.to_json() for obj in objs), compact, ndjson)
+
+    def write_json(self, f, compact = False, ndjson = False, ident = None):
+        for text in self.iter_json(compact, ndjson, ident):
+            f.write(text)
+
+    def validate(self, incremental = False, processes = 1):
+        #processes > 1 splits a full validation across that many forked worker processes, see _validate_parallel
+        assert type(incremental) == bool
+        assert type(processes) == int and processes >= 1
+        if incremental and self._root in self._objects:
+            if self._validate_incremental():
+                return
+            #something is wrong, rerun the full check so that the error reported is exactly the one it would report
+
+        metrics = self._metrics
+        if metrics is not None:
+            start = metrics.timer()
+        if processes > 1 and "fork" in multiprocessing.get_all_start_methods():
+            self._validate_parallel(processes)
+            if metrics is not None:
+                metrics.span("validate.parallel", start)
+        else:
+            #validate contents
+            for ident, obj in self._objects.items():
+                self._validate_one(ident, obj)
+            if metrics is not None:
+                start = metrics.span("validate.contents", start)
+
+            #validate reference reachability (everything should be reachable from the root element)
+            #the breadth first search also gives each object its support, the object it was found from, and its rank, its depth
+            supports = {self._root : None}
+            levels = [[self._root]]
+            while len(levels[-1]) != 0:
+                new_boundary = []
+                for b_ident in levels[-1]:
+                    for a_ident in self._objects[b_ident].refs:
+                        if not a_ident in supports:
+                            supports[a_ident] = b_ident
+                            new_boundary.append(a_ident)
+                levels.append(new_boundary)
+
+            for ident in self._objects:
+                parse_assert(ident in supports, f"object with id {ident} is not reachable from the root object")
+            self._set_supports(levels, supports.get)
+            if metrics is not None:
+                metrics.span("validate.reachability", start)
+
+        self._dirty = set()
+        self._unrooted = set()
+
+    def _set_supports(self, levels, get_support):
+        #after a successful full validation, levels is a list of the lists of idents at each depth from the root
+        for rank, idents in enumerate(levels):
+            for ident in idents:
+                obj = self._objects[ident]
+                obj.support = get_support(ident)
+                obj.rank = rank
+
+    def _validate_one(self, ident, obj):
+        assert type(ident) == str
+        assert isinstance(obj, self.Object)
+        assert obj.ident == ident
+        obj.validate()
+
+    def _validate_parallel(self, processes, chunk_size = 10000, min_level_size = 20000):
+        #the worker processes are forked, so they see the objects without them being sent
+        #objects are validated in chunks of chunk_size, then reachability is found by a breadth first search
+        #which splits each level of at least min_level_size objects across the workers
+        #the same error as the serial path is raised: the first failing object, in order, is validated again here
+        global parallel_obj_ctx
+        idents = list(self._objects)
+        parallel_obj_ctx = (self, idents)
+        try:
+            with multiprocessing.get_context("fork").Pool(processes) as pool:
+                ranges = [(start, min(start + chunk_size, len(idents))) for start in range(0, len(idents), chunk_size)]
+                failed = [idx for idx in pool.map(validate_range, ranges) if not idx is None]
+                if len(failed) != 0:
+                    ident = idents[min(failed)]
+                    self._validate_one(ident, self._objects[ident])
+                    assert False, "object failed validation in a worker process only"
+
+                reachable_idents = set([self._root])
+                boundary = [self._root]
+                levels = []
+                while len(boundary) != 0:
+                    levels.append(boundary)
+                    if len(boundary) < min_level_size:
+                        found = set()
+                        for b_ident in boundary:
+                            found.update(self._objects[b_ident].refs)
+                    else:
+                        step = -(-len(boundary) // processes)
+                        found = set().union(*pool.map(find_refs, [boundary[start:start + step] for start in range(0, len(boundary), step)]))
+                    found.difference_update(reachable_idents)
+                    reachable_idents.update(found)
+                    boundary = list(found)
+        finally:
+            parallel_obj_ctx = None
+
+        if len(reachable_idents) != len(self._objects):
+            for ident in idents:
+                parse_assert(ident in reachable_idents, f"object with id {ident} is not reachable from the root object")
+
+        #the workers only find which objects are at each depth, so each is supported by any owner one level up
+        ranks = {}
+        for rank, level in enumerate(levels):
+            for ident in level:
+                ranks[ident] = rank
+        def get_support(ident):
+            for owner in self._objects[ident].get_reverse_refs():
+                if ranks[owner] == ranks[ident] - 1:
+                    return owner
+            return None
+        self._set_supports(levels, get_support)
+
+    def _validate_incremental(self):
+        #recheck only the objects touched since the last validation
+        #assumes the context was valid at the last validation, so anything untouched is still valid
+        #returns False instead of raising so that the caller can fall back to the full check
+        metrics = self._metrics
+        if metrics is not None:
+            start = metrics.timer()
+            metrics.size("validate.incremental.objects", len(self._dirty))
+        try:
+            for ident in self._dirty:
+                obj = self._objects.get(ident, None)
+                if not obj is None:
+                    assert obj.ident == ident
+                    obj.validate()
+        except Exception:
+            return False
+        if metrics is not None:
+            start = metrics.span("validate.incremental.contents", start)
+        unreachable = self._find_unreachable()
+        if metrics is not None:
+            metrics.span("validate.incremental.unreachable", start)
+        if len(unreachable) != 0:
+            return False
+        self._dirty = set()
+        return True
+
+    def _find_unreachable(self):
+        #settle the reachability of the objects in _unrooted, returning the idents of those no longer reachable from the root
+        #afterwards _unrooted holds only the unreachable objects, and every other object has a support with a lower rank
+        #first, in order of rank, each object which lost its support, and then each object it supported, switches to another owner
+        #of lower rank if it has one, otherwise it is affected. The affected objects are then ranked again by a search outwards
+        #from their unaffected owners, and any the search doesn't reach are unreachable, including whole orphaned cycles
+        #so the time taken depends on the objects which lost their support rather than on the size of the document
+        affected = set()
+        queued = set()
+        heap = []
+        for ident in self._unrooted:
+            obj = self._objects.get(ident, None)
+            if obj is None or ident == self._root:
+                continue
+            if obj.rank is None:
+                affected.add(ident) #new, or unreachable at the last check, so supports nothing
+            else:
+                queued.add(ident)
+                heap.append((obj.rank, ident))
+        heapq.heapify(heap)
+        while len(heap) != 0:
+            rank, ident = heapq.heappop(heap)
+            obj = self._objects[ident]
+            #an unaffected owner of lower rank has been settled already since objects are taken in order of rank
+            for owner in obj.get_reverse_refs():
+                owner_rank = self._objects[owner].rank
+                if not owner_rank is None and owner_rank < rank and not owner in affected:
+                    self._set_support(obj, owner, rank)
+                    break
+            else:
+                affected.add(ident)
+                for target in obj.refs:
+                    target_obj = self._objects.get(target, None)
+                    if not target_obj is None and target_obj.support == ident and not target in queued:
+                        queued.add(target)
+                        heapq.heappush(heap, (target_obj.rank, target))
+
+        heap = []
+        for ident in affected:
+            for owner in self._objects[ident].get_reverse_refs():
+                owner_rank = self._objects[owner].rank
+                if not owner_rank is None and not owner in affected:
+                    heap.append((owner_rank + 1, ident, owner))
+        heapq.heapify(heap)
+        unreachable = affected
+        while len(heap) != 0:
+            rank, ident, owner = heapq.heappop(heap)
+            if not ident in unreachable:
+                continue
+            unreachable.remove(ident)
+            obj = self._objects[ident]
+            self._set_support(obj, owner, rank)
+            for target in obj.refs:
+                if target in unreachable:
+                    heapq.heappush(heap, (rank + 1, target, ident))
+        for ident in unreachable:
+            self._set_support(self._objects[ident], None, None)
+        self._unrooted = set(unreachable)
+        return unreachable
+
+    def _set_support(self, obj, support, rank):
+        if self._undo_log is not None:
+            old_support, old_rank = obj.support, obj.rank
+            self._undo_log.append(lambda: self._set_support(obj, old_support, old_rank))
+        obj.support = support
+        obj.rank = rank
 
     def get_root(self):
         return self._root
@@ -493,59 +1203,1858 @@ class ObjectContext():
         return self._objects[ident].typename
 
     def get_types(self, ident):
-        return set(self._objects[ident].get_type().super_names)
+        return self._objects[ident].get_type().super_names
 
     def get_unique_owner(self, ident):
         return self._objects[ident].get_unique_owner()
 
+    def get_objects_of_type(self, typename):
+        #idents of all objects of type typename or any of its subtypes
+        parse_assert(typename in self._type_ctx._types, f"unknown type \"{typename}\"")
+        idents = set()
+        for sub_name in self._type_ctx.get_sub_types(typename):
+            idents.update(self._by_type[sub_name])
+        return idents
+
+    def add_index(self, typename, field, ordered = False):
+        #index the values of a basic field over all objects of type typename or any of its subtypes
+        #ordered = True additionally allows range queries with find_range
+        parse_assert(typename in self._type_ctx._types, f"unknown type \"{typename}\"")
+        t = self._type_ctx._types[typename]
+        parse_assert(field in t.content, f"type \"{typename}\" has no field \"{field}\"")
+        parse_assert(t.content[field].kind == "basic", f"only basic fields can be indexed, but \"{field}\" of type \"{typename}\" is not")
+        parse_assert(not (typename, field) in self._field_indexes, f"field \"{field}\" of type \"{typename}\" is already indexed")
+        index = FieldIndex(field, BUILTIN_TYPES[t.content[field].builtin_type], ordered)
+        for ident in self.get_objects_of_type(typename):
+            content = self._objects[ident].content
+            if field in content:
+                index.add(content[field], ident)
+        self._field_indexes[(typename, field)] = index
+        for sub_name in self._type_ctx.get_sub_types(typename):
+            self._indexes_by_type[sub_name].append(index)
+
+    def remove_index(self, typename, field):
+        parse_assert((typename, field) in self._field_indexes, f"field \"{field}\" of type \"{typename}\" is not indexed")
+        index = self._field_indexes.pop((typename, field))
+        for sub_name in self._type_ctx.get_sub_types(typename):
+            self._indexes_by_type[sub_name].remove(index)
+
+    def find(self, typename, field, value):
+        #idents of objects of type typename whose field equals value, using the index added by add_index
+        parse_assert((typename, field) in self._field_indexes, f"field \"{field}\" of type \"{typename}\" is not indexed")
+        return set(self._field_indexes[(typename, field)].find(value))
+
+    def find_range(self, typename, field, low = None, high = None):
+        #idents of objects of type typename with low <= field <= high ordered by the value of field, using an ordered index
+        #a bound of None is unbounded
+        parse_assert((typename, field) in self._field_indexes, f"field \"{field}\" of type \"{typename}\" is not indexed")
+        index = self._field_indexes[(typename, field)]
+        parse_assert(index.ordered, f"the index on field \"{field}\" of type \"{typename}\" is not ordered")
+        return index.find_range(low, high)
+
     def get_shared_owners(self, ident):
         return set(self._objects[ident].get_shared_owners())
 
-
-    def apply_changes(self, changes, do_validate = True):
+    def closure(self, ident, direction = "forward", types = None, through = None, max_depth = None):
+        #the idents of the objects reachable from ident, not including ident itself
+        #direction is "forward" to follow pointers, "reverse" to follow reverse references back to owners, or "both"
+        #types restricts the idents returned to objects of those types or their sub types,
+        #through restricts the objects passed through on the way in the same way, and objects of other types are not followed
+        #max_depth limits the number of links followed, so max_depth = 1 gives the immediate neighbours
+        return self.closures([ident], direction, types, through, max_depth)[ident]
+
+    def closures(self, idents, direction = "forward", types = None, through = None, max_depth = None):
+        #closure for each of idents, as a dict ident -> frozenset of idents
+        #results are cached until an object examined while finding them is added, removed, or gains or loses a link
+        assert direction in {"forward", "reverse", "both"}
+        assert max_depth is None or (type(max_depth) == int and max_depth >= 0)
+        types = self._closure_types(types)
+        through = self._closure_types(through)
+        results = {}
+        for ident in idents:
+            parse_assert(ident in self._objects, f"object with id {ident} does not exist")
+            key = (ident, direction, types, through, max_depth)
+            entry = self._closures.get(key, None)
+            if self._metrics is not None:
+                self._metrics.counts["closure_hits" if not entry is None else "closure_misses"] += 1
+            if entry is None:
+                entry = self._find_closure(ident, direction, types, through, max_depth)
+                if len(entry[1]) <= self._closure_entry_size:
+                    self._closures[key] = entry
+                    self._closure_cache_used += len(entry[1])
+                    for dep in entry[1]:
+                        self._closure_deps.setdefault(dep, set()).add(key)
+                    while self._closure_cache_used > self._closure_cache_size:
+                        self._drop_closure(next(iter(self._closures)))
+            else:
+                self._closures.move_to_end(key)
+            results[ident] = entry[0]
+        return results
+
+    def set_closure_cache(self, size, max_entry_size = None):
+        #limit the closure cache to size idents examined in total over all the results it holds, so 0 turns it off
+        #results which examined more than max_entry_size objects, by default a tenth of size, are never cached,
+        #since they are costly to hold and are dropped by a change to any of the objects they examined
+        assert type(size) == int and size >= 0
+        if max_entry_size is None:
+            max_entry_size = size // 10
+        assert type(max_entry_size) == int and max_entry_size >= 0
+        self._closure_cache_size = size
+        self._closure_entry_size = min(max_entry_size, size)
+        for key in [key for key, (found, seen) in self._closures.items() if len(seen) > self._closure_entry_size]:
+            self._drop_closure(key)
+        while self._closure_cache_used > size:
+            self._drop_closure(next(iter(self._closures)))
+
+    def _closure_types(self, typenames):
+        #the exact typenames matching typenames or their sub types, as a frozenset, or None for no restriction
+        if typenames is None:
+            return None
+        exact = set()
+        for typename in typenames:
+            parse_assert(typename in self._type_ctx._types, f"unknown type \"{typename}\"")
+            exact.update(self._type_ctx.get_sub_types(typename))
+        return frozenset(exact)
+
+    def _find_closure(self, ident, direction, types, through, max_depth):
+        #breadth first search returning (frozenset of idents found, idents examined)
+        #links are read from refs and reverse refs directly rather than through get_content and get_shared_owners
+        found = set()
+        seen = set([ident])
+        boundary = [ident]
+        depth = 0
+        while len(boundary) != 0 and (max_depth is None or depth < max_depth):
+            depth += 1
+            new_boundary = []
+            for b_ident in boundary:
+                obj = self._objects[b_ident]
+                for links in ([obj.refs] if direction == "forward" else [obj.get_reverse_refs()] if direction == "reverse" else [obj.refs, obj.get_reverse_refs()]):
+                    for a_ident in links:
+                        if a_ident in seen:
+                            continue
+                        seen.add(a_ident)
+                        a_obj = self._objects.get(a_ident, None)
+                        if a_obj is None:
+                            continue #dangling while the context is invalid
+                        if types is None or a_obj.typename in types:
+                            found.add(a_ident)
+                        if through is None or a_obj.typename in through:
+                            new_boundary.append(a_ident)
+            boundary = new_boundary
+        return frozenset(found), seen
+
+    def _drop_closure(self, key):
+        found, seen = self._closures.pop(key)
+        self._closure_cache_used -= len(seen)
+        for dep in seen:
+            keys = self._closure_deps[dep]
+            keys.discard(key)
+            if len(keys) == 0:
+                del self._closure_deps[dep]
+
+    def _invalidate_closures(self, idents):
+        for ident in idents:
+            for key in list(self._closure_deps.get(ident, ())):
+                self._drop_closure(key)
+
+
+    def collect_garbage(self):
+        #remove every object which is no longer reachable from the root, returning their idents
+        #committed as a change block of its own, so ReadViews and subscribers see the objects removed
+        try:
+            return self._collect_garbage()
+        finally:
+            self._commit()
+
+    def _collect_garbage(self):
+        #only objects which lost their supporting owner since the last check are considered, see _find_unreachable,
+        #which also finds whole orphaned cycles such as foo <-> bar
+        metrics = self._metrics
+        if metrics is not None:
+            start = metrics.timer()
+        removed = set()
+        while len(self._unrooted) != 0:
+            garbage = self._find_unreachable()
+            for ident in garbage:
+                for target in self._objects[ident].refs:
+                    if not target in garbage and target in self._objects: #may already be removed by a remove opp in the block
+                        target_obj = self._objects[target]
+                        target_obj.remove_reverse_ref(ident)
+                        self._dirty.add(target)
+                        if target_obj.support == ident:
+                            self._unrooted.add(target)
+            for ident in garbage:
+                self._delete_object(ident)
+            removed.update(garbage)
+        if metrics is not None:
+            metrics.span("collect_garbage", start)
+        return removed
+
+    def _delete_object(self, ident):
+        if len(self._subscriptions) != 0:
+            self._note_object(ident)
+        obj = self._change(ident, None, self._objects.pop, ident)
+        if len(self._closure_deps) != 0:
+            self._invalidate_closures((ident,))
+        self._unindex_object(obj)
+        self._dirty.discard(ident)
+        self._unrooted.discard(ident)
+        if self._undo_log is not None:
+            self._undo_log.append(lambda: self._restore_object(obj))
+        if self._metrics is not None:
+            self._metrics.counts["objects_removed"] += 1
+            self._metrics.touched.add(ident)
+
+    def _restore_object(self, obj):
+        self._objects[obj.ident] = obj
+        self._index_object(obj)
+        self._dirty.add(obj.ident)
+        self._unrooted.add(obj.ident)
+
+    def enable_metrics(self, metrics = None):
+        #start recording into metrics, a new Metrics by default, which is returned and may be shared between contexts
+        #the checks made while metrics are disabled are one attribute test per change and per validation
+        if metrics is None:
+            metrics = Metrics()
+        assert type(metrics) == Metrics
+        self._metrics = metrics
+        return metrics
+
+    def disable_metrics(self):
+        self._metrics = None
+
+    def enable_snapshots(self):
+        #allow ReadViews to be created
+        #from now on, an undo record of each change made to an object is kept for as long as an open ReadView may need it
+        if self._history is None:
+            self._history = {}
+
+    def read_view(self):
+        parse_assert(not self._history is None, "enable_snapshots must be called before creating a ReadView")
+        return ReadView(self)
+
+    def _pin(self):
+        with self._pin_lock:
+            self._pinned[self._version] = self._pinned.get(self._version, 0) + 1
+            return self._version
+
+    def _unpin(self, version):
+        with self._pin_lock:
+            self._pinned[version] -= 1
+            if self._pinned[version] == 0:
+                del self._pinned[version]
+
+    def _read(self, ident):
+        #the state of ident as (typename, ref, content, reverse refs) like ReadView._read, or None if it doesn't exist
+        #unlike ReadView the content is not copied, and changes with the object
+        obj = self._objects.get(ident, None)
+        if obj is None:
+            return None
+        return (obj.typename, type(obj).reftypestr(), obj.content, tuple(obj.get_reverse_refs()))
+
+    def _changed_between(self, old_version, new_version):
+        #idents which may have changed between two versions, the older of which must be pinned by a ReadView
+        changed = set()
+        for version, idents in list(self._history_by_version.items()):
+            if old_version < version <= new_version:
+                changed.update(idents)
+        return changed
+
+    def _note_object(self, ident):
+        #before ident is added or removed, for the ChangeEvent of the change block
+        if not ident in self._event_objects:
+            obj = self._objects.get(ident, None)
+            self._event_objects[ident] = None if obj is None else (obj.typename, type(obj).reftypestr())
+
+    def _note_owner(self, ident, owner, gained):
+        #after ident gains or loses the owner, for the ChangeEvent of the change block
+        gained_owners, lost_owners = self._event_owners.setdefault(ident, (set(), set()))
+        if not gained:
+            gained_owners, lost_owners = lost_owners, gained_owners
+        if owner in lost_owners:
+            lost_owners.remove(owner)
+        else:
+            gained_owners.add(owner)
+
+    def _clear_event(self):
+        self._event_objects = {}
+        self._event_fields = {}
+        self._event_owners = {}
+
+    def _change(self, ident, record, change, *args):
+        #make a change to the object ident, or to whether it exists, by calling change(*args), returning its result
+        #record is the undo record of the change, see ObjectHistory, which is published before the change is made
+        if self._history is None:
+            return change(*args)
+        history = self._history.get(ident, None)
+        if history is None:
+            history = self._history[ident] = ObjectHistory()
+        version = self._version + 1
+        entries = history.entries
+        if len(entries) == 0 or entries[-1][0] != version:
+            entries.append((version, self._objects.get(ident, None), []))
+            self._history_by_version.setdefault(version, []).append(ident)
+        history.started += 1
+        try:
+            if not record is None:
+                entries[-1][2].append(record)
+            return change(*args)
+        finally:
+            history.finished += 1
+
+    def _commit(self):
+        metrics = self._metrics
+        if metrics is not None:
+            start = metrics.timer()
+        with self._pin_lock:
+            self._version += 1
+            oldest = min(self._pinned) if len(self._pinned) != 0 else self._version
+        #drop the history no open ReadView can need any more
+        for version in sorted(v for v in self._history_by_version if v <= oldest):
+            for ident in self._history_by_version.pop(version):
+                history = self._history[ident]
+                del history.entries[0]
+                if len(history.entries) == 0:
+                    del self._history[ident]
+        if len(self._subscriptions) != 0:
+            event = self._change_event()
+            if event:
+                for subscription in list(self._subscriptions):
+                    subscription._notify(event)
+        self._clear_event()
+        if metrics is not None:
+            metrics.end_block()
+            metrics.span("commit", start)
+
+    def _change_event(self):
+        #the ChangeEvent of the change block, from what was noted while it was applied
+        event = ChangeEvent(self._version)
+        fields = dict(self._event_fields)
+        for ident, before in self._event_objects.items():
+            obj = self._objects.get(ident, None)
+            after = None if obj is None else (obj.typename, type(obj).reftypestr())
+            if before != after:
+                if not before is None:
+                    event.removed[ident] = before[0]
+                if not after is None:
+                    event.added[ident] = after[0]
+            elif not after is None:
+                #replaced by another object of the same type and ref, so any of its fields may have changed
+                fields[ident] = obj.get_type().content
+        for ident, changed in fields.items():
+            if ident in self._objects and not ident in event.added and len(changed) != 0:
+                event.modified[ident] = frozenset(changed)
+        for ident, (gained, lost) in self._event_owners.items():
+            if ident in self._objects and not ident in event.added and (len(gained) != 0 or len(lost) != 0):
+                event.owners[ident] = (frozenset(gained), frozenset(lost))
+        return event
+
+    def subscribe(self, callback, idents = None, types = None, fields = None):
+        #callback(event) is called with a ChangeEvent after each committed change block which changes anything matching the filters
+        #idents, types and fields are collections which, when given, restrict the events to those objects,
+        #objects of those types or their sub types, and those fields
+        #returns a Subscription, which should be closed to stop receiving events
+        return Subscription(self, callback, idents, types, fields)
+
+    def _set_field(self, obj, key, value):
+        #value may be UNSET to remove the field
+        old_value = obj.content.get(key, UNSET)
+        if value is old_value:
+            return #a list changed in place, which undoes and records its own changes
+        for index in self._indexes_by_type[obj.typename]:
+            if index.field == key:
+                index.remove(old_value, obj.ident)
+                index.add(value, obj.ident)
+        record = (obj.content, "unset", key) if old_value is UNSET else (obj.content, "set", key, old_value)
+        if value is UNSET:
+            self._change(obj.ident, record, obj.content.pop, key)
+        else:
+            self._change(obj.ident, record, obj.content.__setitem__, key, value)
+        if self._undo_log is not None:
+            self._undo_log.append(lambda: self._set_field(obj, key, old_value))
+
+    def _apply_measured_change(self, atomic_change):
+        #_apply_atomic_change timed under "opp.<opp>", or "opp.modify.<action opp>" for modifies
+        metrics = self._metrics
+        name = "opp.invalid"
+        if type(atomic_change) == dict and atomic_change.get("opp", None) in {"add", "remove", "modify"}:
+            name = "opp." + atomic_change["opp"]
+            action = atomic_change.get("action", None)
+            if name == "opp.modify" and type(action) == dict and action.get("opp", None) in {"replace", "append", "remove", "modify", "unset"}:
+                name += "." + action["opp"]
+            if type(atomic_change.get("ident", None)) == str:
+                metrics.touched.add(atomic_change["ident"])
+        start = metrics.timer()
+        try:
+            self._apply_atomic_change(atomic_change)
+        finally:
+            metrics.span(name, start)
+
+    def _apply_atomic_change(self, atomic_change):
+        parse_assert("opp" in atomic_change, "a change object should have an \"opp\" field")
+        opp = atomic_change["opp"]
+        if opp == "add":
+            for key in atomic_change:
+                parse_assert(key in {"opp", "ident", "object"}, f"invalid {opp} opp field \"{key}\"")
+            self._add_objects({atomic_change["ident"] : atomic_change["object"]})
+        elif opp == "remove":
+            for key in atomic_change:
+                parse_assert(key in {"opp", "ident"}, f"invalid {opp} opp field \"{key}\"")
+            ident = atomic_change["ident"]
+            parse_assert(type(ident) == str, "object id should be a str")
+            parse_assert(ident in self._objects, "object with id {ident} does not exist")
+            obj = self._objects[ident]
+            #anything still pointing at the removed object is now dangling
+            self._dirty.update(obj.get_reverse_refs())
+            for target in obj.refs:
+                if target in self._objects: #may already be removed when removing a cycle
+                    target_obj = self._objects[target]
+                    target_obj.remove_reverse_ref(ident)
+                    self._dirty.add(target)
+                    if target_obj.support == ident:
+                        self._unrooted.add(target)
+            self._delete_object(ident)
+        elif opp == "modify":
+            for key in atomic_change:
+                parse_assert(key in {"opp", "ident", "field", "action"}, f"invalid {opp} opp field \"{key}\"")
+            ident = atomic_change["ident"]
+            parse_assert(type(ident) == str, "object ident should be a str")
+            parse_assert(ident in self._objects, "object with id {ident} does not exist")
+            obj = self._objects[ident]
+            key = atomic_change["field"]
+            parse_assert(key in obj.get_type().content.keys(), f"object of type \"{obj.typename}\" has no field \"{key}\"")
+            #TODO: move change content into object class
+            t_ptr = obj.get_type().content[key]
+            action = atomic_change["action"]
+            content = obj.content.get(key, UNSET)
+            delta = ([], [])
+            if type(action) == dict and action.get("opp", None) == "unset":
+                #removes the field, which must be given a value again before validation unless it is optional
+                for action_key in action:
+                    parse_assert(action_key in {"opp"}, f"invalid unset action field \"{action_key}\"")
+                if not content is UNSET:
+                    delta[1].extend(t_ptr.get_refs(self, content))
+                self._set_field(obj, key, UNSET)
+            else:
+                parse_assert(not content is UNSET or (type(action) == dict and action.get("opp", None) == "replace"), f"field \"{key}\" of object with id {ident} is not set, so can only be replaced")
+                metrics = self._metrics
+                if metrics is None:
+                    self._set_field(obj, key, t_ptr.change_content(self, ident, content, action, delta))
+                else:
+                    start = metrics.timer()
+                    value = t_ptr.change_content(self, ident, content, action, delta)
+                    metrics.span("change_content." + t_ptr.kind, start)
+                    self._set_field(obj, key, value)
+            if len(self._subscriptions) != 0:
+                #list actions change the list in place, other actions replace the value, which may be replaced with an equal one
+                value = obj.content.get(key, UNSET)
+                if (value is content and type(value) == list) or value != content:
+                    self._event_fields.setdefault(ident, set()).add(key)
+            self._dirty.add(ident)
+            obj.apply_ref_delta(*delta)
+        else:
+            parse_assert(False, f"invalid \"opp\" field")
+
+    def apply_changes(self, changes, do_validate = True, incremental = False, collect = False, atomic = False):
+        #incremental = True only revalidates the objects touched since the last validation
+        #collect = True removes objects left unreachable by the change block
+        #atomic = True undoes the whole block if any part of it, or the validation at the end, fails
+        #returns the idents removed by garbage collection
         assert type(do_validate) == bool
+        assert type(collect) == bool
+        assert type(atomic) == bool
         parse_assert(type(changes) == list, "change block should be a list of atomic change objects")
-        for atomic_change in changes:
-            parse_assert("opp" in atomic_change, "a change object should have an \"opp\" field")
-            opp = atomic_change["opp"]
-            if opp == "add":
-                for key in atomic_change:
-                    parse_assert(key in {"opp", "ident", "object"}, f"invalid {opp} opp field \"{key}\"")
-                self.add_objects({atomic_change["ident"] : atomic_change["object"]})
-            elif opp == "remove":
-                for key in atomic_change:
-                    parse_assert(key in {"opp", "ident"}, f"invalid {opp} opp field \"{key}\"")
-                ident = atomic_change["ident"]
-                parse_assert(type(ident) == str, "object id should be a str")
-                parse_assert(ident in self._objects, "object with id {ident} does not exist")
-                obj = self._objects[ident]
-                for target in self._objects[ident].get_refs():
-                    self._objects[target].remove_reverse_ref(ident)
-                del self._objects[ident]
-            elif opp == "modify":
-                for key in atomic_change:
-                    parse_assert(key in {"opp", "ident", "field", "action"}, f"invalid {opp} opp field \"{key}\"")
-                ident = atomic_change["ident"]
-                parse_assert(type(ident) == str, "object ident should be a str")
-                parse_assert(ident in self._objects, "object with id {ident} does not exist")
-                obj = self._objects[ident]
-                key = atomic_change["field"]
-                parse_assert(key in obj.get_type().content.keys(), f"object of type \"{obj.typename}\" has no field \"{key}\"")
-                #TODO: move change content into object class
-                obj.content[key] = obj.get_type().content[key].change_content(self, ident, obj.content[key], atomic_change["action"])
-                obj.update_refs()
+        metrics = self._metrics
+        if metrics is None:
+            return self._apply_changes(changes, do_validate, incremental, collect, atomic)
+
+        start = metrics.timer()
+        allocated = sys.getallocatedblocks()
+        try:
+            removed = self._apply_changes(changes, do_validate, incremental, collect, atomic)
+        except BaseException:
+            metrics.counts["blocks_failed"] += 1
+            raise
+        finally:
+            metrics.counts["blocks"] += 1
+            metrics.size("block.changes", len(changes))
+            metrics.size("block.allocated_blocks", sys.getallocatedblocks() - allocated)
+            metrics.span("block", start)
+        return removed
+
+    def _apply_changes(self, changes, do_validate, incremental, collect, atomic):
+        apply_atomic_change = self._apply_atomic_change if self._metrics is None else self._apply_measured_change
+        removed = set()
+        if not atomic:
+            #whatever was applied is committed, even if the block failed part way
+            try:
+                for atomic_change in changes:
+                    apply_atomic_change(atomic_change)
+                if collect:
+                    removed = self._collect_garbage()
+            finally:
+                self._commit()
+            if do_validate:
+                self.validate(incremental)
+            return removed
+
+        assert self._undo_log is None
+        undo_log = []
+        dirty = set(self._dirty)
+        unrooted = set(self._unrooted)
+        self._undo_log = undo_log
+        try:
+            for atomic_change in changes:
+                apply_atomic_change(atomic_change)
+            if collect:
+                removed = self._collect_garbage()
+            if do_validate:
+                self.validate(incremental)
+        except BaseException:
+            self._undo_log = None
+            for undo in reversed(undo_log):
+                undo()
+            self._dirty.update(dirty)
+            self._unrooted.update(unrooted)
+            #the block made no changes to tell subscriptions about
+            self._clear_event()
+            if self._metrics is not None:
+                self._metrics.end_block()
+            raise
+        finally:
+            self._undo_log = None
+        self._commit()
+        return removed
+
+
+
+parallel_obj_ctx = None #(ObjectContext, idents) being validated by ObjectContext._validate_parallel, inherited by its workers
+
+
+def validate_range(bounds):
+    #run in a worker process, returns the index of the first object in the range which fails validation, or None
+    obj_ctx, idents = parallel_obj_ctx
+    for idx in range(*bounds):
+        try:
+            obj_ctx._validate_one(idents[idx], obj_ctx._objects[idents[idx]])
+        except Exception:
+            return idx
+    return None
+
+
+def find_refs(idents):
+    #run in a worker process, the idents pointed at by the given objects
+    obj_ctx = parallel_obj_ctx[0]
+    found = set()
+    for ident in idents:
+        found.update(obj_ctx._objects[ident].refs)
+    return found
+
+
+class Histogram():
+    #counts of the values recorded at or below each of a sorted tuple of bounds, with the total and largest value
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.buckets = [0] * (len(bounds) + 1) #the last bucket counts the values above every bound
+        self.count = 0
+        self.total = 0
+        self.max = None
+
+    def add(self, value):
+        self.buckets[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def to_json(self):
+        #only the buckets with values in are listed, as [bound, count] with a bound of None for the last
+        buckets = [[bound, n] for bound, n in zip(self.bounds + (None,), self.buckets) if n != 0]
+        return {"count" : self.count, "total" : self.total, "max" : self.max, "buckets" : buckets}
+
+
+class Metrics():
+    #what ObjectContexts with metrics enabled have been doing, see ObjectContext.enable_metrics
+    #timer returns the time in seconds, and tracer, if given, is called as tracer(name, start, end) as each span of time is recorded
+    #spans: "block" for a whole apply_changes, "opp.<opp>" and "opp.modify.<action opp>" for each change,
+    #"change_content.<kind>" for the TypePtr change_content of a modify, "update_refs" for each update of refs and reverse refs,
+    #"collect_garbage", "commit", "validate.contents", "validate.reachability" and "validate.parallel" for full validations,
+    #"validate.incremental.contents" and "validate.incremental.unreachable" for incremental ones,
+    #and "type_context.build" or "type_context.cache_load" for TypeContext.load
+    #sizes: "block.changes", "block.allocated_blocks" for the net change in sys.getallocatedblocks() over the block,
+    #"block.objects_touched" and "block.refs_touched" for every block committed or rolled back, including those of add_objects
+    #and collect_garbage, and "validate.incremental.objects"
+    #counts: "blocks", "blocks_failed", "objects_added", "objects_removed", and "closure_hits" and "closure_misses" for the closure cache
+    LATENCY_BOUNDS = tuple(1e-6 * 2 ** i for i in range(25)) #1us up to 16s
+    SIZE_BOUNDS = tuple(2 ** i for i in range(25))
+
+    def __init__(self, timer = time.perf_counter, tracer = None):
+        self.timer = timer
+        self.tracer = tracer
+        self.reset()
+
+    def reset(self):
+        self.counts = collections.Counter()
+        self.latencies = {} #span name -> Histogram of seconds
+        self.sizes = {} #name -> Histogram
+        #running totals for the block being applied, see end_block
+        self.refs_touched = 0
+        self.touched = set()
+
+    def end_block(self):
+        #record what the change block just committed or rolled back touched, and start counting for the next one
+        self.size("block.objects_touched", len(self.touched))
+        self.size("block.refs_touched", self.refs_touched)
+        self.refs_touched = 0
+        self.touched = set()
+
+    def span(self, name, start):
+        #record the span of time from start, an earlier result of timer, until now and return the end time
+        end = self.timer()
+        histogram = self.latencies.get(name, None)
+        if histogram is None:
+            histogram = self.latencies[name] = Histogram(self.LATENCY_BOUNDS)
+        histogram.add(end - start)
+        if self.tracer is not None:
+            self.tracer(name, start, end)
+        return end
+
+    def size(self, name, value):
+        histogram = self.sizes.get(name, None)
+        if histogram is None:
+            histogram = self.sizes[name] = Histogram(self.SIZE_BOUNDS)
+        histogram.add(value)
+
+    def to_json(self):
+        return {
+            "counts" : dict(self.counts),
+            "latencies" : {name : histogram.to_json() for name, histogram in sorted(self.latencies.items())},
+            "sizes" : {name : histogram.to_json() for name, histogram in sorted(self.sizes.items())},
+        }
+
+
+class ChangeEvent():
+    #the changes made by one committed change block
+    #added and removed are ident -> typename, an object whose type or ref changed appears in both
+    #modified is ident -> frozenset of the fields of an existing object which the block modified, including fields set or unset
+    #owners is ident -> (frozenset of owners gained, frozenset of owners lost)
+    def __init__(self, version):
+        self.version = version
+        self.added = {}
+        self.removed = {}
+        self.modified = {}
+        self.owners = {}
+
+    def __bool__(self):
+        return len(self.added) != 0 or len(self.removed) != 0 or len(self.modified) != 0 or len(self.owners) != 0
+
+    def __repr__(self):
+        return f"ChangeEvent(version={self.version}, added={self.added}, removed={self.removed}, modified={self.modified}, owners={self.owners})"
+
+
+class Subscription():
+    #a callback registered with ObjectContext.subscribe
+    def __init__(self, obj_ctx, callback, idents, types, fields):
+        self._obj_ctx = obj_ctx
+        self._callback = callback
+        self._idents = None if idents is None else frozenset(idents)
+        self._fields = None if fields is None else frozenset(fields)
+        self._types = None
+        if not types is None:
+            type_ctx = obj_ctx._type_ctx
+            for typename in types:
+                parse_assert(typename in type_ctx._types, f"unknown type \"{typename}\"")
+            self._types = frozenset(sub_name for typename in types for sub_name in type_ctx.get_sub_types(typename))
+        obj_ctx._subscriptions.append(self)
+
+    def close(self):
+        if self in self._obj_ctx._subscriptions:
+            self._obj_ctx._subscriptions.remove(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _matches(self, ident, typename):
+        if not self._idents is None and not ident in self._idents:
+            return False
+        if not self._types is None and not typename in self._types:
+            return False
+        if not self._fields is None and self._fields.isdisjoint(self._obj_ctx._type_ctx._types[typename].content):
+            return False
+        return True
+
+    def _notify(self, event):
+        if self._idents is None and self._types is None and self._fields is None:
+            self._callback(event)
+            return
+        filtered = ChangeEvent(event.version)
+        filtered.added = {ident : typename for ident, typename in event.added.items() if self._matches(ident, typename)}
+        filtered.removed = {ident : typename for ident, typename in event.removed.items() if self._matches(ident, typename)}
+        for ident, fields in event.modified.items():
+            if self._matches(ident, self._obj_ctx._objects[ident].typename):
+                fields = fields if self._fields is None else fields & self._fields
+                if len(fields) != 0:
+                    filtered.modified[ident] = fields
+        if self._fields is None:
+            filtered.owners = {ident : owners for ident, owners in event.owners.items() if self._matches(ident, self._obj_ctx._objects[ident].typename)}
+        if filtered:
+            self._callback(filtered)
+
+
+class ObjectHistory():
+    #the changes made to one object by the change blocks an open ReadView may need to undo, kept by ObjectContext._change
+    #entries are (version, obj, records) for each change block which changed the object, oldest first, where version is the version
+    #the block makes, obj is the Object at the start of the block or None if there wasn't one, and records are the undo records
+    #of the changes made in the block, in order
+    #an undo record is (container, opp, args...), a change to the copy of container, the content dict, a list within it or the Object
+    #for its owners, which undoes a change made to container: "pop", "append" item, "insert" idx item, "delete" idx, "set" key item,
+    #"unset" key, "add_owner" ident and "remove_owner" ident
+    #started and finished count the changes begun and made, so that a reader can tell when it raced with the writer
+    __slots__ = ("entries", "started", "finished")
+
+    def __init__(self):
+        self.entries = []
+        self.started = 0
+        self.finished = 0
+
+
+def copy_tracked(value, copies):
+    #copy of content value, with the copy of each list stored in copies under the id of the list
+    #lists already copied are reused, so that a list put back by an undo record keeps the changes undone on its copy
+    if type(value) != list:
+        return value
+    copy = copies.get(id(value), None)
+    if copy is None:
+        copy = [copy_tracked(item, copies) for item in value]
+        copies[id(value)] = copy
+    return copy
+
+
+def undo_records(obj, records):
+    #the state of obj as (typename, ref, content, reverse refs) before the changes whose undo records are given, see ObjectHistory
+    #records for containers which aren't part of obj, such as those of another object with the same ident, are skipped
+    copies = {}
+    content = {key : copy_tracked(value, copies) for key, value in obj.content.items()}
+    copies[id(obj.content)] = content
+    owners = set(obj.get_reverse_refs())
+    copies[id(obj)] = owners
+    for record in reversed(records):
+        target = copies.get(id(record[0]), None)
+        if target is None:
+            continue
+        opp = record[1]
+        if opp == "pop":
+            target.pop()
+        elif opp == "append":
+            target.append(copy_tracked(record[2], copies))
+        elif opp == "insert":
+            target.insert(record[2], copy_tracked(record[3], copies))
+        elif opp == "delete" or opp == "unset":
+            del target[record[2]]
+        elif opp == "set":
+            target[record[2]] = copy_tracked(record[3], copies)
+        elif opp == "add_owner":
+            target.add(record[2])
+        else:
+            target.discard(record[2])
+    return (obj.typename, type(obj).reftypestr(), content, tuple(owners))
+
+
+class ReadView():
+    #a read only view of an ObjectContext as of the change block last committed when the view was created
+    #readers in other threads neither block nor are blocked by a writer applying change blocks at the same time
+    #the view should be closed once finished with so that the history it needs can be dropped
+    def __init__(self, obj_ctx):
+        self._obj_ctx = obj_ctx
+        self._version = obj_ctx._pin()
+        self._root = obj_ctx._root
+        self._closed = False
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._obj_ctx._unpin(self._version)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _read(self, ident):
+        #copied state of ident as of our version, or None if it didn't exist
+        #the object as it is now has the changes made since our version undone, see ObjectHistory
+        assert not self._closed
+        obj_ctx = self._obj_ctx
+        while True:
+            history = obj_ctx._history.get(ident, None)
+            obj = obj_ctx._objects.get(ident, None)
+            records = ()
+            if not history is None:
+                started = history.started
+                if started != history.finished:
+                    continue #the writer is changing ident
+                entries = tuple(history.entries)
+                for i, (version, block_obj, block_records) in enumerate(entries):
+                    if version > self._version:
+                        #the first change block after our version says what ident was at its start
+                        obj = block_obj
+                        records = [record for entry in entries[i:] for record in entry[2]]
+                        break
+            def unchanged():
+                #if the writer changed ident while we were copying it then it published a history entry or record first
+                return obj_ctx._history.get(ident, None) is history and (history is None or history.started == history.finished == started)
+            try:
+                state = None if obj is None else undo_records(obj, records)
+            except (RuntimeError, IndexError, KeyError):
+                #changed size while being copied, or changed after the records were taken so that they don't apply to the copy
+                if unchanged():
+                    raise
+                continue
+            if unchanged():
+                return state
+
+    def _get(self, ident):
+        state = self._read(ident)
+        if state is None:
+            raise KeyError(ident)
+        return state
+
+    def get_version(self):
+        return self._version
+
+    def get_root(self):
+        return self._root
+
+    def __contains__(self, ident):
+        return not self._read(ident) is None
+
+    def idents(self):
+        #idents of every object in the view
+        candidates = list(self._obj_ctx._objects)
+        candidates.extend(ident for ident in list(self._obj_ctx._history) if not ident in self._obj_ctx._objects)
+        return [ident for ident in dict.fromkeys(candidates) if not self._read(ident) is None]
+
+    def get_content(self, ident):
+        #the returned content is shared with other readers and should not be modified
+        return self._get(ident)[2]
+
+    def __getitem__(self, pair):
+        ident, key = pair
+        return self.get_content(ident)[key]
+
+    def get_type(self, ident):
+        return self._get(ident)[0]
+
+    def get_types(self, ident):
+        return self._obj_ctx._type_ctx.get_super_types(self._get(ident)[0])
+
+    def get_unique_owner(self, ident):
+        typename, ref, content, reverse_refs = self._get(ident)
+        parse_assert(ref == REF_UNIQUE, f"object with id {ident} is not unique")
+        return reverse_refs[0] if len(reverse_refs) != 0 else None
+
+    def get_shared_owners(self, ident):
+        typename, ref, content, reverse_refs = self._get(ident)
+        parse_assert(ref == REF_SHARED, f"object with id {ident} is not shared")
+        return frozenset(reverse_refs)
+
+    def to_json(self, ident):
+        typename, ref, content, reverse_refs = self._get(ident)
+        return {"type" : typename, "id" : ident, "ref" : ref, "content" : content}
+
+    def iter_json(self, compact = False, ndjson = False):
+        #as ObjectContext.iter_json, for the objects in the view
+        yield from iter_objects_json((self.to_json(ident) for ident in self.idents()), compact, ndjson)
+
+    def write_json(self, f, compact = False, ndjson = False):
+        for text in self.iter_json(compact, ndjson):
+            f.write(text)
+
+
+def iter_objects_json(obj_jsons, compact, ndjson):
+    #generate the text of a json object of ident -> object json, or of one object json per line if ndjson
+    if ndjson:
+        for obj_json in obj_jsons:
+            yield json.dumps(obj_json) + "\n"
+        return
+
+    first = True
+    for obj_json in obj_jsons:
+        if compact:
+            yield ("{" if first else ", ") + json.dumps(obj_json["id"]) + ": " + json.dumps(obj_json)
+        else:
+            yield ("{\n  " if first else ",\n  ") + json.dumps(obj_json["id"]) + ": " + json.dumps(obj_json, indent = 2).replace("\n", "\n  ")
+        first = False
+    if first:
+        yield "{}"
+    else:
+        yield "}" if compact else "\n}"
+
+
+JSON_WHITESPACE = re.compile(r"[ \t\r\n]*")
+
+def iter_json_items(f, read_size = 1 << 16):
+    #incrementally parse a file containing a single json object, yielding its (key, value) pairs
+    #only the text of the item being parsed is held in memory
+    decoder = json.JSONDecoder()
+    buf = ""
+    pos = 0
+    eof = False
+
+    def read_more(size = read_size):
+        nonlocal buf, pos, eof
+        text = f.read(size)
+        if len(text) == 0:
+            eof = True
+        buf = buf[pos:] + text
+        pos = 0
+
+    def skip_whitespace():
+        nonlocal pos
+        while True:
+            pos = JSON_WHITESPACE.match(buf, pos).end()
+            if pos < len(buf) or eof:
+                return
+            read_more()
+
+    def expect(chars):
+        nonlocal pos
+        skip_whitespace()
+        parse_assert(pos < len(buf) and buf[pos] in chars, f"expected one of {list(chars)} in json")
+        pos += 1
+        return buf[pos - 1]
+
+    def decode():
+        nonlocal pos
+        skip_whitespace()
+        #each failed attempt parses the value from its start again, so the amount read doubles
+        #each time to keep loading a large value linear in its size
+        size = read_size
+        while True:
+            try:
+                value, end = decoder.raw_decode(buf, pos)
+                #a value ending exactly at the end of the buffer may be cut short, such as a number
+                if end < len(buf) or eof:
+                    pos = end
+                    return value
+            except json.JSONDecodeError:
+                parse_assert(not eof, "invalid json")
+            read_more(size)
+            size *= 2
+
+    expect("{")
+    skip_whitespace()
+    if buf[pos:pos + 1] == "}":
+        return
+    while True:
+        key = decode()
+        parse_assert(type(key) == str, "json object keys should be strings")
+        expect(":")
+        yield key, decode()
+        if expect(",}") == "}":
+            return
+
+def iter_ndjson_items(f):
+    #parse a file with the json of one object per line, yielding (ident, object) pairs
+    for line in f:
+        if len(line.strip()) == 0:
+            continue
+        obj_data = json.loads(line)
+        parse_assert(type(obj_data) == dict and "id" in obj_data, "each line should be an object containing its \"id\"")
+        yield obj_data["id"], obj_data
+
+
+def copy_json(value):
+    if type(value) == list:
+        return [copy_json(item) for item in value]
+    if type(value) == dict:
+        return {key : copy_json(item) for key, item in value.items()}
+    return value
+
+
+def apply_json_action(value, action):
+    #the result of a field action from a change list on a json value, which may be changed in place
+    #raises ValueError for actions which would fail to apply
+    if type(action) != dict:
+        raise ValueError("invalid action")
+    opp = action.get("opp", None)
+    if opp == "replace" and action.keys() == {"opp", "value"}:
+        return copy_json(action["value"])
+    if type(value) != list:
+        raise ValueError("list action on a non list")
+    if opp == "append" and action.keys() == {"opp", "value"}:
+        value.append(copy_json(action["value"]))
+        return value
+    if opp in {"remove", "modify"} and action.keys() == ({"opp", "idx"} if opp == "remove" else {"opp", "idx", "action"}):
+        idx = action["idx"]
+        if type(idx) != int or not 0 <= idx < len(value):
+            raise ValueError("list idx out of range")
+        if opp == "remove":
+            del value[idx]
+        else:
+            value[idx] = apply_json_action(value[idx], action["action"])
+        return value
+    raise ValueError("invalid action")
+
+
+def json_strs(value):
+    #every str found inside a json value
+    if type(value) == str:
+        yield value
+    elif type(value) == list:
+        for item in value:
+            yield from json_strs(item)
+    elif type(value) == dict:
+        for key, item in value.items():
+            yield key
+            yield from json_strs(item)
+
+
+def optimize_changes(changes, obj_ctx = None):
+    #returns a change list, in the format accepted by ObjectContext.apply_changes, with the same result when applied as changes
+    # - a run of consecutive modifies of the same field is merged into a single replace from the last replace in the run
+    # - an object added and later removed is dropped along with its modifies, provided nothing else mentions it in between
+    # - if obj_ctx, the state the changes will be applied to, is given then runs which leave a field as it was are dropped
+    #the result is only guaranteed to be the same for change lists which apply without error, invalid parts are left for apply_changes to report
+    #changes is not altered, though the result may share values with it
+    parse_assert(type(changes) == list, "changes should be a list")
+    return _coalesce_changes(_cancel_changes(_coalesce_changes(changes, obj_ctx)), obj_ctx)
+
+
+def compact_changes(blocks, obj_ctx = None):
+    #the change blocks of a stored change log, such as changes.json, as a single optimized change block
+    #validation only happens at the end of the single block, so this is only for blocks already known to apply without error
+    parse_assert(type(blocks) == list, "change blocks should be a list")
+    changes = []
+    for block in blocks:
+        parse_assert(type(block) == list, "change block should be a list")
+        changes.extend(block)
+    return optimize_changes(changes, obj_ctx)
+
+
+def _is_field_modify(change):
+    return type(change) == dict and change.keys() == {"opp", "ident", "field", "action"} and change["opp"] == "modify" \
+        and type(change["ident"]) == str and type(change["field"]) == str
+
+
+def _coalesce_changes(changes, obj_ctx):
+    result = []
+    touched = set() #(ident, field) changed earlier in the list, or objects added or removed, whose values obj_ctx no longer knows
+    i = 0
+    while i < len(changes):
+        change = changes[i]
+        if not _is_field_modify(change):
+            if type(change) == dict and type(change.get("ident", None)) == str:
+                touched.add(change["ident"])
+            result.append(change)
+            i += 1
+            continue
+
+        ident, field = change["ident"], change["field"]
+        j = i + 1
+        while j < len(changes) and _is_field_modify(changes[j]) and changes[j]["ident"] == ident and changes[j]["field"] == field:
+            j += 1
+        run = changes[i:j]
+        i = j
+
+        #the value of the field before the run, if known
+        base = None
+        if not obj_ctx is None and not ident in touched and not (ident, field) in touched and ident in obj_ctx._objects:
+            base = obj_ctx._objects[ident].content.get(field, None)
+        touched.add((ident, field))
+
+        replaces = [k for k, run_change in enumerate(run) if type(run_change["action"]) == dict and run_change["action"].get("opp", None) == "replace"]
+        if len(replaces) == 0 and base is None:
+            result.extend(run)
+            continue
+        start = 0 if len(replaces) == 0 else replaces[-1]
+        try:
+            value = copy_json(base)
+            for run_change in run[start:]:
+                value = apply_json_action(value, run_change["action"])
+        except ValueError:
+            result.extend(run)
+            continue
+        if not base is None and json.dumps(value) == json.dumps(base):
+            continue #no-op
+        if len(replaces) == 0:
+            result.extend(run) #cheaper than replacing the whole field
+        else:
+            result.append({"opp" : "modify", "ident" : ident, "field" : field, "action" : {"opp" : "replace", "value" : value}})
+    return result
+
+
+def _cancel_changes(changes):
+    result = []
+    added_at = {} #ident -> index in result of its add
+    modifies = {} #ident -> indices in result of its modifies since it was added
+    last_mention = {} #str -> last index in result mentioning it, other than in changes to the object with that ident
+    for change in changes:
+        ident = change.get("ident", None) if type(change) == dict else None
+        opp = change.get("opp", None) if type(change) == dict else None
+        if type(ident) == str and opp == "remove" and change.keys() == {"opp", "ident"} and ident in added_at \
+                and last_mention.get(ident, -1) < added_at[ident]:
+            result[added_at.pop(ident)] = None
+            for idx in modifies.pop(ident):
+                result[idx] = None
+            continue
+
+        if type(ident) == str and opp == "add":
+            added_at[ident] = len(result)
+            modifies[ident] = []
+        elif type(ident) == str and opp == "modify" and ident in modifies:
+            modifies[ident].append(len(result))
+        elif type(ident) == str and opp == "remove":
+            added_at.pop(ident, None)
+            modifies.pop(ident, None)
+        for text in json_strs(change):
+            if text != ident:
+                last_mention[text] = len(result)
+        result.append(change)
+    return [change for change in result if not change is None]
+
+
+def lcs_pairs(a, b, same, max_edits = 1000):
+    #index pairs (i, j) of a longest common subsequence of the lists a and b, where same(i, j) says whether a[i] matches b[j]
+    #uses Myers' algorithm, which takes time proportional to (len(a) + len(b)) * the number of edits
+    #gives up and returns only the common prefix and suffix if more than max_edits edits are needed
+    start = 0
+    while start < len(a) and start < len(b) and same(start, start):
+        start += 1
+    end_a, end_b = len(a), len(b)
+    while end_a > start and end_b > start and same(end_a - 1, end_b - 1):
+        end_a -= 1
+        end_b -= 1
+    prefix = [(i, i) for i in range(start)]
+    suffix = [(end_a + i, end_b + i) for i in range(len(a) - end_a)]
+    n, m = end_a - start, end_b - start
+
+    v = {1 : 0} #diagonal k -> furthest x reached on it
+    trace = [] #v before each number of edits
+    for d in range(min(n + m, max_edits) + 1):
+        trace.append(dict(v))
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and v[k - 1] < v[k + 1]):
+                x = v[k + 1]
             else:
-                parse_assert(False, f"invalid \"opp\" field")
+                x = v[k - 1] + 1
+            y = x - k
+            while x < n and y < m and same(start + x, start + y):
+                x += 1
+                y += 1
+            v[k] = x
+            if x >= n and y >= m:
+                #walk back through the trace collecting the diagonal moves
+                pairs = []
+                for back_d in range(d, 0, -1):
+                    back_v = trace[back_d]
+                    k = x - y
+                    if k == -back_d or (k != back_d and back_v[k - 1] < back_v[k + 1]):
+                        prev_k = k + 1
+                    else:
+                        prev_k = k - 1
+                    prev_x = back_v[prev_k]
+                    prev_y = prev_x - prev_k
+                    while x > prev_x and y > prev_y:
+                        x -= 1
+                        y -= 1
+                        pairs.append((start + x, start + y))
+                    x, y = prev_x, prev_y
+                while x > 0 and y > 0:
+                    x -= 1
+                    y -= 1
+                    pairs.append((start + x, start + y))
+                return prefix + pairs[::-1] + suffix
+    return prefix + suffix
+
+
+def json_size(value):
+    if type(value) == list:
+        return 1 + sum(json_size(item) for item in value)
+    return 1
+
+
+def action_size(action):
+    #rough cost of applying a field action
+    if action["opp"] in {"replace", "append"}:
+        return 1 + json_size(action["value"])
+    if action["opp"] == "modify":
+        return action_size(action["action"])
+    return 1
+
+
+def diff_list(t_ptr, old, new, retyped = frozenset(), split = False):
+    #list actions which turn the list old into the list new, where t_ptr is the ListTypePtr of the field
+    #elements are matched by a longest common subsequence, unmatched ones are changed in place, removed, or appended at the end
+    #since there is no insert action, elements after an insertion which doesn't fit in place are removed and appended again
+    #elements pointing at objects in retyped are never matched since the object they point to is removed and added again
+    #if split, returns (removes, appends) where the removes must be applied first and nothing is changed in place
+    listed = t_ptr.listed_type
+
+    def matchable(item):
+        return len(retyped) == 0 or retyped.isdisjoint(listed.get_refs(None, item))
+
+    pairs = lcs_pairs(old, new, lambda i, j: old[i] == new[j] and matchable(old[i]))
+    pairs.append((len(old), len(new)))
+    changes = [] #(old idx, new idx) of elements changed in place
+    removes = []
+    appends = []
+    prev_i, prev_j = -1, -1
+    for i, j in pairs:
+        old_gap = range(prev_i + 1, i)
+        new_gap = range(prev_j + 1, j)
+        final = (i, j) == (len(old), len(new))
+        if (split and len(new_gap) != 0 and not final) or (not split and len(new_gap) > len(old_gap) and not final):
+            #from here on elements are matched up by position
+            old_gap = range(prev_i + 1, len(old))
+            new_gap = range(prev_j + 1, len(new))
+            final = True
+        if split:
+            removes.extend(old_gap)
+        else:
+            changes.extend((oi, nj) for oi, nj in zip(old_gap, new_gap) if old[oi] != new[nj] or not matchable(old[oi]))
+            removes.extend(old_gap[len(new_gap):])
+        if final:
+            appends.extend(new_gap[0 if split else len(old_gap):])
+            break
+        prev_i, prev_j = i, j
+
+    actions = []
+    for oi, nj in changes:
+        nested = None
+        if listed.kind == "list":
+            nested = diff_list(listed, old[oi], new[nj])
+        replace = {"opp" : "replace", "value" : copy_json(new[nj])}
+        if nested is None or sum(action_size(action) for action in nested) > action_size(replace):
+            nested = [replace]
+        actions.extend({"opp" : "modify", "idx" : oi, "action" : action} for action in nested)
+    removes = [{"opp" : "remove", "idx" : oi} for oi in sorted(removes, reverse = True)]
+    appends = [{"opp" : "append", "value" : copy_json(new[nj])} for nj in appends]
+    if split:
+        return removes, appends
+    return actions + removes + appends
+
+
+def add_object_changes(type_ctx, objects):
+    #changes adding objects, a dict of ident -> object json, which may point at each other as well as at existing objects
+    #returns (adds, sets): objects are added after the objects they point to where possible,
+    #and fields pointing at objects not added yet are left out of the add and set by the modifies in sets
+    def added_targets(ident):
+        t = type_ctx._types[objects[ident]["type"]]
+        return iter(sorted(set(r for key, value in objects[ident]["content"].items() for r in t.content[key].get_refs(None, value) if r in objects)))
+
+    order = [] #depth first post order, so targets come before the objects pointing at them
+    seen = set()
+    for first in sorted(objects):
+        if first in seen:
+            continue
+        seen.add(first)
+        stack = [(first, added_targets(first))]
+        while len(stack) != 0:
+            ident, targets = stack[-1]
+            for target in targets:
+                if not target in seen:
+                    seen.add(target)
+                    stack.append((target, added_targets(target)))
+                    break
+            else:
+                stack.pop()
+                order.append(ident)
+    adds = []
+    sets = []
+    available = set()
+    for ident in order:
+        obj = objects[ident]
+        t = type_ctx._types[obj["type"]]
+        add_content = {}
+        for key, value in obj["content"].items():
+            if all(not r in objects or r in available for r in t.content[key].get_refs(None, value)):
+                add_content[key] = copy_json(value)
+            else:
+                sets.append({"opp" : "modify", "ident" : ident, "field" : key, "action" : {"opp" : "replace", "value" : copy_json(value)}})
+        adds.append({"opp" : "add", "ident" : ident, "object" : {"type" : obj["type"], "ref" : obj["ref"], "content" : add_content}})
+        available.add(ident)
+    return adds, sets
+
+
+def diff_objects(old, new):
+    #a change list, in the format accepted by ObjectContext.apply_changes, which turns old into new
+    #old and new are ObjectContexts or ReadViews with the same types and root object
+    #when they are the same ObjectContext or ReadViews of it, only the objects changed between their versions are compared
+    #so the time taken is proportional to the changes, otherwise every object is compared
+    #the changes are ordered so that refs are released before they are taken: first changes releasing removed, retyped
+    #or reowned unique objects, then removals, then additions, then other modifies, then the changes taking those refs
+    old_ctx = old._obj_ctx if type(old) == ReadView else old
+    new_ctx = new._obj_ctx if type(new) == ReadView else new
+    type_ctx = old_ctx._type_ctx
+    parse_assert(old.get_root() == new.get_root(), "objects with different roots can't be diffed")
+    if old_ctx is new_ctx:
+        old_version = old.get_version() if type(old) == ReadView else old_ctx._version
+        new_version = new.get_version() if type(new) == ReadView else new_ctx._version
+        candidates = old_ctx._changed_between(min(old_version, new_version), max(old_version, new_version))
+    else:
+        candidates = set(old.idents() if type(old) == ReadView else old._objects)
+        candidates.update(new.idents() if type(new) == ReadView else new._objects)
+
+    old_states = {}
+    new_states = {}
+    for ident in candidates:
+        old_state, new_state = old._read(ident), new._read(ident)
+        if old_state is None and new_state is None:
+            continue
+        if not old_state is None and not new_state is None and old_state[:3] == new_state[:3] and set(old_state[3]) == set(new_state[3]):
+            continue
+        old_states[ident] = old_state
+        new_states[ident] = new_state
+
+    removed = set(ident for ident, state in new_states.items() if state is None)
+    added = set(ident for ident, state in old_states.items() if state is None)
+    retyped = set(ident for ident, state in new_states.items() if not state is None and not old_states[ident] is None and state[:2] != old_states[ident][:2])
+    reowned = set(ident for ident, state in new_states.items() if not ident in added and not ident in removed and not ident in retyped \
+                  and state[1] == REF_UNIQUE and set(state[3]) != set(old_states[ident][3]))
+    parse_assert(not new.get_root() in removed and not new.get_root() in retyped, "the root object can't be removed or retyped")
+    released = removed | retyped | reowned #objects whose refs must be released before anything else takes them
+    retyped = frozenset(retyped)
+
+    releases = []
+    removes = [{"opp" : "remove", "ident" : ident} for ident in sorted(removed | retyped)]
+    modifies = []
+    takes = []
+
+    def modify(ident, key, action):
+        return {"opp" : "modify", "ident" : ident, "field" : key, "action" : action}
+
+    #objects which still point at a retyped object must drop and retake the ref even if they are unchanged
+    to_modify = set(ident for ident in new_states if not ident in added and not ident in removed and not ident in retyped)
+    for ident in retyped:
+        to_modify.update(owner for owner in old_states[ident][3] if not owner in removed and not owner in retyped)
+    for ident in sorted(to_modify):
+        old_state, new_state = old._read(ident), new._read(ident)
+        t = type_ctx._types[new_state[0]]
+        old_content, new_content = old_state[2], new_state[2]
+        for key, t_ptr in t.content.items():
+            old_value = old_content.get(key, UNSET)
+            new_value = new_content.get(key, UNSET)
+            old_refs = set() if old_value is UNSET else set(t_ptr.get_refs(None, old_value))
+            new_refs = set() if new_value is UNSET else set(t_ptr.get_refs(None, new_value))
+            if old_value == new_value and retyped.isdisjoint(old_refs):
+                continue
+            if new_value is UNSET:
+                releases.append(modify(ident, key, {"opp" : "unset"}))
+                continue
+            split = not released.isdisjoint(old_refs) or not released.isdisjoint(new_refs)
+            replace = {"opp" : "replace", "value" : copy_json(new_value)}
+            if t_ptr.kind == "list" and not old_value is UNSET:
+                if split:
+                    list_releases, list_takes = diff_list(t_ptr, old_value, new_value, retyped, True)
+                    if sum(action_size(action) for action in list_releases + list_takes) > 1 + action_size(replace):
+                        list_releases, list_takes = [{"opp" : "replace", "value" : []}], [replace]
+                    releases.extend(modify(ident, key, action) for action in list_releases)
+                    takes.extend(modify(ident, key, action) for action in list_takes)
+                else:
+                    actions = diff_list(t_ptr, old_value, new_value)
+                    if sum(action_size(action) for action in actions) > action_size(replace):
+                        actions = [replace]
+                    modifies.extend(modify(ident, key, action) for action in actions)
+            elif split:
+                if not old_value is UNSET and not released.isdisjoint(old_refs):
+                    releases.append(modify(ident, key, {"opp" : "unset"}))
+                takes.append(modify(ident, key, replace))
+            else:
+                modifies.append(modify(ident, key, replace))
+
+    #new objects are added after the objects they point to where possible, fields pointing at objects not added yet are set afterwards
+    to_add = added | retyped
+    adds, sets = add_object_changes(type_ctx, {ident : {"type" : new_states[ident][0], "ref" : new_states[ident][1], "content" : new_states[ident][2]} for ident in to_add})
+    takes.extend(sets)
+
+    return releases + removes + adds + modifies + takes
+
+
+class ChangeConflict(Exception):
+    #raised by rebase_changes when two change blocks can't both be applied
+    pass
+
+
+def rebase_actions(base_value, first, second):
+    #rewrites the field actions second, made against base_value, so that they apply after the field actions first
+    #returns a list aligned with second of the rewritten actions, with None for actions which are no longer needed
+    #list elements are tracked by identity so indices are shifted across the appends and removes in first
+    if len(first) == 0 or len(second) == 0:
+        return list(second)
+    for action in first + second:
+        parse_assert(type(action) == dict and "opp" in action, "change objects need an \"opp\" field")
+        if action["opp"] in {"replace", "unset"}:
+            if first == second:
+                return [None] * len(second) #the same change made by both
+            raise ChangeConflict("a field replaced by one change block was also changed by the other")
+    parse_assert(type(base_value) == list, "list action on a non list")
+
+    def track(actions, tag):
+        #replays the actions on the identities of the elements of base_value
+        #elements of base_value are identified by their index and appended ones by (tag, n)
+        seq = list(range(len(base_value)))
+        ops = [] #(opp, identity, nested action) per action
+        for action in actions:
+            opp = action["opp"]
+            if opp == "append":
+                seq.append((tag, len(ops)))
+                ops.append((opp, seq[-1], None))
+            else:
+                parse_assert(opp in {"remove", "modify"}, f"unknown list opperation \"{opp}\"")
+                parse_assert(type(action.get("idx", None)) == int and 0 <= action["idx"] < len(seq), "list idx out of range")
+                ops.append((opp, seq[action["idx"]], action.get("action", None)))
+                if opp == "remove":
+                    del seq[action["idx"]]
+        return seq, ops
+
+    current, first_ops = track(first, "first")
+    first_removed = set(identity for opp, identity, nested in first_ops if opp == "remove" and type(identity) == int)
+    first_nested = {} #identity of an element of base_value -> nested actions first applies to it
+    for opp, identity, nested in first_ops:
+        if opp == "modify" and type(identity) == int:
+            first_nested.setdefault(identity, []).append(nested)
+    second_seq, second_ops = track(second, "second")
+    second_nested = {}
+    for opp, identity, nested in second_ops:
+        if opp == "modify" and identity in first_nested:
+            second_nested.setdefault(identity, []).append(nested)
+    rebased_nested = {identity : rebase_actions(base_value[identity], first_nested[identity], nested) for identity, nested in second_nested.items()}
+
+    rebased = []
+    for action, (opp, identity, nested) in zip(second, second_ops):
+        if opp == "append":
+            current.append(identity)
+            rebased.append(action)
+            continue
+        if identity in first_removed:
+            if opp == "remove":
+                rebased.append(None) #removed by both
+                continue
+            raise ChangeConflict("an element removed by one change block was modified by the other")
+        if opp == "remove" and identity in first_nested:
+            raise ChangeConflict("an element modified by one change block was removed by the other")
+        idx = current.index(identity)
+        if opp == "remove":
+            del current[idx]
+            rebased.append({"opp" : "remove", "idx" : idx})
+            continue
+        if identity in rebased_nested:
+            nested = rebased_nested[identity].pop(0)
+        if nested is None:
+            rebased.append(None)
+        else:
+            rebased.append({"opp" : "modify", "idx" : idx, "action" : nested})
+    return rebased
+
+
+def rebase_changes(base, first, second):
+    #rewrites the change list second so that it applies after the change list first, when both were made against base
+    #base is the ObjectContext or ReadView both were made against, it is only read
+    #list indices in second are shifted across the changes first makes to the same lists, and changes already made by first are dropped
+    #raises ChangeConflict if the two can't both be applied, such as when second changes or points at an object which first removed,
+    #changes a list element which first removed, or both change the same field or list element
+    #conflicts which depend on the whole document, such as a unique object being given two owners, are left for validation to find
+    type_ctx = (base._obj_ctx if type(base) == ReadView else base)._type_ctx
+    parse_assert(type(first) == list and type(second) == list, "changes should be lists")
+
+    def summarize(changes):
+        added = {} #ident -> typename
+        removed = set()
+        fields = {} #(ident, field) -> actions in order
+        for change in changes:
+            parse_assert(type(change) == dict and "opp" in change and type(change.get("ident", None)) == str, "invalid change")
+            if change["opp"] == "add":
+                parse_assert(type(change.get("object", None)) == dict, "an add change needs an object")
+                added[change["ident"]] = change["object"].get("type", None)
+            elif change["opp"] == "remove":
+                removed.add(change["ident"])
+            elif change["opp"] == "modify":
+                fields.setdefault((change["ident"], change.get("field", None)), []).append(change.get("action", None))
+        return added, removed, fields
+
+    first_added, first_removed, first_fields = summarize(first)
+    second_added, second_removed, second_fields = summarize(second)
+
+    def typename_of(ident, added):
+        if ident in added:
+            return added[ident]
+        state = base._read(ident)
+        return None if state is None else state[0]
+
+    def action_refs(t_ptr, action):
+        #the refs an action gives its field
+        if type(action) != dict:
+            return
+        if action.get("opp", None) == "replace":
+            yield from t_ptr.get_refs(None, action.get("value", None))
+        elif t_ptr.kind == "list" and action.get("opp", None) == "append":
+            yield from t_ptr.listed_type.get_refs(None, action.get("value", None))
+        elif t_ptr.kind == "list" and action.get("opp", None) == "modify":
+            yield from action_refs(t_ptr.listed_type, action.get("action", None))
+
+    def change_refs(change, typename):
+        t = type_ctx._types.get(typename, None)
+        if t is None:
+            return set()
+        if change["opp"] == "add":
+            content = change["object"].get("content", {})
+            return set(r for key, value in content.items() if key in t.content for r in t.content[key].get_refs(None, value))
+        if change["opp"] == "modify" and change.get("field", None) in t.content:
+            return set(action_refs(t.content[change["field"]], change.get("action", None)))
+        return set()
+
+    first_refs = set()
+    for change in first:
+        first_refs.update(change_refs(change, typename_of(change["ident"], first_added)))
+
+    rebased_fields = {}
+    for (ident, field), actions in second_fields.items():
+        state = base._read(ident)
+        base_value = UNSET if state is None or ident in second_added else state[2].get(field, UNSET)
+        rebased_fields[(ident, field)] = rebase_actions(base_value, first_fields.get((ident, field), []), actions)
+
+    rebased = []
+    for change in second:
+        ident = change["ident"]
+        if change["opp"] == "remove":
+            if ident in first_removed and not ident in first_added:
+                continue #removed by both
+            if ident in first_refs:
+                raise ChangeConflict(f"object with id {ident} was removed by one change block while the other points at it")
+            if any(key[0] == ident for key in first_fields) or ident in first_added:
+                raise ChangeConflict(f"object with id {ident} was removed by one change block and changed by the other")
+            rebased.append(change)
+            continue
+        if ident in first_added and (change["opp"] == "add" or not ident in second_added):
+            raise ChangeConflict(f"object with id {ident} was added by both change blocks")
+        if ident in first_removed and not ident in second_added:
+            raise ChangeConflict(f"object with id {ident} was removed by one change block and changed by the other")
+        if not first_removed.isdisjoint(change_refs(change, typename_of(ident, second_added))):
+            raise ChangeConflict(f"a change to object with id {ident} points at an object removed by the other change block")
+        if change["opp"] == "modify":
+            action = rebased_fields[(ident, change.get("field", None))].pop(0)
+            if action is None:
+                continue
+            change = {"opp" : "modify", "ident" : ident, "field" : change["field"], "action" : action}
+        rebased.append(change)
+    return rebased
+
+
+class ChangeLog():
+    #durable storage for an ObjectContext as a snapshot plus an append-only log of the change blocks applied since
+    #the directory contains snapshot-<seq>.json files and log-<seq>.jsonl files, where seq is the number of change blocks applied
+    #log-<seq>.jsonl holds the change blocks applied after the snapshot at seq, one block per line in the format of changes.json
+    def __init__(self, type_ctx, path, objects = None, sync_every = 16, snapshot_every = 1000):
+        assert type(type_ctx) == TypeContext
+        assert type(sync_every) == int and sync_every >= 1
+        assert type(snapshot_every) == int and snapshot_every >= 1
+        self._path = path
+        self._sync_every = sync_every
+        self._snapshot_every = snapshot_every
+        self._unsynced = 0
+        self._snapshot_thread = None
+        os.makedirs(path, exist_ok = True)
+
+        snapshots = self._list_files("snapshot-", ".json")
+        if len(snapshots) == 0:
+            parse_assert(not objects is None, f"no snapshot found in \"{path}\" and no initial objects provided")
+            self.obj_ctx = ObjectContext(type_ctx, objects)
+            self.obj_ctx.enable_snapshots()
+            self._seq = 0
+            self._write_snapshot(0, self.obj_ctx.read_view())
+        else:
+            parse_assert(objects is None, f"\"{path}\" already contains a snapshot")
+            self._recover(type_ctx, snapshots[-1])
+            self.obj_ctx.enable_snapshots()
+        self._snapshot_seq = self._seq
+        self._log = open(self._file_path("log-", self._seq, ".jsonl"), "a", newline = "\n")
+        self._sync_dir()
+
+    def _sync_dir(self):
+        #make the creation, renaming and removal of files in the directory durable
+        #directories can't be opened for syncing on windows, where renames are durable once they return
+        if os.name != "posix":
+            return
+        fd = os.open(self._path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _file_path(self, prefix, seq, suffix):
+        return os.path.join(self._path, f"{prefix}{seq}{suffix}")
+
+    def _list_files(self, prefix, suffix):
+        #sorted seqs of the files in the directory of the form <prefix><seq><suffix>
+        seqs = []
+        for name in os.listdir(self._path):
+            if name.startswith(prefix) and name.endswith(suffix):
+                seq = name[len(prefix):len(name) - len(suffix)]
+                if seq.isdigit():
+                    seqs.append(int(seq))
+        return sorted(seqs)
+
+    def _recover(self, type_ctx, snapshot_seq):
+        with open(self._file_path("snapshot-", snapshot_seq, ".json"), "r") as f:
+            self.obj_ctx = ObjectContext.load(type_ctx, f, do_validate = False)
+        self._seq = snapshot_seq
+        #replay every log written since the snapshot, validating only once at the end
+        for log_seq in self._list_files("log-", ".jsonl"):
+            if log_seq < snapshot_seq:
+                continue
+            parse_assert(log_seq == self._seq, f"change log {log_seq} does not follow on from change block {self._seq}")
+            log_path = self._file_path("log-", log_seq, ".jsonl")
+            valid_size = 0
+            #read as bytes so the size kept is the size on disk whatever the platform's newlines
+            with open(log_path, "rb") as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break #torn write at the end of the log, the block was never synced
+                    self.obj_ctx.apply_changes(json.loads(line), False)
+                    self._seq += 1
+                    valid_size += len(line)
+            if valid_size != os.path.getsize(log_path):
+                with open(log_path, "rb+") as f:
+                    f.truncate(valid_size)
+        self.obj_ctx.validate()
+        self._sync_dir()
+        self._remove_old_files(snapshot_seq)
+
+    def _remove_old_files(self, seq):
+        for old_seq in self._list_files("snapshot-", ".json"):
+            if old_seq < seq:
+                os.remove(self._file_path("snapshot-", old_seq, ".json"))
+        for old_seq in self._list_files("log-", ".jsonl"):
+            if old_seq < seq:
+                os.remove(self._file_path("log-", old_seq, ".jsonl"))
+
+    def _write_snapshot(self, seq, view):
+        tmp_path = self._file_path("snapshot-", seq, ".json.tmp")
+        with view, open(tmp_path, "w") as f:
+            view.write_json(f, compact = True)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._file_path("snapshot-", seq, ".json"))
+        #the rename has to be durable before the files it replaces are removed
+        self._sync_dir()
+        #everything older is covered by the new snapshot
+        self._remove_old_files(seq)
+
+    def apply_changes(self, changes, collect = False):
+        removed = self.obj_ctx.apply_changes(changes, do_validate = True, incremental = True, collect = collect, atomic = True)
+        #garbage collected objects are logged as explicit removals so that replaying doesn't depend on the collect setting
+        logged = changes + [{"opp" : "remove", "ident" : ident} for ident in sorted(removed)]
+        self._log.write(json.dumps(logged) + "\n")
+        self._seq += 1
+        self._unsynced += 1
+        if self._unsynced >= self._sync_every:
+            self.sync()
+        if self._seq - self._snapshot_seq >= self._snapshot_every:
+            self.snapshot()
+
+    def sync(self):
+        #make every change block applied so far durable
+        self._log.flush()
+        os.fsync(self._log.fileno())
+        self._unsynced = 0
+
+    def snapshot(self):
+        #start a new log and write a snapshot of the current state in the background
+        #the snapshot is written from a ReadView, so change blocks can keep being applied while it is written
+        #the old log and snapshot are removed once the new snapshot is durable
+        self.sync()
+        if not self._snapshot_thread is None:
+            self._snapshot_thread.join()
+        view = self.obj_ctx.read_view()
+        self._log.close()
+        self._log = open(self._file_path("log-", self._seq, ".jsonl"), "a", newline = "\n")
+        self._sync_dir()
+        self._snapshot_seq = self._seq
+        self._snapshot_thread = threading.Thread(target = self._write_snapshot, args = (self._seq, view))
+        self._snapshot_thread.start()
+
+    def close(self):
+        self.sync()
+        self._log.close()
+        if not self._snapshot_thread is None:
+            self._snapshot_thread.join()
+            self._snapshot_thread = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class ObjectStore():
+    #read only access to objects saved by ObjectStore.write, loading each object only when it is accessed
+    #the file is memory mapped and looked up through a sorted ident index, so opening it reads nothing but the header
+    #the most recently used cache_size objects are kept loaded
+    #records include the owners of each object, so owner lookups only load the object asked about
+    HEADER = struct.Struct("<8sQQQQ") #magic, number of objects, index offset, root ident offset, root ident length
+    INDEX_ENTRY = struct.Struct("<QIQI") #ident offset, ident length, record offset, record length
+    MAGIC = b"OBJSTOR1"
+
+    @classmethod
+    def write(cls, source, path):
+        #save the objects of an ObjectContext or ReadView to path
+        #the file holds the header, one json record [type, ref, content, owners] per object, the idents, then the index sorted by ident
+        idents = source.idents() if type(source) == ReadView else list(source._objects)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(b"\0" * cls.HEADER.size)
+            entries = []
+            offset = cls.HEADER.size
+            for ident in idents:
+                typename, ref, content, reverse_refs = source._read(ident)
+                record = json.dumps([typename, ref, content, sorted(reverse_refs)], separators = (",", ":")).encode()
+                f.write(record)
+                entries.append((ident.encode(), offset, len(record)))
+                offset += len(record)
+            entries.sort()
+            ident_offsets = []
+            root_ident = source.get_root().encode()
+            root_offset = 0
+            for ident, record_offset, record_length in entries:
+                if ident == root_ident:
+                    root_offset = offset
+                ident_offsets.append(offset)
+                f.write(ident)
+                offset += len(ident)
+            index_offset = offset
+            for ident_offset, (ident, record_offset, record_length) in zip(ident_offsets, entries):
+                f.write(cls.INDEX_ENTRY.pack(ident_offset, len(ident), record_offset, record_length))
+            f.seek(0)
+            f.write(cls.HEADER.pack(cls.MAGIC, len(entries), index_offset, root_offset, len(root_ident)))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def __init__(self, type_ctx, path, cache_size = 10000):
+        assert type(type_ctx) == TypeContext
+        assert type(cache_size) == int and cache_size >= 1
+        self._type_ctx = type_ctx
+        self._cache_size = cache_size
+        self._cache = collections.OrderedDict() #ident -> (typename, ref, content, owners), least recently used first
+        self.hits = 0
+        self.misses = 0
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access = mmap.ACCESS_READ)
+        magic, self._n, self._index_offset, root_offset, root_length = self.HEADER.unpack_from(self._map, 0)
+        parse_assert(magic == self.MAGIC, f"\"{path}\" is not an object store")
+        self._root = self._map[root_offset:root_offset + root_length].decode()
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return self._n
+
+    def _find(self, ident):
+        #binary search of the index, returns (record offset, record length) or None
+        key = ident.encode()
+        low, high = 0, self._n
+        while low < high:
+            mid = (low + high) // 2
+            ident_offset, ident_length, record_offset, record_length = self.INDEX_ENTRY.unpack_from(self._map, self._index_offset + mid * self.INDEX_ENTRY.size)
+            probe = self._map[ident_offset:ident_offset + ident_length]
+            if probe < key:
+                low = mid + 1
+            elif probe > key:
+                high = mid
+            else:
+                return record_offset, record_length
+        return None
+
+    def _read(self, ident):
+        #the state of ident as (typename, ref, content, owners) like ReadView._read, or None if it doesn't exist
+        state = self._cache.get(ident, None)
+        if not state is None:
+            self.hits += 1
+            self._cache.move_to_end(ident)
+            return state
+        found = self._find(ident)
+        if found is None:
+            return None
+        self.misses += 1
+        record_offset, record_length = found
+        typename, ref, content, owners = json.loads(self._map[record_offset:record_offset + record_length])
+        state = (typename, ref, self._type_ctx._types[typename].intern_content(content), tuple(owners))
+        self._cache[sys.intern(ident)] = state
+        if len(self._cache) > self._cache_size:
+            self._cache.popitem(last = False)
+        return state
+
+    def _get(self, ident):
+        state = self._read(ident)
+        if state is None:
+            raise KeyError(ident)
+        return state
 
-        if do_validate:
-            self.validate()
+    def get_root(self):
+        return self._root
+
+    def __contains__(self, ident):
+        return not self._find(ident) is None
+
+    def idents(self):
+        #every ident in the store, in sorted order, without loading the objects
+        idents = []
+        for idx in range(self._n):
+            ident_offset, ident_length, record_offset, record_length = self.INDEX_ENTRY.unpack_from(self._map, self._index_offset + idx * self.INDEX_ENTRY.size)
+            idents.append(self._map[ident_offset:ident_offset + ident_length].decode())
+        return idents
+
+    def get_content(self, ident):
+        #the returned content is shared with the cache and should not be modified
+        return self._get(ident)[2]
+
+    def __getitem__(self, pair):
+        ident, key = pair
+        return self.get_content(ident)[key]
+
+    def get_type(self, ident):
+        return self._get(ident)[0]
+
+    def get_types(self, ident):
+        return self._type_ctx.get_super_types(self._get(ident)[0])
+
+    def get_refs(self, ident):
+        #the idents ident points at, loading only ident
+        typename, ref, content, owners = self._get(ident)
+        t = self._type_ctx._types[typename]
+        return set(r for key, value in content.items() for r in t.content[key].get_refs(None, value))
+
+    def get_unique_owner(self, ident):
+        typename, ref, content, owners = self._get(ident)
+        parse_assert(ref == REF_UNIQUE, f"object with id {ident} is not unique")
+        return owners[0] if len(owners) != 0 else None
+
+    def get_shared_owners(self, ident):
+        typename, ref, content, owners = self._get(ident)
+        parse_assert(ref == REF_SHARED, f"object with id {ident} is not shared")
+        return frozenset(owners)
 
+    def to_json(self, ident):
+        typename, ref, content, owners = self._get(ident)
+        return {"type" : typename, "id" : ident, "ref" : ref, "content" : content}
 
 
 if __name__ == "__main__":
-    with open("structure.json", "r") as f:
-        structure = json.loads(f.read())
-        type_ctx = TypeContext(structure)
+    type_ctx = TypeContext.load("structure.json")
 
     with open("objects.json", "r") as f:
         objects = json.loads(f.read())
@@ -0,0 +1,581 @@
+import importlib
+import importlib.util
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+#random workloads and benchmarks for the library in __init__.py, run as a script from the repository directory
+
+if __package__:
+    pointer_structs = importlib.import_module(__package__)
+elif "pointer_structs" in sys.modules:
+    #already loaded by path, as the tests do
+    pointer_structs = sys.modules["pointer_structs"]
+else:
+    #run as a script, the library is loaded by path and registered so that the worker processes of parallel validation can find its functions
+    spec = importlib.util.spec_from_file_location("pointer_structs", os.path.join(os.path.dirname(os.path.abspath(__file__)), "__init__.py"))
+    pointer_structs = importlib.util.module_from_spec(spec)
+    sys.modules["pointer_structs"] = pointer_structs
+    spec.loader.exec_module(pointer_structs)
+
+REF_ROOT, REF_UNIQUE, REF_SHARED = pointer_structs.REF_ROOT, pointer_structs.REF_UNIQUE, pointer_structs.REF_SHARED
+TypeContext, ObjectContext, ReadView, ObjectStore = pointer_structs.TypeContext, pointer_structs.ObjectContext, pointer_structs.ReadView, pointer_structs.ObjectStore
+add_object_changes = pointer_structs.add_object_changes
+
+
+
+def best(f, repeat = 3, setup = None):
+    #the shortest time of repeat runs of f, which is passed the result of setup when it is given, setup is not timed
+    times = []
+    for _ in range(repeat):
+        arg = None if setup is None else setup()
+        start = time.perf_counter()
+        if setup is None:
+            f()
+        else:
+            f(arg)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+class ObjectGenerator():
+    #makes random valid objects for a TypeContext, for generate_objects and generate_changes
+    #share is the probability that a shared pointer reuses an existing object rather than creating a new one
+    #once count reaches size, lists are left empty and shared pointers reuse an existing object whenever there is one
+    def __init__(self, type_ctx, rng, size, max_list = 4, share = 0.5, prefix = "", existing = ()):
+        self.type_ctx = type_ctx
+        self.rng = rng
+        self.size = size
+        self.max_list = max_list
+        self.share = share
+        self.prefix = prefix
+        self.existing = existing #idents of objects made before, which new objects avoid and shared pointers may reuse
+        self.count = 0
+        self.objects = {} #ident -> object json, for the objects made
+        self.shared = {} #typename -> idents of shared objects of that type
+        self.pending = [] #objects made whose content is not filled in yet
+
+    def new_object(self, typename, ref):
+        ident = f"{self.prefix}{self.count}"
+        while ident in self.existing:
+            self.count += 1
+            ident = f"{self.prefix}{self.count}"
+        self.count += 1
+        self.objects[ident] = {"type" : typename, "ref" : ref, "content" : {}}
+        if ref == REF_SHARED:
+            self.shared.setdefault(typename, []).append(ident)
+        self.pending.append(ident)
+        return ident
+
+    def value(self, t):
+        #a random value of TypePtr t, objects made for it are left pending
+        rng = self.rng
+        if t.kind == "basic":
+            if t.builtin_type == "bool":
+                return rng.random() < 0.5
+            elif t.builtin_type == "int":
+                return rng.randrange(1000)
+            elif t.builtin_type == "float":
+                return rng.random()
+            else:
+                return f"s{rng.randrange(1000)}"
+        elif t.kind == "list":
+            n = rng.randint(0, self.max_list) if self.count < self.size else 0
+            return [self.value(t.listed_type) for _ in range(n)]
+        else:
+            sub_names = sorted(self.type_ctx.get_sub_types(t.ptr_type))
+            if t.unique:
+                return self.new_object(rng.choice(sub_names), REF_UNIQUE)
+            candidates = [name for name in sub_names if len(self.shared.get(name, [])) != 0]
+            if len(candidates) != 0 and (self.count >= self.size or rng.random() < self.share):
+                while len(candidates) != 0:
+                    name = rng.choice(candidates)
+                    ident = rng.choice(self.shared[name])
+                    if ident in self.objects or ident in self.existing:
+                        return ident
+                    #removed since it was made
+                    self.shared[name].remove(ident)
+                    if len(self.shared[name]) == 0:
+                        candidates.remove(name)
+            return self.new_object(rng.choice(sub_names), REF_SHARED)
+
+    def fill(self, ident):
+        t = self.type_ctx._types[self.objects[ident]["type"]]
+        content = self.objects[ident]["content"]
+        for key, t_ptr in t.content.items():
+            if t.optional[key] and self.rng.random() < 0.3:
+                continue
+            content[key] = self.value(t_ptr)
+
+    def fill_pending(self):
+        #fill in every pending object, and the objects made for them, returning the idents filled
+        filled = []
+        while len(self.pending) != 0:
+            ident = self.pending.pop()
+            self.fill(ident)
+            filled.append(ident)
+        return filled
+
+
+def generate_objects(type_ctx, root_type, size, seed = 0, max_list = 4, share = 0.5, grow = "root"):
+    #generate a random valid objects dict of roughly size objects, in the format accepted by ObjectContext
+    #share is the probability that a shared pointer reuses an existing object rather than creating a new one
+    #the document grows by appending to a pointer list whenever everything generated so far has been filled in, grow picks the object:
+    #"root" the root, for wide documents, "newest" the most recently made object with a pointer list, for deep unique trees,
+    #and "random" any object with a pointer list
+    assert grow in {"root", "newest", "random"}
+    rng = random.Random(seed)
+    gen = ObjectGenerator(type_ctx, rng, size, max_list, share)
+    objects = gen.objects
+
+    def pointer_lists(ident):
+        t = type_ctx._types[objects[ident]["type"]]
+        return [key for key, t_ptr in t.content.items() if t_ptr.kind == "list" and t_ptr.listed_type.kind == "ptr" and key in objects[ident]["content"]]
+
+    root = gen.new_object(root_type, REF_ROOT)
+    growable = [] #idents of objects with pointer lists, in the order they were filled
+    while True:
+        growable.extend(ident for ident in gen.fill_pending() if len(pointer_lists(ident)) != 0)
+        if len(objects) >= size or len(growable) == 0:
+            break
+        if grow == "root":
+            ident = root
+        elif grow == "newest":
+            ident = growable[-1]
+        else:
+            ident = rng.choice(growable)
+        key = rng.choice(pointer_lists(ident))
+        t = type_ctx._types[objects[ident]["type"]]
+        objects[ident]["content"][key].append(gen.value(t.content[key].listed_type))
+    return objects
+
+
+def generate_changes(type_ctx, objects, blocks, block_size = 8, seed = 0, max_list = 2, share = 0.5, max_new = 4):
+    #a random list of change blocks which are valid when applied in order to an ObjectContext of objects
+    #each block changes block_size random fields: basic values are replaced, optional fields set or unset, pointers replaced,
+    #and list items appended, removed or replaced, with roughly max_new new objects made for each change
+    #objects left unreachable by a block are removed explicitly at its end, as ChangeLog records them
+    rng = random.Random(seed)
+    mirror = ObjectContext(type_ctx, objects)
+    gen = ObjectGenerator(type_ctx, rng, 0, max_list, share, prefix = "g", existing = mirror._objects)
+    idents = sorted(mirror._objects)
+    positions = {ident : i for i, ident in enumerate(idents)}
+    for ident in idents:
+        obj = mirror._objects[ident]
+        if obj.reftypestr() == REF_SHARED:
+            gen.shared.setdefault(obj.typename, []).append(ident)
+
+    def new_value(t_ptr):
+        gen.size = gen.count + max_new
+        value = gen.value(t_ptr)
+        gen.fill_pending()
+        return value
+
+    def droppable(t_ptr, value):
+        #pointers are only dropped to leaves or to objects with other owners, otherwise a change near the top of a deep tree would remove most of the document
+        if t_ptr.kind != "ptr":
+            return True
+        target = mirror._objects[value]
+        return len(target.refs) == 0 or len(target.get_reverse_refs()) > 1
+
+    def random_action(t, key, content):
+        #None when the field is left alone
+        t_ptr = t.content[key]
+        if not key in content:
+            return {"opp" : "replace", "value" : new_value(t_ptr)}
+        if t_ptr.kind != "list":
+            if not droppable(t_ptr, content[key]):
+                return None
+            if t.optional[key] and rng.random() < 0.1:
+                return {"opp" : "unset"}
+            return {"opp" : "replace", "value" : new_value(t_ptr)}
+        n = len(content[key])
+        choice = rng.random() if n != 0 else 0
+        #appends are favoured since removals shrink the document
+        if choice < 0.6:
+            return {"opp" : "append", "value" : new_value(t_ptr.listed_type)}
+        idx = rng.randrange(n)
+        if not droppable(t_ptr.listed_type, content[key][idx]):
+            return None
+        if choice < 0.75:
+            return {"opp" : "remove", "idx" : idx}
+        return {"opp" : "modify", "idx" : idx, "action" : {"opp" : "replace", "value" : new_value(t_ptr.listed_type)}}
+
+    change_blocks = []
+    for _ in range(blocks):
+        gen.objects = {}
+        modifies = []
+        changed = set() #each field is changed at most once in a block so that list indices stay valid
+        for _ in range(block_size):
+            ident = rng.choice(idents)
+            obj = mirror._objects[ident]
+            t = obj.get_type()
+            if len(t.content) == 0:
+                continue
+            key = rng.choice(sorted(t.content))
+            if (ident, key) in changed:
+                continue
+            changed.add((ident, key))
+            action = random_action(t, key, obj.content)
+            if not action is None:
+                modifies.append({"opp" : "modify", "ident" : ident, "field" : key, "action" : action})
+        adds, sets = add_object_changes(type_ctx, gen.objects)
+        block = adds + sets + modifies
+        removed = mirror.apply_changes(block, incremental = True, collect = True, atomic = True)
+        block.extend({"opp" : "remove", "ident" : ident} for ident in sorted(removed))
+        change_blocks.append(block)
+
+        for ident in gen.objects:
+            if not ident in removed:
+                positions[ident] = len(idents)
+                idents.append(ident)
+        for ident in removed:
+            if ident in positions:
+                #swap the last ident into the removed one's place
+                i = positions.pop(ident)
+                last = idents.pop()
+                if last != ident:
+                    idents[i] = last
+                    positions[last] = i
+    return change_blocks
+
+
+SHAPES = {
+    #name -> (root type, generate_objects options), workloads for the types in structure.json
+    "deep_tree" : ("tree", {"max_list" : 2, "share" : 0.2, "grow" : "newest"}),
+    "wide_shared" : ("tree", {"max_list" : 64, "share" : 0.9, "grow" : "root"}),
+    "foo_bar_cycles" : ("foo", {"max_list" : 4, "share" : 0.8, "grow" : "random"}),
+}
+
+
+def run_benchmarks(type_ctx, shapes = SHAPES, sizes = (10000,), blocks = 200, block_size = 8, full_blocks = 10, repeat = 3, seed = 0):
+    #time ObjectContext construction, apply_changes, validate() and to_json(), and measure memory use, for each shape and size
+    #apply_changes is timed without validation and with incremental validation over all the blocks, and with full validation over the first full_blocks
+    #returns a json dict of the environment and a list of results, times are the best of repeat runs
+    results = []
+
+    def apply_all(change_blocks, **options):
+        def run(obj_ctx):
+            for block in change_blocks:
+                obj_ctx.apply_changes(block, **options)
+        return best(run, repeat, lambda: ObjectContext(type_ctx, objects))
+
+    for shape, (root_type, options) in shapes.items():
+        for size in sizes:
+            objects = generate_objects(type_ctx, root_type, size, seed = seed, **options)
+            changes = generate_changes(type_ctx, objects, blocks, block_size, seed = seed)
+            result = {"shape" : shape, "root_type" : root_type, "size" : size, "objects" : len(objects)}
+
+            def record(benchmark, seconds, count, unit):
+                results.append(dict(result, benchmark = benchmark, seconds = seconds, count = count, unit = unit, per_second = count / seconds))
+
+            record("construct", best(lambda: ObjectContext(type_ctx, objects), repeat), len(objects), "objects")
+            obj_ctx = ObjectContext(type_ctx, objects)
+            record("validate", best(obj_ctx.validate, repeat), len(objects), "objects")
+            record("to_json", best(obj_ctx.to_json, repeat), len(objects), "objects")
+            del obj_ctx
+            record("apply_changes", apply_all(changes, do_validate = False), len(changes), "blocks")
+            record("apply_changes_incremental", apply_all(changes, incremental = True), len(changes), "blocks")
+            record("apply_changes_full", apply_all(changes[:full_blocks]), len(changes[:full_blocks]), "blocks")
+
+            tracemalloc.start()
+            obj_ctx = ObjectContext(type_ctx, objects)
+            final_size, peak_size = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            del obj_ctx
+            results.append(dict(result, benchmark = "memory", bytes = final_size, peak_bytes = peak_size, bytes_per_object = final_size / len(objects)))
+
+    environment = {
+        "python" : sys.version,
+        "platform" : platform.platform(),
+        "cpu_count" : os.cpu_count(),
+        "time" : time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "blocks" : blocks,
+        "block_size" : block_size,
+        "repeat" : repeat,
+        "seed" : seed,
+    }
+    return {"environment" : environment, "results" : results}
+
+
+def benchmark_validators(type_ctx, root_type, size, repeat = 3):
+    #compare the compiled per-type validators against the interpreted TypePtr tree walk
+    obj_ctx = ObjectContext(type_ctx, generate_objects(type_ctx, root_type, size))
+    objs = list(obj_ctx._objects.values())
+
+    def interpreted():
+        for obj in objs:
+            obj.get_type().interpret_object(obj_ctx, obj.ident, obj.content)
+    def compiled():
+        for obj in objs:
+            obj.get_type().validate_object(obj_ctx, obj.ident, obj.content)
+
+    t_interpreted = best(interpreted, repeat)
+    t_compiled = best(compiled, repeat)
+    print(f"validated {len(objs)} objects: interpreted {t_interpreted:.3f}s, compiled {t_compiled:.3f}s, speedup {t_interpreted / t_compiled:.2f}x")
+
+
+def benchmark_loading(type_ctx, root_type, size):
+    #compare loading a whole objects.json with json.load against the streaming ObjectContext.load
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "objects.json")
+        with open(path, "w") as f:
+            json.dump(generate_objects(type_ctx, root_type, size), f)
+
+        def load_whole():
+            with open(path, "r") as f:
+                return ObjectContext(type_ctx, json.load(f))
+        def load_streaming():
+            with open(path, "r") as f:
+                return ObjectContext.load(type_ctx, f)
+
+        for name, load in [("json.load", load_whole), ("streaming", load_streaming)]:
+            start = time.perf_counter()
+            n = len(load()._objects)
+            elapsed = time.perf_counter() - start
+            tracemalloc.start()
+            obj_ctx = load()
+            final_size, peak_size = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            del obj_ctx
+            print(f"{name}: loaded {n} objects in {elapsed:.3f}s ({n / elapsed:.0f} objects/s), peak memory {peak_size / 2**20:.1f}MiB for a final graph of {final_size / 2**20:.1f}MiB")
+
+
+def benchmark_memory(type_ctx, root_type, size):
+    #memory used per object by an ObjectContext, compared with the plain dicts json.load produces for the same document
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "objects.json")
+        with open(path, "w") as f:
+            json.dump(generate_objects(type_ctx, root_type, size), f)
+
+        for name, load in [("json.load", json.load), ("ObjectContext.load", lambda f: ObjectContext.load(type_ctx, f))]:
+            with open(path, "r") as f:
+                tracemalloc.start()
+                start = time.perf_counter()
+                loaded = load(f)
+                elapsed = time.perf_counter() - start
+                final_size, peak_size = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+            n = len(loaded) if type(loaded) == dict else len(loaded._objects)
+            del loaded
+            print(f"{name}: {n} objects use {final_size / 2**20:.1f}MiB ({final_size / n:.0f} bytes per object), peak {peak_size / 2**20:.1f}MiB, {elapsed:.1f}s with tracemalloc")
+
+
+def benchmark_parallel_validation(type_ctx, root_type, size, process_counts = (1, 2, 4), repeat = 3):
+    #full validation time with the objects split across worker processes, against the serial path
+    obj_ctx = ObjectContext(type_ctx, generate_objects(type_ctx, root_type, size))
+    print(f"{len(obj_ctx._objects)} objects on {os.cpu_count()} cores")
+    for processes in process_counts:
+        seconds = best(lambda: obj_ctx.validate(processes = processes), repeat)
+        print(f"{processes} processes: {seconds:.2f}s ({len(obj_ctx._objects) / seconds:.0f} objects/s)")
+
+
+def benchmark_store(type_ctx, root_type, size, lookups = 1000, seed = 0):
+    #time to read the neighbourhoods of a few objects from an ObjectStore, against loading the whole document first
+    rng = random.Random(seed)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        json_path = os.path.join(tmp_dir, "objects.json")
+        store_path = os.path.join(tmp_dir, "objects.store")
+        obj_ctx = ObjectContext(type_ctx, generate_objects(type_ctx, root_type, size))
+        with open(json_path, "w") as f:
+            obj_ctx.write_json(f, compact = True)
+        ObjectStore.write(obj_ctx, store_path)
+        starts = rng.sample(sorted(obj_ctx._objects), lookups)
+        del obj_ctx
+
+        def neighbourhood(source, ident):
+            #the object, its owners and the objects it points at
+            typename, ref, content, owners = source._read(ident)
+            t = type_ctx._types[typename]
+            for other in list(owners) + [r for key, value in content.items() for r in t.content[key].get_refs(None, value)]:
+                source.get_content(other)
+
+        start = time.perf_counter()
+        with open(json_path, "r") as f:
+            obj_ctx = ObjectContext.load(type_ctx, f)
+        for ident in starts:
+            neighbourhood(obj_ctx, ident)
+        full_time = time.perf_counter() - start
+        del obj_ctx
+
+        start = time.perf_counter()
+        with ObjectStore(type_ctx, store_path) as store:
+            for ident in starts:
+                neighbourhood(store, ident)
+            loaded = store.misses
+        store_time = time.perf_counter() - start
+        print(f"{size} objects, {lookups} neighbourhoods: full load {full_time:.2f}s, object store {store_time:.3f}s loading {loaded} objects")
+
+
+def benchmark_closures(type_ctx, root_type, size, queries = 200, seed = 0):
+    #the info objects under random entities and the people connected to random people, found with closures,
+    #against walking the same links with get_content and get_shared_owners
+    rng = random.Random(seed)
+    obj_ctx = ObjectContext(type_ctx, generate_objects(type_ctx, root_type, size, seed = seed))
+    entities = rng.sample(sorted(obj_ctx.get_objects_of_type("entity")), queries)
+    people = rng.sample(sorted(obj_ctx.get_objects_of_type("person")), queries)
+    family = ["person", "partnership", "parent_ptr", "child_ptr"]
+
+    def walk(ident, forward, reverse, through, types):
+        found = set()
+        seen = set([ident])
+        boundary = [ident]
+        while len(boundary) != 0:
+            new_boundary = []
+            for b_ident in boundary:
+                links = []
+                if forward:
+                    t = type_ctx._types[obj_ctx._objects[b_ident].typename]
+                    for key, value in obj_ctx.get_content(b_ident).items():
+                        links.extend(t.content[key].get_refs(None, value))
+                if reverse and obj_ctx._objects[b_ident].reftypestr() == REF_SHARED:
+                    links.extend(obj_ctx.get_shared_owners(b_ident))
+                elif reverse and obj_ctx._objects[b_ident].reftypestr() == REF_UNIQUE:
+                    links.append(obj_ctx.get_unique_owner(b_ident))
+                for a_ident in links:
+                    if not a_ident in seen:
+                        seen.add(a_ident)
+                        if any(type_ctx.is_subtype(obj_ctx._objects[a_ident].typename, name) for name in types):
+                            found.add(a_ident)
+                        if through is None or any(type_ctx.is_subtype(obj_ctx._objects[a_ident].typename, name) for name in through):
+                            new_boundary.append(a_ident)
+            boundary = new_boundary
+        return found
+
+    def python_walks():
+        return [walk(ident, True, False, None, ["info"]) for ident in entities] + [walk(ident, True, True, family, ["person"]) for ident in people]
+
+    def closure_queries():
+        return list(obj_ctx.closures(entities, types = ["info"]).values()) + list(obj_ctx.closures(people, "both", ["person"], family).values())
+
+    start = time.perf_counter()
+    expected = python_walks()
+    walk_time = time.perf_counter() - start
+    start = time.perf_counter()
+    assert closure_queries() == expected
+    closure_time = time.perf_counter() - start
+    start = time.perf_counter()
+    closure_queries()
+    cached_time = time.perf_counter() - start
+    print(f"{2 * queries} queries over {len(obj_ctx._objects)} objects: python walks {walk_time:.3f}s, closures {closure_time:.3f}s, cached {cached_time:.4f}s")
+
+
+def stress_read_views(type_ctx, root_type, size, thread_counts = (1, 2, 4), duration = 2.0, seed = 0):
+    #reader threads check that ReadViews see exactly the state of the version they were opened at while a writer applies change blocks
+    #the changes made are basic field replacements and removals from pointer lists, with the removed objects garbage collected
+    obj_ctx = ObjectContext(type_ctx, generate_objects(type_ctx, root_type, size, seed = seed))
+    obj_ctx.enable_snapshots()
+
+    def random_block(rng):
+        block = []
+        idents = list(obj_ctx._objects)
+        for ident in set(rng.choice(idents) for _ in range(4)):
+            obj = obj_ctx._objects[ident]
+            t = obj.get_type()
+            for key in rng.sample(list(obj.content), len(obj.content)):
+                t_ptr = t.content[key]
+                if t_ptr.kind == "basic" and t_ptr.builtin_type == "str":
+                    block.append({"opp" : "modify", "ident" : ident, "field" : key, "action" : {"opp" : "replace", "value" : f"s{rng.randrange(1000)}"}})
+                    break
+                if t_ptr.kind == "list" and t_ptr.listed_type.kind == "ptr" and len(obj.content.get(key, [])) > 1:
+                    block.append({"opp" : "modify", "ident" : ident, "field" : key, "action" : {"opp" : "remove", "idx" : rng.randrange(len(obj.content[key]))}})
+                    break
+        return block
+
+    def state_json(view):
+        #view is a ReadView, or obj_ctx itself for the writer
+        if type(view) == ReadView:
+            return json.dumps({ident : view.to_json(ident) for ident in view.idents()}, sort_keys = True)
+        return json.dumps(view.to_json(), sort_keys = True)
+
+    for thread_count in thread_counts:
+        states = {obj_ctx._version : state_json(obj_ctx)} #version -> state recorded by the writer
+        stop = threading.Event()
+        errors = []
+        reads = [0] * thread_count
+        checked = [0] * thread_count
+
+        def writer():
+            rng = random.Random(seed)
+            try:
+                while not stop.is_set():
+                    obj_ctx.apply_changes(random_block(rng), collect = True)
+                    states[obj_ctx._version] = state_json(obj_ctx)
+            except Exception as e:
+                errors.append(e)
+                stop.set()
+            blocks.append(obj_ctx._version - start_version)
+
+        def reader(i):
+            rng = random.Random(i)
+            try:
+                while not stop.is_set():
+                    with obj_ctx.read_view() as view:
+                        #random point reads, then a full consistency check against the writer's record of the version
+                        idents = view.idents()
+                        for _ in range(1000):
+                            ident = rng.choice(idents)
+                            typename, ref, content, reverse_refs = view._read(ident)
+                            for owner in reverse_refs:
+                                assert owner in view
+                            reads[i] += 1
+                        state = state_json(view)
+                        while not view.get_version() in states and len(errors) == 0:
+                            time.sleep(0.001)
+                        assert state == states[view.get_version()], f"view of version {view.get_version()} differs from the state committed"
+                        checked[i] += 1
+            except Exception as e:
+                errors.append(e)
+                stop.set()
+
+        blocks = []
+        start_version = obj_ctx._version
+        threads = [threading.Thread(target = writer)] + [threading.Thread(target = reader, args = (i,)) for i in range(thread_count)]
+        for thread in threads:
+            thread.start()
+        time.sleep(duration)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        if len(errors) != 0:
+            raise errors[0]
+        #history no longer needed is dropped when the next block is committed
+        obj_ctx.apply_changes([])
+        assert len(obj_ctx._history) == 0 and len(obj_ctx._pinned) == 0
+        obj_ctx.validate()
+        print(f"{thread_count} readers: {sum(reads) / duration:.0f} reads/s, {sum(checked)} views checked, writer {blocks[0] / duration:.0f} blocks/s")
+
+
+
+if __name__ == "__main__":
+    type_ctx = TypeContext.load("structure.json")
+
+    if sys.argv[1:2] == ["benchmark-memory"]:
+        benchmark_memory(type_ctx, "tree", 1000000)
+    elif sys.argv[1:2] == ["benchmark-parallel"]:
+        benchmark_parallel_validation(type_ctx, "tree", 500000)
+    elif sys.argv[1:2] == ["benchmark-store"]:
+        benchmark_store(type_ctx, "tree", 200000)
+    elif sys.argv[1:2] == ["benchmark-closures"]:
+        benchmark_closures(type_ctx, "tree", 20000, 200)
+    elif sys.argv[1:2] == ["stress"]:
+        stress_read_views(type_ctx, "tree", 2000)
+    elif sys.argv[1:2] == ["benchmark-suite"]:
+        #results are written as json to the path given, or printed
+        results = run_benchmarks(type_ctx)
+        if len(sys.argv) > 2:
+            with open(sys.argv[2], "w") as f:
+                json.dump(results, f, indent = 2)
+        else:
+            print(json.dumps(results, indent = 2))
+    elif sys.argv[1:2] == ["benchmark"]:
+        benchmark_validators(type_ctx, "tree", 100000)
+        benchmark_loading(type_ctx, "tree", 50000)
+    else:
+        print("usage: python benchmarks.py benchmark | benchmark-memory | benchmark-parallel | benchmark-store | benchmark-closures | stress | benchmark-suite [path]")
@@ -0,0 +1,56 @@
+import importlib.util
+import json
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_structs():
+    #the library is the __init__.py at the top of the repository, so it is loaded by path rather than by package name
+    #it is registered in sys.modules so that the worker processes of parallel validation can find its functions
+    if "pointer_structs" in sys.modules:
+        return sys.modules["pointer_structs"]
+    spec = importlib.util.spec_from_file_location("pointer_structs", os.path.join(ROOT, "__init__.py"))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["pointer_structs"] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture(scope = "session")
+def structs():
+    return load_structs()
+
+
+@pytest.fixture(scope = "session")
+def type_ctx(structs, tmp_path_factory):
+    return structs.TypeContext.load(os.path.join(ROOT, "structure.json"), cache_dir = str(tmp_path_factory.mktemp("types")))
+
+
+def root_objects():
+    return {"0" : {"type" : "foo", "ref" : "root", "content" : {"bars" : ["b"]}}, "b" : {"type" : "bar", "ref" : "shared", "content" : {"foos" : []}}}
+
+
+def tree_objects():
+    return {
+        "0" : {"type" : "tree", "ref" : "root", "content" : {"entities" : ["p1", "p2", "m"]}},
+        "p1" : {"type" : "person", "ref" : "shared", "content" : {"infos" : ["d1"]}},
+        "d1" : {"type" : "date", "ref" : "unique", "content" : {"year" : "1900", "tags" : ["a", "b", "c"]}},
+        "p2" : {"type" : "person", "ref" : "shared", "content" : {"infos" : []}},
+        "m" : {"type" : "partnership", "ref" : "shared", "content" : {"infos" : [], "parents" : ["pp"], "children" : ["cp"]}},
+        "pp" : {"type" : "parent_ptr", "ref" : "unique", "content" : {"target" : "p1"}},
+        "cp" : {"type" : "child_ptr", "ref" : "unique", "content" : {"target" : "p2", "adopted" : False}},
+    }
+
+
+def object_state(obj_ctx):
+    #everything a block could change: the objects, their owners and refs and the type index
+    return json.dumps({
+        "objects" : obj_ctx.to_json(),
+        "owners" : {ident : sorted(obj.get_reverse_refs()) for ident, obj in obj_ctx._objects.items()},
+        "refs" : {ident : sorted(obj.refs) for ident, obj in obj_ctx._objects.items()},
+        "entities" : sorted(obj_ctx.get_objects_of_type("entity")),
+    }, sort_keys = True)
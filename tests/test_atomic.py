@@ -0,0 +1,42 @@
+import pytest
+
+from conftest import object_state, tree_objects
+
+
+FAILING_BLOCKS = [
+    #a unique object given a second owner
+    [{"opp" : "modify", "ident" : "p2", "field" : "infos", "action" : {"opp" : "append", "value" : "d1"}}],
+    #a pointer to an object of the wrong type
+    [{"opp" : "modify", "ident" : "pp", "field" : "target", "action" : {"opp" : "replace", "value" : "m"}}],
+    #a removed field which isn't optional
+    [{"opp" : "modify", "ident" : "cp", "field" : "adopted", "action" : {"opp" : "unset"}}],
+    #fails part way through applying the block, after changing lists, adding and removing objects
+    [{"opp" : "modify", "ident" : "d1", "field" : "tags", "action" : {"opp" : "remove", "idx" : 0}},
+     {"opp" : "add", "ident" : "s2", "object" : {"type" : "string", "ref" : "unique", "content" : {"string" : "y"}}},
+     {"opp" : "modify", "ident" : "m", "field" : "infos", "action" : {"opp" : "append", "value" : "s2"}},
+     {"opp" : "modify", "ident" : "m", "field" : "children", "action" : {"opp" : "remove", "idx" : 0}},
+     {"opp" : "remove", "ident" : "cp"},
+     {"opp" : "modify", "ident" : "missing", "field" : "infos", "action" : {"opp" : "append", "value" : "s2"}}],
+]
+
+
+def test_failed_atomic_block_restores_the_prior_state(structs, type_ctx):
+    obj_ctx = structs.ObjectContext(type_ctx, tree_objects())
+    obj_ctx.apply_changes([
+        {"opp" : "add", "ident" : "s1", "object" : {"type" : "string", "ref" : "unique", "content" : {"string" : "x"}}},
+        {"opp" : "modify", "ident" : "p2", "field" : "infos", "action" : {"opp" : "append", "value" : "s1"}},
+    ], atomic = True)
+    for block in FAILING_BLOCKS:
+        before = object_state(obj_ctx)
+        for options in [{}, {"incremental" : True}, {"collect" : True}]:
+            with pytest.raises(Exception):
+                obj_ctx.apply_changes(block, atomic = True, **options)
+            assert object_state(obj_ctx) == before
+    obj_ctx.validate()
+    #the rolled back blocks leave nothing for later blocks to trip over
+    obj_ctx.apply_changes([
+        {"opp" : "modify", "ident" : "d1", "field" : "tags", "action" : {"opp" : "remove", "idx" : 1}},
+        {"opp" : "modify", "ident" : "m", "field" : "children", "action" : {"opp" : "remove", "idx" : 0}},
+        {"opp" : "remove", "ident" : "cp"},
+    ], incremental = True, atomic = True)
+    assert obj_ctx.get_content("d1")["tags"] == ["a", "c"]
@@ -0,0 +1,73 @@
+import json
+
+from conftest import root_objects
+
+
+def record_file_events(structs, monkeypatch, events):
+    #record directory syncs and file removals of every ChangeLog in the order they happen
+    sync_dir = structs.ChangeLog._sync_dir
+    remove = structs.os.remove
+    def record_sync_dir(self):
+        events.append("sync")
+        sync_dir(self)
+    def record_remove(path):
+        events.append("remove")
+        remove(path)
+    monkeypatch.setattr(structs.ChangeLog, "_sync_dir", record_sync_dir)
+    monkeypatch.setattr(structs.os, "remove", record_remove)
+
+
+def test_directory_is_synced_before_old_files_are_removed(structs, type_ctx, tmp_path, monkeypatch):
+    events = []
+    record_file_events(structs, monkeypatch, events)
+    with structs.ChangeLog(type_ctx, str(tmp_path), root_objects()) as log:
+        #the initial snapshot and its log are synced into the directory
+        assert events == ["sync", "sync"]
+        log.apply_changes([{"opp" : "modify", "ident" : "0", "field" : "bars", "action" : {"opp" : "append", "value" : "b"}}])
+        del events[:]
+        log.snapshot()
+    #the new log is synced, then the new snapshot is synced before the old snapshot and log are removed
+    assert events == ["sync", "sync", "remove", "remove"]
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["log-1.jsonl", "snapshot-1.json"]
+
+
+def test_torn_tail_is_dropped_on_recovery(structs, type_ctx, tmp_path):
+    blocks = [[{"opp" : "modify", "ident" : "0", "field" : "bars", "action" : {"opp" : "append", "value" : "b"}}] for _ in range(3)]
+    with structs.ChangeLog(type_ctx, str(tmp_path), root_objects()) as log:
+        for block in blocks:
+            log.apply_changes(block)
+        expected = log.obj_ctx.to_json()
+    log_path = tmp_path / "log-0.jsonl"
+    size = log_path.stat().st_size
+    #a block whose write was cut short
+    with open(log_path, "a") as f:
+        f.write(json.dumps(blocks[0])[:-5])
+
+    with structs.ChangeLog(type_ctx, str(tmp_path)) as log:
+        assert log.obj_ctx.to_json() == expected
+        assert log_path.stat().st_size == size
+        #blocks applied after recovery follow on from the ones kept
+        log.apply_changes([{"opp" : "modify", "ident" : "0", "field" : "bars", "action" : {"opp" : "remove", "idx" : 0}}])
+        expected = log.obj_ctx.to_json()
+    with structs.ChangeLog(type_ctx, str(tmp_path)) as log:
+        assert log.obj_ctx.to_json() == expected
+        assert log.obj_ctx.get_content("0")["bars"] == ["b"] * 3
+
+
+def test_recovery_keeps_the_size_on_disk_of_crlf_lines(structs, type_ctx, tmp_path):
+    block = [{"opp" : "modify", "ident" : "0", "field" : "bars", "action" : {"opp" : "append", "value" : "b"}}]
+    with structs.ChangeLog(type_ctx, str(tmp_path), root_objects()) as log:
+        pass
+    #a log written with windows newlines, ending in a torn block
+    log_path = tmp_path / "log-0.jsonl"
+    with open(log_path, "wb") as f:
+        f.write((json.dumps(block) + "\r\n").encode() * 2)
+        size = f.tell()
+        f.write(json.dumps(block)[:-5].encode())
+
+    with structs.ChangeLog(type_ctx, str(tmp_path)) as log:
+        assert log.obj_ctx.get_content("0")["bars"] == ["b"] * 3
+        assert log_path.stat().st_size == size
+        log.apply_changes(block)
+    with structs.ChangeLog(type_ctx, str(tmp_path)) as log:
+        assert log.obj_ctx.get_content("0")["bars"] == ["b"] * 4
@@ -0,0 +1,44 @@
+def family_objects():
+    #a tree of two people joined by a partnership, with a nested info under the first
+    return {
+        "t" : {"type" : "tree", "ref" : "root", "content" : {"entities" : ["p1", "p2", "u"]}},
+        "p1" : {"type" : "person", "ref" : "shared", "content" : {"infos" : ["s"]}},
+        "s" : {"type" : "subinfo", "ref" : "unique", "content" : {"title" : "a", "infos" : ["n"]}},
+        "n" : {"type" : "string", "ref" : "unique", "content" : {"string" : "b"}},
+        "p2" : {"type" : "person", "ref" : "shared", "content" : {"infos" : []}},
+        "u" : {"type" : "partnership", "ref" : "shared", "content" : {"infos" : [], "parents" : ["pp"], "children" : ["cp"]}},
+        "pp" : {"type" : "parent_ptr", "ref" : "unique", "content" : {"target" : "p1"}},
+        "cp" : {"type" : "child_ptr", "ref" : "unique", "content" : {"target" : "p2", "adopted" : False}},
+    }
+
+
+FAMILY = ["person", "partnership", "parent_ptr", "child_ptr"]
+
+
+def test_closure_queries(structs, type_ctx):
+    obj_ctx = structs.ObjectContext(type_ctx, family_objects())
+    assert obj_ctx.closure("p1", types = ["info"]) == {"s", "n"}
+    assert obj_ctx.closure("p1", max_depth = 1) == {"s"}
+    assert obj_ctx.closure("n", "reverse") == {"s", "p1", "pp", "u", "t"}
+    assert obj_ctx.closures(["p1", "p2"], "both", ["person"], FAMILY) == {"p1" : {"p2"}, "p2" : {"p1"}}
+
+
+def test_cached_closures_are_dropped_when_links_change(structs, type_ctx):
+    obj_ctx = structs.ObjectContext(type_ctx, family_objects())
+    assert obj_ctx.closure("p1", types = ["info"]) == {"s", "n"}
+    obj_ctx.apply_changes([{"opp" : "modify", "ident" : "s", "field" : "infos", "action" : {"opp" : "remove", "idx" : 0}}], collect = True)
+    assert obj_ctx.closure("p1", types = ["info"]) == {"s"}
+
+
+def test_closure_cache_is_bounded_by_idents_examined(structs, type_ctx):
+    obj_ctx = structs.ObjectContext(type_ctx, family_objects())
+    obj_ctx.set_closure_cache(6, 4)
+    obj_ctx.closure("t")   #examines every object, so is too large to cache
+    assert len(obj_ctx._closures) == 0
+    obj_ctx.closure("p1")  #examines p1, s and n
+    obj_ctx.closure("pp")  #examines pp, p1, s and n, pushing out the least recently used
+    assert [key[0] for key in obj_ctx._closures] == ["pp"]
+    assert obj_ctx._closure_cache_used == sum(len(seen) for found, seen in obj_ctx._closures.values())
+    obj_ctx.set_closure_cache(0)
+    assert obj_ctx.closure("p1") == {"s", "n"}
+    assert len(obj_ctx._closures) == 0 and len(obj_ctx._closure_deps) == 0
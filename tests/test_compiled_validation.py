@@ -0,0 +1,53 @@
+import pytest
+
+from conftest import tree_objects
+
+
+def invalid_documents():
+    #(description, objects)
+    objects = tree_objects()
+    objects["d1"]["content"]["year"] = 1900
+    yield "a wrong basic type", objects
+    objects = tree_objects()
+    del objects["cp"]["content"]["adopted"]
+    yield "a missing required key", objects
+    objects = tree_objects()
+    objects["pp"]["content"]["target"] = "m"
+    yield "a pointer of the wrong type", objects
+    objects = tree_objects()
+    objects["d1"]["ref"] = "shared"
+    yield "a unique pointer to a shared object", objects
+    objects = tree_objects()
+    objects["d1"]["content"]["tags"] = "abc"
+    yield "a list which isn't a list", objects
+    objects = tree_objects()
+    objects["d1"]["content"]["tags"].append(1)
+    yield "a list item of the wrong type", objects
+
+
+def interpreted_error(obj_ctx, ident):
+    obj = obj_ctx._objects[ident]
+    try:
+        obj.get_type().interpret_object(obj_ctx, ident, obj.content)
+    except AssertionError:
+        raise
+    except Exception as e:
+        return str(e)
+    return None
+
+
+@pytest.mark.parametrize("objects", [objects for description, objects in invalid_documents()], ids = [description for description, objects in invalid_documents()])
+def test_compiled_validators_agree_with_interpreted(structs, type_ctx, objects):
+    obj_ctx = structs.ObjectContext(type_ctx, objects, do_validate = False)
+    errors = {}
+    for ident, obj in obj_ctx._objects.items():
+        error = interpreted_error(obj_ctx, ident)
+        assert obj.get_type().check(obj_ctx._objects, ident, obj.content) == (error is None), ident
+        if not error is None:
+            errors[ident] = error
+    assert len(errors) != 0
+    #the error raised is the interpreted one for the first invalid object, never the assert that the two disagree
+    with pytest.raises(Exception) as info:
+        obj_ctx.validate()
+    assert type(info.value) == Exception
+    assert str(info.value) == next(iter(errors.values()))
@@ -0,0 +1,37 @@
+import copy
+import json
+
+
+def root_objects():
+    return {"0" : {"type" : "foo", "ref" : "root", "content" : {"bars" : []}}}
+
+
+def test_applying_a_block_leaves_it_unchanged(structs, type_ctx):
+    block = [
+        {"opp" : "add", "ident" : "Y", "object" : {"type" : "foo", "ref" : "shared", "content" : {"bars" : []}}},
+        {"opp" : "add", "ident" : "X", "object" : {"type" : "bar", "ref" : "shared", "content" : {"foos" : []}}},
+        {"opp" : "modify", "ident" : "0", "field" : "bars", "action" : {"opp" : "append", "value" : "X"}},
+        {"opp" : "modify", "ident" : "X", "field" : "foos", "action" : {"opp" : "append", "value" : "Y"}},
+    ]
+    original = copy.deepcopy(block)
+    first = structs.ObjectContext(type_ctx, root_objects())
+    first.apply_changes(block)
+    assert block == original
+    second = structs.ObjectContext(type_ctx, root_objects())
+    second.apply_changes(block)
+    assert second.get_content("X")["foos"] == ["Y"]
+    assert json.dumps(first.to_json(), sort_keys = True) == json.dumps(second.to_json(), sort_keys = True)
+
+
+def test_objects_given_to_the_constructor_are_not_kept(structs, type_ctx):
+    objects = {
+        "0" : {"type" : "foo", "ref" : "root", "content" : {"bars" : ["b"]}},
+        "b" : {"type" : "bar", "ref" : "shared", "content" : {"foos" : []}},
+    }
+    original = copy.deepcopy(objects)
+    obj_ctx = structs.ObjectContext(type_ctx, objects)
+    obj_ctx.apply_changes([
+        {"opp" : "modify", "ident" : "0", "field" : "bars", "action" : {"opp" : "remove", "idx" : 0}},
+        {"opp" : "remove", "ident" : "b"},
+    ])
+    assert objects == original
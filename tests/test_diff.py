@@ -0,0 +1,46 @@
+import json
+
+from conftest import tree_objects
+
+
+def json_state(obj_ctx):
+    return json.dumps(obj_ctx.to_json(), sort_keys = True)
+
+
+def changed_objects():
+    #tree_objects with a unique object replaced by one of another type, a person replaced, and new objects pointing at each other
+    objects = tree_objects()
+    objects["p1"]["content"]["infos"] = ["d2"]
+    del objects["d1"]
+    objects["d2"] = {"type" : "subinfo", "ref" : "unique", "content" : {"title" : "t", "infos" : ["s1"]}}
+    objects["s1"] = {"type" : "string", "ref" : "unique", "content" : {"string" : "x"}}
+    objects["0"]["content"]["entities"] = ["p1", "m", "p3"]
+    objects["p3"] = {"type" : "person", "ref" : "shared", "content" : {"infos" : []}}
+    objects["m"]["content"]["children"] = ["cp"]
+    objects["cp"]["content"]["target"] = "p3"
+    del objects["p2"]
+    return objects
+
+
+def test_diff_objects_round_trips(structs, type_ctx):
+    old = structs.ObjectContext(type_ctx, tree_objects())
+    new = structs.ObjectContext(type_ctx, changed_objects())
+    for a, b in [(old, new), (new, old)]:
+        target = structs.ObjectContext(type_ctx, a.to_json())
+        target.apply_changes(structs.diff_objects(a, b), atomic = True)
+        assert json_state(target) == json_state(b)
+    assert structs.diff_objects(old, structs.ObjectContext(type_ctx, tree_objects())) == []
+
+
+def test_diff_objects_between_versions_round_trips(structs, type_ctx):
+    obj_ctx = structs.ObjectContext(type_ctx, tree_objects())
+    obj_ctx.enable_snapshots()
+    with obj_ctx.read_view() as before:
+        start = json_state(obj_ctx)
+        obj_ctx.apply_changes(structs.diff_objects(obj_ctx, structs.ObjectContext(type_ctx, changed_objects())))
+        obj_ctx.apply_changes([{"opp" : "modify", "ident" : "d2", "field" : "title", "action" : {"opp" : "replace", "value" : "u"}}])
+        end = json_state(obj_ctx)
+        for a, b, a_state, b_state in [(before, obj_ctx, start, end), (obj_ctx, before, end, start)]:
+            target = structs.ObjectContext(type_ctx, json.loads(a_state))
+            target.apply_changes(structs.diff_objects(a, b), atomic = True)
+            assert json_state(target) == b_state
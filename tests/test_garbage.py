@@ -0,0 +1,47 @@
+from conftest import tree_objects
+
+
+def foo_bar_objects():
+    return {
+        "0" : {"type" : "foo", "ref" : "root", "content" : {"bars" : ["b"]}},
+        "b" : {"type" : "bar", "ref" : "shared", "content" : {"foos" : ["f"]}},
+        "f" : {"type" : "foo", "ref" : "shared", "content" : {"bars" : []}},
+    }
+
+
+def test_collect_skips_targets_removed_in_the_block(structs, type_ctx):
+    obj_ctx = structs.ObjectContext(type_ctx, foo_bar_objects())
+    block = [
+        {"opp" : "remove", "ident" : "f"},
+        {"opp" : "modify", "ident" : "0", "field" : "bars", "action" : {"opp" : "replace", "value" : []}},
+    ]
+    removed = obj_ctx.apply_changes(block, collect = True)
+    assert removed == {"b"}
+    assert set(obj_ctx._objects) == {"0"}
+    obj_ctx.validate()
+
+
+def test_collect_removes_orphaned_cycles(structs, type_ctx):
+    objects = foo_bar_objects()
+    objects["f"]["content"]["bars"] = ["b"]
+    obj_ctx = structs.ObjectContext(type_ctx, objects)
+    removed = obj_ctx.apply_changes([{"opp" : "modify", "ident" : "0", "field" : "bars", "action" : {"opp" : "remove", "idx" : 0}}], collect = True)
+    assert removed == {"b", "f"}
+    assert set(obj_ctx._objects) == {"0"}
+    obj_ctx.validate()
+
+
+def test_collect_follows_dangling_targets_of_collected_objects(structs, type_ctx):
+    obj_ctx = structs.ObjectContext(type_ctx, tree_objects())
+    #cp is collected with m, and still points at p2, which the block removed
+    block = [
+        {"opp" : "modify", "ident" : "0", "field" : "entities", "action" : {"opp" : "remove", "idx" : 2}},
+        {"opp" : "modify", "ident" : "0", "field" : "entities", "action" : {"opp" : "remove", "idx" : 1}},
+        {"opp" : "remove", "ident" : "p2"},
+    ]
+    removed = obj_ctx.apply_changes(block, incremental = True, collect = True, atomic = True)
+    assert removed == {"m", "pp", "cp"}
+    #p1 is kept since the root still owns it, although the collected pp pointed at it
+    assert set(obj_ctx._objects) == {"0", "p1", "d1"}
+    assert obj_ctx.get_shared_owners("p1") == {"0"}
+    obj_ctx.validate()
@@ -0,0 +1,135 @@
+import json
+
+import pytest
+
+
+STRUCTURE = [
+    {"type" : "box", "content" : {"things" : {"kind" : "list", "optional" : False, "type" : {"kind" : "ptr", "unique" : True, "type" : "thing"}}}},
+    {"type" : "thing", "content" : {
+        "name" : {"kind" : "basic", "optional" : True, "type" : "str"},
+        "size" : {"kind" : "basic", "optional" : False, "type" : "int"},
+    }},
+    {"type" : "big", "super" : ["thing"]},
+]
+
+
+def thing(typename, size, name = None):
+    content = {"size" : size}
+    if not name is None:
+        content["name"] = name
+    return {"type" : typename, "ref" : "unique", "content" : content}
+
+
+def box_objects():
+    return {
+        "0" : {"type" : "box", "ref" : "root", "content" : {"things" : ["a", "b", "c", "d"]}},
+        "a" : thing("thing", 3, "x"),
+        "b" : thing("big", 1, "y"),
+        "c" : thing("thing", 2, "x"),
+        "d" : thing("big", 3),
+    }
+
+
+def assert_indexes_match(obj_ctx):
+    #every index agrees with a scan of the objects
+    for (typename, field), index in obj_ctx._field_indexes.items():
+        expected = {}
+        for ident in obj_ctx.get_objects_of_type(typename):
+            content = obj_ctx.get_content(ident)
+            if field in content:
+                expected.setdefault(content[field], set()).add(ident)
+        assert {value : set(idents) for value, idents in index.idents.items()} == expected
+        for value, idents in expected.items():
+            assert obj_ctx.find(typename, field, value) == idents
+        if index.ordered:
+            assert obj_ctx.find_range(typename, field) == [ident for value in sorted(expected) for ident in sorted(expected[value])]
+
+
+@pytest.fixture(scope = "module")
+def box_type_ctx(structs):
+    return structs.TypeContext(STRUCTURE)
+
+
+def test_index_covers_subtypes(structs, box_type_ctx):
+    obj_ctx = structs.ObjectContext(box_type_ctx, box_objects())
+    assert obj_ctx.get_objects_of_type("thing") == {"a", "b", "c", "d"}
+    assert obj_ctx.get_objects_of_type("big") == {"b", "d"}
+    obj_ctx.add_index("thing", "size")
+    obj_ctx.add_index("big", "size")
+    assert obj_ctx.find("thing", "size", 3) == {"a", "d"}
+    assert obj_ctx.find("big", "size", 3) == {"d"}
+    assert obj_ctx.find("big", "size", 2) == set()
+    with pytest.raises(Exception):
+        obj_ctx.add_index("thing", "size")
+    with pytest.raises(Exception):
+        obj_ctx.add_index("box", "things")
+    #unordered indexes don't answer range queries
+    with pytest.raises(Exception):
+        obj_ctx.find_range("thing", "size")
+
+    obj_ctx.remove_index("thing", "size")
+    with pytest.raises(Exception):
+        obj_ctx.find("thing", "size", 3)
+    #the subtype's own index is still kept up to date
+    obj_ctx.apply_changes([{"opp" : "modify", "ident" : "b", "field" : "size", "action" : {"opp" : "replace", "value" : 3}}])
+    assert obj_ctx.find("big", "size", 3) == {"b", "d"}
+    assert_indexes_match(obj_ctx)
+
+
+def test_find_range_is_ordered_by_value(structs, box_type_ctx):
+    obj_ctx = structs.ObjectContext(box_type_ctx, box_objects())
+    obj_ctx.add_index("thing", "size", ordered = True)
+    obj_ctx.add_index("thing", "name", ordered = True)
+    assert obj_ctx.find_range("thing", "size") == ["b", "c", "a", "d"]
+    assert obj_ctx.find_range("thing", "size", 2) == ["c", "a", "d"]
+    assert obj_ctx.find_range("thing", "size", None, 2) == ["b", "c"]
+    assert obj_ctx.find_range("thing", "size", 2, 2) == ["c"]
+    assert obj_ctx.find_range("thing", "size", 4) == []
+    #objects without the optional field aren't indexed
+    assert obj_ctx.find_range("thing", "name") == ["a", "c", "b"]
+
+
+def test_indexes_follow_changes(structs, box_type_ctx):
+    obj_ctx = structs.ObjectContext(box_type_ctx, box_objects())
+    obj_ctx.add_index("thing", "size", ordered = True)
+    obj_ctx.add_index("thing", "name")
+    obj_ctx.add_index("big", "name", ordered = True)
+    assert_indexes_match(obj_ctx)
+
+    blocks = [
+        [{"opp" : "modify", "ident" : "a", "field" : "size", "action" : {"opp" : "replace", "value" : 5}}],
+        [{"opp" : "modify", "ident" : "b", "field" : "name", "action" : {"opp" : "unset"}}],
+        [{"opp" : "modify", "ident" : "d", "field" : "name", "action" : {"opp" : "replace", "value" : "z"}}],
+        [{"opp" : "add", "ident" : "e", "object" : thing("big", 2, "x")},
+         {"opp" : "modify", "ident" : "0", "field" : "things", "action" : {"opp" : "append", "value" : "e"}}],
+        [{"opp" : "modify", "ident" : "0", "field" : "things", "action" : {"opp" : "remove", "idx" : 0}},
+         {"opp" : "remove", "ident" : "a"}],
+    ]
+    for block in blocks:
+        obj_ctx.apply_changes(block)
+        assert_indexes_match(obj_ctx)
+    assert obj_ctx.find("thing", "name", "x") == {"c", "e"}
+    assert obj_ctx.find_range("big", "name") == ["e", "d"]
+
+    #objects removed by garbage collection leave the indexes
+    obj_ctx.apply_changes([{"opp" : "modify", "ident" : "0", "field" : "things", "action" : {"opp" : "remove", "idx" : 0}}], do_validate = False)
+    assert obj_ctx.collect_garbage() == {"b"}
+    assert_indexes_match(obj_ctx)
+    assert obj_ctx.find_range("thing", "size") == ["c", "e", "d"]
+
+    #a rolled back block leaves the indexes as they were
+    before = json.dumps(obj_ctx.to_json(), sort_keys = True)
+    indexes = {key : {value : set(idents) for value, idents in index.idents.items()} for key, index in obj_ctx._field_indexes.items()}
+    with pytest.raises(Exception):
+        obj_ctx.apply_changes([
+            {"opp" : "modify", "ident" : "c", "field" : "size", "action" : {"opp" : "replace", "value" : 7}},
+            {"opp" : "modify", "ident" : "e", "field" : "name", "action" : {"opp" : "unset"}},
+            {"opp" : "add", "ident" : "f", "object" : thing("thing", 7, "x")},
+            {"opp" : "modify", "ident" : "0", "field" : "things", "action" : {"opp" : "append", "value" : "f"}},
+            {"opp" : "modify", "ident" : "0", "field" : "things", "action" : {"opp" : "remove", "idx" : 0}},
+            {"opp" : "remove", "ident" : "c"},
+            {"opp" : "modify", "ident" : "d", "field" : "size", "action" : {"opp" : "replace", "value" : "big"}},
+        ], atomic = True)
+    assert json.dumps(obj_ctx.to_json(), sort_keys = True) == before
+    assert {key : {value : set(idents) for value, idents in index.idents.items()} for key, index in obj_ctx._field_indexes.items()} == indexes
+    assert_indexes_match(obj_ctx)
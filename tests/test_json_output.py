@@ -0,0 +1,68 @@
+import io
+import json
+import os
+
+from conftest import ROOT, object_state, tree_objects
+
+
+def contexts(structs, type_ctx):
+    #the test tree, and the repository's objects with its changes applied
+    yield structs.ObjectContext(type_ctx, tree_objects())
+    with open(os.path.join(ROOT, "objects.json"), "r") as f:
+        obj_ctx = structs.ObjectContext(type_ctx, json.load(f))
+    with open(os.path.join(ROOT, "changes.json"), "r") as f:
+        for block in json.load(f):
+            obj_ctx.apply_changes(block)
+    yield obj_ctx
+
+
+def test_iter_json_matches_json_dumps(structs, type_ctx):
+    for obj_ctx in contexts(structs, type_ctx):
+        assert "".join(obj_ctx.iter_json()) == json.dumps(obj_ctx.to_json(), indent = 2)
+        assert "".join(obj_ctx.iter_json(compact = True)) == json.dumps(obj_ctx.to_json())
+        assert str(obj_ctx) == json.dumps(obj_ctx.to_json(), indent = 2)
+        f = io.StringIO()
+        obj_ctx.write_json(f, compact = True)
+        assert f.getvalue() == json.dumps(obj_ctx.to_json())
+    empty = structs.ObjectContext.__new__(structs.ObjectContext)
+    empty._setup(type_ctx)
+    assert "".join(empty.iter_json()) == json.dumps({}, indent = 2)
+    assert "".join(empty.iter_json(compact = True)) == json.dumps({})
+
+
+def test_ndjson_round_trip(structs, type_ctx):
+    for obj_ctx in contexts(structs, type_ctx):
+        f = io.StringIO()
+        obj_ctx.write_json(f, ndjson = True)
+        lines = f.getvalue().splitlines()
+        assert len(lines) == len(obj_ctx._objects)
+        assert [json.loads(line) for line in lines] == list(obj_ctx.to_json().values())
+        f.seek(0)
+        loaded = structs.ObjectContext.load(type_ctx, f, chunk_size = 2, ndjson = True)
+        assert object_state(loaded) == object_state(obj_ctx)
+
+
+def test_read_view_writes_the_same_json(structs, type_ctx):
+    obj_ctx = structs.ObjectContext(type_ctx, tree_objects())
+    obj_ctx.enable_snapshots()
+    expected = json.dumps(obj_ctx.to_json())
+    with obj_ctx.read_view() as view:
+        obj_ctx.apply_changes([{"opp" : "modify", "ident" : "d1", "field" : "tags", "action" : {"opp" : "append", "value" : "d"}}])
+        f = io.StringIO()
+        view.write_json(f, compact = True)
+    assert json.loads(f.getvalue()) == json.loads(expected)
+
+
+def test_subgraph_export(structs, type_ctx):
+    obj_ctx = structs.ObjectContext(type_ctx, tree_objects())
+    objects = obj_ctx.to_json()
+    for ident, reachable in [("m", {"m", "pp", "cp", "p1", "d1", "p2"}), ("p1", {"p1", "d1"}), ("d1", {"d1"})]:
+        exported = json.loads("".join(obj_ctx.iter_json(ident = ident)))
+        assert exported == {i : objects[i] for i in reachable}
+        #the export starts with the object asked for, in breadth first order
+        assert next(iter(exported)) == ident
+        f = io.StringIO()
+        obj_ctx.write_json(f, ndjson = True, ident = ident)
+        assert [json.loads(line)["id"] for line in f.getvalue().splitlines()] == list(exported)
+    #the root's subgraph is everything
+    assert json.loads("".join(obj_ctx.iter_json(ident = "0"))) == objects
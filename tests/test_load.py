@@ -0,0 +1,46 @@
+import io
+import json
+
+import pytest
+
+from conftest import object_state, tree_objects
+
+
+def test_load_resolves_forward_references_across_chunks(structs, type_ctx):
+    expected = structs.ObjectContext(type_ctx, tree_objects())
+    #the root comes first and points forward at every other object, and cp points back at p2
+    text = json.dumps(tree_objects())
+    for chunk_size in [1, 2, 3, 1000]:
+        obj_ctx = structs.ObjectContext.load(type_ctx, io.StringIO(text), chunk_size = chunk_size)
+        assert object_state(obj_ctx) == object_state(expected)
+        #and it's as usable as one built by the constructor
+        obj_ctx.apply_changes([
+            {"opp" : "modify", "ident" : "m", "field" : "children", "action" : {"opp" : "remove", "idx" : 0}},
+            {"opp" : "remove", "ident" : "cp"},
+        ], incremental = True)
+
+
+def test_load_reports_a_pointer_never_resolved(structs, type_ctx):
+    objects = tree_objects()
+    del objects["d1"]
+    for chunk_size in [1, 1000]:
+        with pytest.raises(Exception, match = "pointer to object with id \"d1\" not found"):
+            structs.ObjectContext.load(type_ctx, io.StringIO(json.dumps(objects)), chunk_size = chunk_size)
+
+
+def test_load_rejects_duplicate_idents(structs, type_ctx):
+    text = json.dumps(tree_objects())[:-1] + ", \"p2\": " + json.dumps(tree_objects()["p2"]) + "}"
+    for chunk_size in [1, 1000]:
+        with pytest.raises(Exception):
+            structs.ObjectContext.load(type_ctx, io.StringIO(text), chunk_size = chunk_size)
+
+
+def test_iter_json_items_across_read_boundaries(structs):
+    doc = {"a" : list(range(300)), "b" : {"c" : "x" * 100, "d" : [1.5, True, None, -2e10]}, "e" : 12345, "f" : ""}
+    for text in [json.dumps(doc), json.dumps(doc, indent = 2), json.dumps(doc, separators = (",", ":"))]:
+        for read_size in [1, 2, 7, 1 << 16]:
+            assert list(structs.iter_json_items(io.StringIO(text), read_size)) == list(doc.items())
+    assert list(structs.iter_json_items(io.StringIO(" { } "), 1)) == []
+    for text in ["", "[]", "{\"a\" 1}", "{\"a\" : 1", "{1 : 2}", "{\"a\" : [1, 2}"]:
+        with pytest.raises(Exception):
+            list(structs.iter_json_items(io.StringIO(text), 2))
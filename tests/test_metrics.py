@@ -0,0 +1,94 @@
+import pytest
+
+from conftest import tree_objects
+
+
+def recording_metrics(structs):
+    #Metrics on a timer which ticks by one on each call, with every traced span kept
+    ticks = iter(range(1000000))
+    traced = []
+    metrics = structs.Metrics(timer = lambda: next(ticks), tracer = lambda name, start, end: traced.append((name, start, end)))
+    return metrics, traced
+
+
+def test_block_spans_and_counts(structs, type_ctx):
+    obj_ctx = structs.ObjectContext(type_ctx, tree_objects())
+    metrics, traced = recording_metrics(structs)
+    assert obj_ctx.enable_metrics(metrics) is metrics
+    obj_ctx.apply_changes([
+        {"opp" : "add", "ident" : "s1", "object" : {"type" : "string", "ref" : "unique", "content" : {"string" : "x"}}},
+        {"opp" : "modify", "ident" : "p2", "field" : "infos", "action" : {"opp" : "append", "value" : "s1"}},
+        {"opp" : "modify", "ident" : "cp", "field" : "adopted", "action" : {"opp" : "replace", "value" : True}},
+        {"opp" : "modify", "ident" : "m", "field" : "children", "action" : {"opp" : "remove", "idx" : 0}},
+        {"opp" : "remove", "ident" : "cp"},
+    ])
+    assert set(metrics.latencies) == {
+        "block", "opp.add", "opp.remove", "opp.modify.append", "opp.modify.replace", "opp.modify.remove",
+        "change_content.list", "change_content.basic", "update_refs", "commit", "validate.contents", "validate.reachability",
+    }
+    assert metrics.latencies["opp.modify.append"].count == 1
+    assert metrics.latencies["block"].count == 1
+    assert metrics.counts == {"blocks" : 1, "objects_added" : 1, "objects_removed" : 1}
+    assert metrics.sizes["block.changes"].to_json()["total"] == 5
+    assert metrics.sizes["block.objects_touched"].to_json()["total"] == len({"s1", "p2", "cp", "m"})
+
+    #the tracer sees every span recorded, each ending after it starts and the block ending last
+    assert sorted(set(name for name, start, end in traced)) == sorted(metrics.latencies)
+    assert len(traced) == sum(histogram.count for histogram in metrics.latencies.values())
+    assert all(start < end for name, start, end in traced)
+    assert traced[-1][0] == "block"
+    assert sum(end - start for name, start, end in traced if name == "block") == metrics.latencies["block"].total
+
+    obj_ctx.apply_changes([{"opp" : "modify", "ident" : "d1", "field" : "tags", "action" : {"opp" : "append", "value" : "d"}}], incremental = True)
+    assert "validate.incremental.contents" in metrics.latencies
+    assert metrics.sizes["validate.incremental.objects"].count == 1
+    obj_ctx.closure("m")
+    obj_ctx.closure("m")
+    assert (metrics.counts["closure_misses"], metrics.counts["closure_hits"]) == (1, 1)
+
+
+def test_failed_blocks_are_counted(structs, type_ctx):
+    obj_ctx = structs.ObjectContext(type_ctx, tree_objects())
+    metrics = obj_ctx.enable_metrics()
+    for atomic in [True, False]:
+        with pytest.raises(Exception):
+            obj_ctx.apply_changes([
+                {"opp" : "modify", "ident" : "d1", "field" : "tags", "action" : {"opp" : "append", "value" : "d"}},
+                {"opp" : "modify", "ident" : "missing", "field" : "tags", "action" : {"opp" : "append", "value" : "d"}},
+            ], atomic = atomic)
+        assert metrics.touched == set() and metrics.refs_touched == 0
+    assert metrics.counts["blocks"] == metrics.counts["blocks_failed"] == 2
+    assert metrics.sizes["block.objects_touched"].count == 2
+
+
+def test_touched_is_counted_for_every_committed_block(structs, type_ctx):
+    obj_ctx = structs.ObjectContext(type_ctx, tree_objects())
+    metrics = obj_ctx.enable_metrics()
+    obj_ctx.add_objects({"X" : {"type" : "person", "ref" : "shared", "content" : {"infos" : []}}})
+    assert metrics.touched == set() and metrics.refs_touched == 0
+    assert obj_ctx.collect_garbage() == {"X"}
+    assert metrics.touched == set() and metrics.refs_touched == 0
+    obj_ctx.apply_changes([{"opp" : "modify", "ident" : "cp", "field" : "target", "action" : {"opp" : "replace", "value" : "p1"}}])
+    #one size for each of the three blocks, and the last only counts what it touched itself
+    touched = metrics.sizes["block.objects_touched"]
+    assert touched.count == 3
+    assert touched.total == 1 + 1 + len({"cp", "p1", "p2"})
+    assert metrics.sizes["block.refs_touched"].total == 2
+    assert "collect_garbage" in metrics.latencies
+
+
+def test_disabled_metrics_record_nothing(structs, type_ctx):
+    obj_ctx = structs.ObjectContext(type_ctx, tree_objects())
+    metrics = obj_ctx.enable_metrics()
+    other = structs.ObjectContext(type_ctx, tree_objects())
+    #a Metrics may be shared between contexts
+    assert other.enable_metrics(metrics) is metrics
+    block = [{"opp" : "modify", "ident" : "d1", "field" : "tags", "action" : {"opp" : "append", "value" : "d"}}]
+    obj_ctx.apply_changes(block)
+    other.apply_changes(block)
+    assert metrics.counts["blocks"] == 2
+    obj_ctx.disable_metrics()
+    obj_ctx.apply_changes(block)
+    assert metrics.counts["blocks"] == 2
+    metrics.reset()
+    assert metrics.counts == {} and metrics.latencies == {} and metrics.sizes == {}
@@ -0,0 +1,80 @@
+import pytest
+
+from conftest import tree_objects
+
+
+def assert_matches(store, obj_ctx):
+    assert len(store) == len(obj_ctx._objects)
+    assert store.idents() == sorted(obj_ctx._objects)
+    assert store.get_root() == obj_ctx.get_root()
+    for ident, obj in obj_ctx._objects.items():
+        assert ident in store
+        assert store.get_content(ident) == obj_ctx.get_content(ident)
+        for key in obj.content:
+            assert store[ident, key] == obj_ctx[ident, key]
+        assert store.get_type(ident) == obj_ctx.get_type(ident)
+        assert store.get_types(ident) == obj_ctx.get_types(ident)
+        assert store.get_refs(ident) == obj.get_refs()
+        assert store.to_json(ident) == obj.to_json()
+        if obj.to_json()["ref"] == "unique":
+            assert store.get_unique_owner(ident) == obj_ctx.get_unique_owner(ident)
+            with pytest.raises(Exception):
+                store.get_shared_owners(ident)
+        elif obj.to_json()["ref"] == "shared":
+            assert store.get_shared_owners(ident) == obj_ctx.get_shared_owners(ident)
+            with pytest.raises(Exception):
+                store.get_unique_owner(ident)
+
+
+def test_store_round_trip(structs, type_ctx, tmp_path):
+    obj_ctx = structs.ObjectContext(type_ctx, tree_objects())
+    obj_ctx.enable_snapshots()
+    path = str(tmp_path / "objects.store")
+    structs.ObjectStore.write(obj_ctx, path)
+    with structs.ObjectStore(type_ctx, path) as store:
+        assert_matches(store, obj_ctx)
+
+    #a read view is saved as it was when taken, whatever happens after
+    view = obj_ctx.read_view()
+    expected = structs.ObjectContext(type_ctx, obj_ctx.to_json())
+    obj_ctx.apply_changes([
+        {"opp" : "modify", "ident" : "m", "field" : "children", "action" : {"opp" : "remove", "idx" : 0}},
+        {"opp" : "remove", "ident" : "cp"},
+        {"opp" : "modify", "ident" : "d1", "field" : "tags", "action" : {"opp" : "append", "value" : "d"}},
+    ])
+    with view:
+        structs.ObjectStore.write(view, path)
+    with structs.ObjectStore(type_ctx, path) as store:
+        assert_matches(store, expected)
+
+
+def test_missing_ident(structs, type_ctx, tmp_path):
+    obj_ctx = structs.ObjectContext(type_ctx, tree_objects())
+    path = str(tmp_path / "objects.store")
+    structs.ObjectStore.write(obj_ctx, path)
+    with structs.ObjectStore(type_ctx, path) as store:
+        #idents either side of every stored one in sorted order
+        for ident in ["", "00", "a", "p", "p3", "zz"]:
+            assert not ident in store
+            with pytest.raises(KeyError):
+                store.get_content(ident)
+            with pytest.raises(KeyError):
+                store.get_refs(ident)
+        assert store.misses == 0
+
+
+def test_cache_size_bounds_the_loaded_objects(structs, type_ctx, tmp_path):
+    obj_ctx = structs.ObjectContext(type_ctx, tree_objects())
+    path = str(tmp_path / "objects.store")
+    structs.ObjectStore.write(obj_ctx, path)
+    with structs.ObjectStore(type_ctx, path, cache_size = 2) as store:
+        for ident in ["p1", "p2", "p1", "m"]:
+            store.get_content(ident)
+        assert (store.hits, store.misses) == (1, 3)
+        assert len(store._cache) == 2
+        #p2 was the least recently used, so it was evicted and p1 kept
+        store.get_content("p1")
+        assert (store.hits, store.misses) == (2, 3)
+        store.get_content("p2")
+        assert (store.hits, store.misses) == (2, 4)
+        assert list(store._cache) == ["p1", "p2"]
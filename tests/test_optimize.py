@@ -0,0 +1,99 @@
+import json
+import os
+
+from conftest import ROOT, object_state, tree_objects
+
+
+def assert_same_result(structs, type_ctx, changes, optimized):
+    expected = structs.ObjectContext(type_ctx, tree_objects())
+    expected.apply_changes(changes)
+    result = structs.ObjectContext(type_ctx, tree_objects())
+    result.apply_changes(optimized)
+    assert object_state(result) == object_state(expected)
+
+
+def test_run_of_modifies_is_folded_from_its_last_replace(structs, type_ctx):
+    changes = [
+        {"opp" : "modify", "ident" : "d1", "field" : "tags", "action" : {"opp" : "append", "value" : "x"}},
+        {"opp" : "modify", "ident" : "d1", "field" : "tags", "action" : {"opp" : "replace", "value" : ["y"]}},
+        {"opp" : "modify", "ident" : "d1", "field" : "tags", "action" : {"opp" : "replace", "value" : ["a"]}},
+        {"opp" : "modify", "ident" : "d1", "field" : "tags", "action" : {"opp" : "append", "value" : "b"}},
+        {"opp" : "modify", "ident" : "d1", "field" : "tags", "action" : {"opp" : "remove", "idx" : 0}},
+        {"opp" : "modify", "ident" : "d1", "field" : "tags", "action" : {"opp" : "append", "value" : "c"}},
+        {"opp" : "modify", "ident" : "d1", "field" : "year", "action" : {"opp" : "replace", "value" : "1901"}},
+    ]
+    before = json.dumps(changes)
+    optimized = structs.optimize_changes(changes)
+    assert optimized == [
+        {"opp" : "modify", "ident" : "d1", "field" : "tags", "action" : {"opp" : "replace", "value" : ["b", "c"]}},
+        {"opp" : "modify", "ident" : "d1", "field" : "year", "action" : {"opp" : "replace", "value" : "1901"}},
+    ]
+    assert json.dumps(changes) == before
+    assert_same_result(structs, type_ctx, changes, optimized)
+    #without a replace, or the field's value to start from, the run is kept as it is
+    assert structs.optimize_changes(changes[:1] + changes[3:6]) == changes[:1] + changes[3:6]
+
+
+def test_added_then_removed_object_is_dropped(structs, type_ctx):
+    changes = [
+        {"opp" : "add", "ident" : "s1", "object" : {"type" : "string", "ref" : "unique", "content" : {"string" : "x"}}},
+        {"opp" : "modify", "ident" : "s1", "field" : "string", "action" : {"opp" : "replace", "value" : "y"}},
+        {"opp" : "modify", "ident" : "d1", "field" : "year", "action" : {"opp" : "replace", "value" : "1901"}},
+        {"opp" : "remove", "ident" : "s1"},
+    ]
+    optimized = structs.optimize_changes(changes)
+    assert optimized == [changes[2]]
+    assert_same_result(structs, type_ctx, changes, optimized)
+
+
+def test_added_then_removed_object_is_kept_when_mentioned_in_between(structs, type_ctx):
+    changes = [
+        {"opp" : "add", "ident" : "s1", "object" : {"type" : "string", "ref" : "unique", "content" : {"string" : "x"}}},
+        {"opp" : "modify", "ident" : "p2", "field" : "infos", "action" : {"opp" : "append", "value" : "s1"}},
+        {"opp" : "modify", "ident" : "d1", "field" : "year", "action" : {"opp" : "replace", "value" : "s1"}},
+        {"opp" : "modify", "ident" : "p2", "field" : "infos", "action" : {"opp" : "remove", "idx" : 0}},
+        {"opp" : "remove", "ident" : "s1"},
+    ]
+    #a string merely equal to the ident counts as a mention too, as the optimizer doesn't know the types
+    without_pointer = changes[:1] + changes[2:3] + changes[4:]
+    assert structs.optimize_changes(without_pointer) == without_pointer
+    without_string = changes[:2] + changes[3:]
+    optimized = structs.optimize_changes(without_string)
+    assert optimized == without_string
+    assert_same_result(structs, type_ctx, without_string, optimized)
+
+
+def test_no_op_run_is_dropped_given_the_object_context(structs, type_ctx):
+    obj_ctx = structs.ObjectContext(type_ctx, tree_objects())
+    changes = [
+        {"opp" : "modify", "ident" : "d1", "field" : "tags", "action" : {"opp" : "append", "value" : "d"}},
+        {"opp" : "modify", "ident" : "d1", "field" : "tags", "action" : {"opp" : "remove", "idx" : 3}},
+        {"opp" : "modify", "ident" : "d1", "field" : "year", "action" : {"opp" : "replace", "value" : "1900"}},
+        {"opp" : "modify", "ident" : "cp", "field" : "adopted", "action" : {"opp" : "replace", "value" : True}},
+    ]
+    assert structs.optimize_changes(changes, obj_ctx) == changes[3:]
+    assert structs.optimize_changes(changes) == changes
+    #once the object has been changed earlier in the list its value in obj_ctx is no longer the one the run starts from
+    changed_first = [
+        {"opp" : "modify", "ident" : "d1", "field" : "tags", "action" : {"opp" : "replace", "value" : ["d", "e", "f"]}},
+        changes[3],
+    ] + changes[:2]
+    optimized = structs.optimize_changes(changed_first, obj_ctx)
+    assert optimized == changed_first
+    assert_same_result(structs, type_ctx, changed_first, optimized)
+
+
+def test_compacted_change_log_applies_to_the_same_state(structs, type_ctx):
+    with open(os.path.join(ROOT, "objects.json"), "r") as f:
+        objects = json.load(f)
+    with open(os.path.join(ROOT, "changes.json"), "r") as f:
+        blocks = json.load(f)
+    expected = structs.ObjectContext(type_ctx, objects)
+    for block in blocks:
+        expected.apply_changes(block)
+    for obj_ctx_given in [False, True]:
+        result = structs.ObjectContext(type_ctx, objects)
+        compacted = structs.compact_changes(blocks, result if obj_ctx_given else None)
+        assert len(compacted) < sum(len(block) for block in blocks)
+        result.apply_changes(compacted)
+        assert result.to_json() == expected.to_json()
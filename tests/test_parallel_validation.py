@@ -0,0 +1,56 @@
+import multiprocessing
+
+import pytest
+
+from conftest import tree_objects
+
+
+pytestmark = pytest.mark.skipif(not "fork" in multiprocessing.get_all_start_methods(), reason = "parallel validation forks its workers")
+
+
+def validation_errors(structs, type_ctx, objects):
+    #the messages from the serial and the parallel validation of objects, with chunks and levels small enough to use the workers
+    messages = []
+    for validate in [lambda obj_ctx: obj_ctx.validate(), lambda obj_ctx: obj_ctx._validate_parallel(2, chunk_size = 2, min_level_size = 1)]:
+        obj_ctx = structs.ObjectContext(type_ctx, objects, do_validate = False)
+        with pytest.raises(Exception) as info:
+            validate(obj_ctx)
+        messages.append(str(info.value))
+    return messages
+
+
+def test_parallel_validation_matches_serial(structs, type_ctx):
+    serial = structs.ObjectContext(type_ctx, tree_objects())
+    parallel = structs.ObjectContext(type_ctx, tree_objects(), do_validate = False)
+    parallel._validate_parallel(2, chunk_size = 2, min_level_size = 1)
+    for ident, obj in parallel._objects.items():
+        assert obj.rank == serial._objects[ident].rank
+        if ident != parallel.get_root():
+            assert obj.support in obj.get_reverse_refs()
+            assert parallel._objects[obj.support].rank == obj.rank - 1
+    #the supports found are good enough for incremental validation to carry on from
+    parallel.apply_changes([
+        {"opp" : "modify", "ident" : "m", "field" : "children", "action" : {"opp" : "remove", "idx" : 0}},
+        {"opp" : "remove", "ident" : "cp"},
+    ], incremental = True)
+    with pytest.raises(Exception):
+        parallel.apply_changes([{"opp" : "modify", "ident" : "0", "field" : "entities", "action" : {"opp" : "remove", "idx" : 2}}], incremental = True)
+
+
+def test_parallel_validation_reports_the_serial_error(structs, type_ctx):
+    #objects left unreachable, in different chunks
+    objects = tree_objects()
+    objects["p3"] = {"type" : "person", "ref" : "shared", "content" : {"infos" : []}}
+    objects["p4"] = {"type" : "person", "ref" : "shared", "content" : {"infos" : []}}
+    serial, parallel = validation_errors(structs, type_ctx, objects)
+    assert serial == parallel == "object with id p3 is not reachable from the root object"
+
+    #invalid contents in different chunks
+    objects = tree_objects()
+    objects["d1"]["content"]["year"] = 1900
+    del objects["cp"]["content"]["adopted"]
+    serial, parallel = validation_errors(structs, type_ctx, objects)
+    assert serial == parallel
+    del objects["d1"]["content"]["year"]
+    serial, parallel = validation_errors(structs, type_ctx, objects)
+    assert serial == parallel == "content is missing non-optional key adopted"
@@ -0,0 +1,58 @@
+import pytest
+
+
+def cycle_objects():
+    #the root points at b1 and b2, which both point at f, which points back at b1
+    return {
+        "0" : {"type" : "foo", "ref" : "root", "content" : {"bars" : ["b1", "b2"]}},
+        "b1" : {"type" : "bar", "ref" : "shared", "content" : {"foos" : ["f"]}},
+        "b2" : {"type" : "bar", "ref" : "shared", "content" : {"foos" : ["f"]}},
+        "f" : {"type" : "foo", "ref" : "shared", "content" : {"bars" : ["b1"]}},
+    }
+
+
+def remove_bar(idx):
+    return {"opp" : "modify", "ident" : "0", "field" : "bars", "action" : {"opp" : "remove", "idx" : idx}}
+
+
+def check_supports(obj_ctx):
+    for ident, obj in obj_ctx._objects.items():
+        if ident == obj_ctx.get_root():
+            assert obj.rank == 0
+        else:
+            assert obj.support in obj.get_reverse_refs()
+            assert obj_ctx._objects[obj.support].rank < obj.rank
+
+
+def test_losing_an_owner_other_than_the_support_is_not_rechecked(structs, type_ctx):
+    obj_ctx = structs.ObjectContext(type_ctx, cycle_objects())
+    f = obj_ctx._objects["f"]
+    other = "b2" if f.support == "b1" else "b1"
+    obj_ctx.apply_changes([{"opp" : "modify", "ident" : other, "field" : "foos", "action" : {"opp" : "remove", "idx" : 0}}], do_validate = False)
+    assert len(obj_ctx._unrooted) == 0
+    obj_ctx.validate(incremental = True)
+    check_supports(obj_ctx)
+
+
+def test_support_moves_to_another_owner(structs, type_ctx):
+    obj_ctx = structs.ObjectContext(type_ctx, cycle_objects())
+    obj_ctx.apply_changes([remove_bar(0)], incremental = True)
+    assert set(obj_ctx._objects) == {"0", "b1", "b2", "f"}
+    check_supports(obj_ctx)
+
+
+def test_orphaned_cycle_fails_incremental_validation(structs, type_ctx):
+    obj_ctx = structs.ObjectContext(type_ctx, cycle_objects())
+    with pytest.raises(Exception, match = "not reachable"):
+        obj_ctx.apply_changes([remove_bar(1), remove_bar(0)], incremental = True, atomic = True)
+    assert obj_ctx.to_json() == structs.ObjectContext(type_ctx, cycle_objects()).to_json()
+    check_supports(obj_ctx)
+    assert obj_ctx.apply_changes([remove_bar(1), remove_bar(0)], incremental = True, collect = True) == {"b1", "b2", "f"}
+    check_supports(obj_ctx)
+
+
+def test_unvalidated_context_is_ranked_by_incremental_validation(structs, type_ctx):
+    obj_ctx = structs.ObjectContext(type_ctx, cycle_objects(), do_validate = False)
+    obj_ctx.validate(incremental = True)
+    check_supports(obj_ctx)
+    assert obj_ctx._objects["f"].rank == 2
@@ -0,0 +1,46 @@
+import pytest
+
+from conftest import tree_objects
+
+
+def tags_change(action):
+    return {"opp" : "modify", "ident" : "d1", "field" : "tags", "action" : action}
+
+
+def test_rebase_changes_shifts_list_indices(structs, type_ctx):
+    base = structs.ObjectContext(type_ctx, tree_objects())
+    #both made against the tags ["a", "b", "c"]
+    first = [tags_change({"opp" : "remove", "idx" : 0}), tags_change({"opp" : "append", "value" : "x"})]
+    second = [
+        tags_change({"opp" : "modify", "idx" : 2, "action" : {"opp" : "replace", "value" : "C"}}),
+        tags_change({"opp" : "append", "value" : "d"}),
+        tags_change({"opp" : "remove", "idx" : 1}),
+    ]
+    rebased = structs.rebase_changes(base, first, second)
+    assert rebased == [
+        tags_change({"opp" : "modify", "idx" : 1, "action" : {"opp" : "replace", "value" : "C"}}),
+        tags_change({"opp" : "append", "value" : "d"}),
+        tags_change({"opp" : "remove", "idx" : 0}),
+    ]
+    base.apply_changes(first + rebased)
+    assert base.get_content("d1")["tags"] == ["C", "x", "d"]
+
+
+def test_rebase_changes_drops_changes_made_by_both(structs, type_ctx):
+    base = structs.ObjectContext(type_ctx, tree_objects())
+    first = [tags_change({"opp" : "remove", "idx" : 1})]
+    #removing "b" is dropped, and "c" is at index 1 once first has removed "b"
+    assert structs.rebase_changes(base, first, [tags_change({"opp" : "remove", "idx" : 1}), tags_change({"opp" : "remove", "idx" : 1})]) == [tags_change({"opp" : "remove", "idx" : 1})]
+
+
+def test_rebase_changes_conflicts(structs, type_ctx):
+    base = structs.ObjectContext(type_ctx, tree_objects())
+    with pytest.raises(structs.ChangeConflict):
+        #both change the same element
+        structs.rebase_changes(base, [tags_change({"opp" : "modify", "idx" : 0, "action" : {"opp" : "replace", "value" : "x"}})], [tags_change({"opp" : "modify", "idx" : 0, "action" : {"opp" : "replace", "value" : "y"}})])
+    with pytest.raises(structs.ChangeConflict):
+        #the element changed was removed
+        structs.rebase_changes(base, [tags_change({"opp" : "remove", "idx" : 2})], [tags_change({"opp" : "modify", "idx" : 2, "action" : {"opp" : "replace", "value" : "y"}})])
+    with pytest.raises(structs.ChangeConflict):
+        #points at a removed object
+        structs.rebase_changes(base, [{"opp" : "modify", "ident" : "0", "field" : "entities", "action" : {"opp" : "remove", "idx" : 1}}, {"opp" : "remove", "ident" : "p2"}], [{"opp" : "modify", "ident" : "pp", "field" : "target", "action" : {"opp" : "replace", "value" : "p2"}}])
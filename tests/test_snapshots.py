@@ -0,0 +1,138 @@
+import json
+import sys
+import threading
+import time
+
+import pytest
+
+from conftest import object_state, root_objects, tree_objects
+
+
+def view_state(view):
+    #object_state of the objects in a ReadView
+    states = {ident : view._read(ident) for ident in view.idents()}
+    types = view._obj_ctx._type_ctx._types
+    return json.dumps({
+        "objects" : {ident : view.to_json(ident) for ident in states},
+        "owners" : {ident : sorted(state[3]) for ident, state in states.items()},
+        "refs" : {ident : sorted(set(r for key, value in state[2].items() for r in types[state[0]].content[key].get_refs(None, value))) for ident, state in states.items()},
+        "entities" : sorted(ident for ident, state in states.items() if view._obj_ctx._type_ctx.is_subtype(state[0], "entity")),
+    }, sort_keys = True)
+
+
+def test_add_objects_is_seen_by_new_views_and_subscribers(structs, type_ctx):
+    obj_ctx = structs.ObjectContext(type_ctx, root_objects())
+    obj_ctx.enable_snapshots()
+    events = []
+    obj_ctx.subscribe(events.append)
+    with obj_ctx.read_view() as before:
+        obj_ctx.add_objects({"X" : {"type" : "bar", "ref" : "shared", "content" : {"foos" : []}}})
+        with obj_ctx.read_view() as after:
+            assert "X" in after and not "X" in before
+    assert [event.added for event in events] == [{"X" : "bar"}]
+
+
+def test_collect_garbage_is_seen_by_new_views_and_subscribers(structs, type_ctx):
+    obj_ctx = structs.ObjectContext(type_ctx, root_objects())
+    obj_ctx.enable_snapshots()
+    obj_ctx.apply_changes([{"opp" : "modify", "ident" : "0", "field" : "bars", "action" : {"opp" : "remove", "idx" : 0}}], do_validate = False)
+    events = []
+    obj_ctx.subscribe(events.append)
+    with obj_ctx.read_view() as before:
+        assert obj_ctx.collect_garbage() == {"b"}
+        with obj_ctx.read_view() as after:
+            assert "b" in before and not "b" in after
+    assert [event.removed for event in events] == [{"b" : "bar"}]
+
+
+def test_read_view_keeps_its_version(structs, type_ctx):
+    obj_ctx = structs.ObjectContext(type_ctx, root_objects())
+    obj_ctx.enable_snapshots()
+    with obj_ctx.read_view() as view:
+        obj_ctx.apply_changes([{"opp" : "modify", "ident" : "0", "field" : "bars", "action" : {"opp" : "append", "value" : "b"}}])
+        assert view.get_content("0")["bars"] == ["b"]
+    assert obj_ctx.get_content("0")["bars"] == ["b", "b"]
+
+
+def test_read_views_undo_in_place_list_edits(structs, type_ctx):
+    obj_ctx = structs.ObjectContext(type_ctx, tree_objects())
+    obj_ctx.enable_snapshots()
+    views = []
+    blocks = [
+        [{"opp" : "modify", "ident" : "d1", "field" : "tags", "action" : {"opp" : "append", "value" : "d"}}],
+        [{"opp" : "modify", "ident" : "d1", "field" : "tags", "action" : {"opp" : "remove", "idx" : 0}},
+         {"opp" : "modify", "ident" : "d1", "field" : "tags", "action" : {"opp" : "modify", "idx" : 1, "action" : {"opp" : "replace", "value" : "C"}}}],
+        [{"opp" : "modify", "ident" : "d1", "field" : "year", "action" : {"opp" : "unset"}},
+         {"opp" : "modify", "ident" : "d1", "field" : "tags", "action" : {"opp" : "replace", "value" : ["x"]}}],
+        #replaces a person with an object of the same ident
+        [{"opp" : "modify", "ident" : "m", "field" : "children", "action" : {"opp" : "remove", "idx" : 0}},
+         {"opp" : "remove", "ident" : "cp"},
+         {"opp" : "modify", "ident" : "0", "field" : "entities", "action" : {"opp" : "remove", "idx" : 1}},
+         {"opp" : "remove", "ident" : "p2"},
+         {"opp" : "add", "ident" : "p2", "object" : {"type" : "partnership", "ref" : "shared", "content" : {"infos" : [], "parents" : [], "children" : []}}},
+         {"opp" : "modify", "ident" : "0", "field" : "entities", "action" : {"opp" : "append", "value" : "p2"}}],
+    ]
+    for block in blocks:
+        views.append((obj_ctx.read_view(), object_state(obj_ctx)))
+        #a rolled back block leaves records which views have to undo as well
+        with pytest.raises(Exception):
+            obj_ctx.apply_changes(block + [{"opp" : "modify", "ident" : "missing", "field" : "infos", "action" : {"opp" : "unset"}}], atomic = True)
+        obj_ctx.apply_changes(block, atomic = True)
+    for view, state in views:
+        with view:
+            assert view_state(view) == state
+    obj_ctx.apply_changes([])
+    assert len(obj_ctx._history) == 0
+
+
+def test_read_views_against_a_concurrent_writer(structs, type_ctx):
+    obj_ctx = structs.ObjectContext(type_ctx, tree_objects())
+    obj_ctx.enable_snapshots()
+    cycle = [
+        [{"opp" : "modify", "ident" : "d1", "field" : "tags", "action" : {"opp" : "append", "value" : "d"}},
+         {"opp" : "modify", "ident" : "cp", "field" : "adopted", "action" : {"opp" : "replace", "value" : True}}],
+        [{"opp" : "add", "ident" : "s1", "object" : {"type" : "string", "ref" : "unique", "content" : {"string" : "x"}}},
+         {"opp" : "modify", "ident" : "p2", "field" : "infos", "action" : {"opp" : "append", "value" : "s1"}},
+         {"opp" : "modify", "ident" : "d1", "field" : "tags", "action" : {"opp" : "remove", "idx" : 0}}],
+        [{"opp" : "modify", "ident" : "p2", "field" : "infos", "action" : {"opp" : "remove", "idx" : 0}},
+         {"opp" : "remove", "ident" : "s1"},
+         {"opp" : "modify", "ident" : "cp", "field" : "target", "action" : {"opp" : "replace", "value" : "p1"}}],
+        [{"opp" : "modify", "ident" : "d1", "field" : "tags", "action" : {"opp" : "replace", "value" : ["a", "b", "c"]}},
+         {"opp" : "modify", "ident" : "cp", "field" : "target", "action" : {"opp" : "replace", "value" : "p2"}},
+         {"opp" : "modify", "ident" : "cp", "field" : "adopted", "action" : {"opp" : "replace", "value" : False}}],
+    ]
+    #version -> state, written only by this thread, which is the writer
+    committed = {obj_ctx._version : object_state(obj_ctx)}
+    seen = []
+    done = threading.Event()
+    errors = []
+
+    def read():
+        try:
+            while not done.is_set():
+                with obj_ctx.read_view() as view:
+                    seen.append((view.get_version(), view_state(view)))
+        except BaseException as e:
+            errors.append(e)
+
+    readers = [threading.Thread(target = read) for _ in range(2)]
+    #switch threads often so that reads land part way through blocks being applied
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-5)
+    for reader in readers:
+        reader.start()
+    try:
+        for _ in range(50):
+            for block in cycle:
+                obj_ctx.apply_changes(block)
+                committed[obj_ctx._version] = object_state(obj_ctx)
+                time.sleep(0) #let the readers in between blocks as well
+    finally:
+        done.set()
+        for reader in readers:
+            reader.join()
+        sys.setswitchinterval(switch_interval)
+    assert errors == []
+    assert len(seen) != 0
+    for version, state in seen:
+        assert state == committed[version]
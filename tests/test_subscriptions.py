@@ -0,0 +1,92 @@
+import pytest
+
+from conftest import tree_objects
+
+
+def test_event_describes_the_block(structs, type_ctx):
+    obj_ctx = structs.ObjectContext(type_ctx, tree_objects())
+    events = []
+    obj_ctx.subscribe(events.append)
+    obj_ctx.apply_changes([
+        {"opp" : "modify", "ident" : "d1", "field" : "tags", "action" : {"opp" : "append", "value" : "d"}},
+        {"opp" : "modify", "ident" : "d1", "field" : "year", "action" : {"opp" : "replace", "value" : "1900"}},
+        {"opp" : "add", "ident" : "s1", "object" : {"type" : "string", "ref" : "unique", "content" : {"string" : "x"}}},
+        {"opp" : "modify", "ident" : "p2", "field" : "infos", "action" : {"opp" : "append", "value" : "s1"}},
+        {"opp" : "modify", "ident" : "cp", "field" : "target", "action" : {"opp" : "replace", "value" : "p1"}},
+    ])
+    [event] = events
+    assert event.version == obj_ctx._version
+    assert event.added == {"s1" : "string"} and event.removed == {}
+    #replacing year with the same value is not a change
+    assert event.modified == {"d1" : {"tags"}, "p2" : {"infos"}, "cp" : {"target"}}
+    assert event.owners == {"p1" : ({"cp"}, set()), "p2" : (set(), {"cp"})}
+
+
+def test_event_reports_a_retyped_object_as_removed_and_added(structs, type_ctx):
+    obj_ctx = structs.ObjectContext(type_ctx, tree_objects())
+    events = []
+    obj_ctx.subscribe(events.append)
+    obj_ctx.apply_changes([
+        {"opp" : "modify", "ident" : "p1", "field" : "infos", "action" : {"opp" : "remove", "idx" : 0}},
+        {"opp" : "remove", "ident" : "d1"},
+        {"opp" : "add", "ident" : "d1", "object" : {"type" : "string", "ref" : "unique", "content" : {"string" : "x"}}},
+        {"opp" : "modify", "ident" : "p1", "field" : "infos", "action" : {"opp" : "append", "value" : "d1"}},
+    ])
+    [event] = events
+    assert event.removed == {"d1" : "date"} and event.added == {"d1" : "string"}
+    assert event.modified == {"p1" : {"infos"}}
+    assert event.owners == {}
+
+
+BLOCK = [
+    {"opp" : "modify", "ident" : "d1", "field" : "tags", "action" : {"opp" : "append", "value" : "d"}},
+    {"opp" : "add", "ident" : "s1", "object" : {"type" : "string", "ref" : "unique", "content" : {"string" : "x"}}},
+    {"opp" : "modify", "ident" : "p2", "field" : "infos", "action" : {"opp" : "append", "value" : "s1"}},
+    {"opp" : "modify", "ident" : "cp", "field" : "target", "action" : {"opp" : "replace", "value" : "p1"}},
+]
+
+
+def events_for(structs, type_ctx, block, **filters):
+    obj_ctx = structs.ObjectContext(type_ctx, tree_objects())
+    events = []
+    obj_ctx.subscribe(events.append, **filters)
+    obj_ctx.apply_changes(block)
+    return [(event.added, event.removed, event.modified, event.owners) for event in events]
+
+
+def test_subscription_filters(structs, type_ctx):
+    assert events_for(structs, type_ctx, BLOCK, idents = ["d1", "p1"]) == [({}, {}, {"d1" : {"tags"}}, {"p1" : ({"cp"}, set())})]
+    #entity matches its sub type person, but not the string added
+    assert events_for(structs, type_ctx, BLOCK, types = ["entity"]) == [({}, {}, {"p2" : {"infos"}}, {"p1" : ({"cp"}, set()), "p2" : (set(), {"cp"})})]
+    assert events_for(structs, type_ctx, BLOCK, types = ["info"]) == [({"s1" : "string"}, {}, {"d1" : {"tags"}}, {})]
+    #owners aren't fields, so a fields filter leaves them out
+    assert events_for(structs, type_ctx, BLOCK, fields = ["target"]) == [({}, {}, {"cp" : {"target"}}, {})]
+    assert events_for(structs, type_ctx, BLOCK, types = ["person"], fields = ["infos", "tags"]) == [({}, {}, {"p2" : {"infos"}}, {})]
+    #nothing matching, so no event at all
+    assert events_for(structs, type_ctx, BLOCK, idents = ["m"]) == []
+    assert events_for(structs, type_ctx, BLOCK, types = ["partnership"]) == []
+
+
+def test_removed_object_reports_owners_lost(structs, type_ctx):
+    block = [
+        {"opp" : "modify", "ident" : "m", "field" : "children", "action" : {"opp" : "remove", "idx" : 0}},
+        {"opp" : "remove", "ident" : "cp"},
+    ]
+    assert events_for(structs, type_ctx, block) == [({}, {"cp" : "child_ptr"}, {"m" : {"children"}}, {"p2" : (set(), {"cp"})})]
+    assert events_for(structs, type_ctx, block, types = ["child_ptr"]) == [({}, {"cp" : "child_ptr"}, {}, {})]
+
+
+def test_no_event_for_rolled_back_or_closed(structs, type_ctx):
+    obj_ctx = structs.ObjectContext(type_ctx, tree_objects())
+    events = []
+    obj_ctx.subscribe(events.append)
+    closed = []
+    with obj_ctx.subscribe(closed.append):
+        pass
+    with pytest.raises(Exception):
+        obj_ctx.apply_changes(BLOCK + [{"opp" : "modify", "ident" : "p2", "field" : "infos", "action" : {"opp" : "append", "value" : "d1"}}], atomic = True)
+    assert events == []
+    #nothing from the rolled back block leaks into the next event
+    obj_ctx.apply_changes([{"opp" : "modify", "ident" : "cp", "field" : "adopted", "action" : {"opp" : "replace", "value" : True}}])
+    assert [(event.added, event.removed, event.modified, event.owners) for event in events] == [({}, {}, {"cp" : {"adopted"}}, {})]
+    assert closed == []
@@ -0,0 +1,57 @@
+import copy
+import json
+import os
+
+import pytest
+
+from conftest import ROOT, tree_objects
+
+
+def invalid_documents():
+    #a wrong basic type
+    objects = tree_objects()
+    objects["d1"]["content"]["year"] = 1900
+    yield objects
+    #a missing required key
+    objects = tree_objects()
+    del objects["cp"]["content"]["adopted"]
+    yield objects
+    #a pointer to an object of the wrong type
+    objects = tree_objects()
+    objects["pp"]["content"]["target"] = "m"
+    yield objects
+
+
+def validation_error(structs, type_ctx, objects):
+    with pytest.raises(Exception) as info:
+        structs.ObjectContext(type_ctx, objects)
+    return str(info.value)
+
+
+def test_cached_type_context_matches_a_built_one(structs, tmp_path):
+    path = os.path.join(ROOT, "structure.json")
+    built_metrics = structs.Metrics()
+    built = structs.TypeContext.load(path, cache_dir = str(tmp_path), metrics = built_metrics)
+    assert set(built_metrics.latencies) == {"type_context.build"}
+    cached_metrics = structs.Metrics()
+    cached = structs.TypeContext.load(path, cache_dir = str(tmp_path), metrics = cached_metrics)
+    assert set(cached_metrics.latencies) == {"type_context.cache_load"}
+    assert cached_metrics.latencies["type_context.cache_load"].count == 1
+
+    assert cached.compiled() == built.compiled()
+    for name in ["info", "entity", "person", "tree"]:
+        assert cached.get_super_types(name) == built.get_super_types(name)
+        assert cached.get_sub_types(name) == built.get_sub_types(name)
+    for objects in invalid_documents():
+        assert validation_error(structs, cached, objects) == validation_error(structs, built, objects)
+    structs.ObjectContext(cached, tree_objects()).validate()
+
+
+def test_construction_leaves_the_structure_unchanged(structs, tmp_path):
+    with open(os.path.join(ROOT, "structure.json"), "r") as f:
+        structure = json.load(f)
+    before = copy.deepcopy(structure)
+    type_ctx = structs.TypeContext(structure)
+    assert structure == before
+    structs.TypeContext(structure, type_ctx.compiled())
+    assert structure == before
@@ -0,0 +1,42 @@
+import pytest
+
+from conftest import object_state, tree_objects
+
+
+BLOCKS = [
+    #(change block, whether it is valid)
+    ([{"opp" : "add", "ident" : "s1", "object" : {"type" : "string", "ref" : "unique", "content" : {"string" : "x"}}},
+      {"opp" : "modify", "ident" : "p2", "field" : "infos", "action" : {"opp" : "append", "value" : "s1"}}], True),
+    #a unique object given a second owner
+    ([{"opp" : "modify", "ident" : "p2", "field" : "infos", "action" : {"opp" : "append", "value" : "d1"}}], False),
+    #a pointer to an object of the wrong type
+    ([{"opp" : "modify", "ident" : "pp", "field" : "target", "action" : {"opp" : "replace", "value" : "m"}}], False),
+    #a removed field which isn't optional
+    ([{"opp" : "modify", "ident" : "cp", "field" : "adopted", "action" : {"opp" : "unset"}}], False),
+    ([{"opp" : "modify", "ident" : "d1", "field" : "tags", "action" : {"opp" : "remove", "idx" : 1}},
+      {"opp" : "modify", "ident" : "m", "field" : "children", "action" : {"opp" : "remove", "idx" : 0}},
+      {"opp" : "remove", "ident" : "cp"}], True),
+    #a unique object left without an owner
+    ([{"opp" : "modify", "ident" : "p1", "field" : "infos", "action" : {"opp" : "replace", "value" : []}}], False),
+    #an object left unreachable
+    ([{"opp" : "modify", "ident" : "0", "field" : "entities", "action" : {"opp" : "remove", "idx" : 1}}], False),
+    ([{"opp" : "modify", "ident" : "0", "field" : "entities", "action" : {"opp" : "remove", "idx" : 1}},
+      {"opp" : "remove", "ident" : "p2"},
+      {"opp" : "remove", "ident" : "s1"}], True),
+]
+
+
+def test_incremental_validation_agrees_with_full(structs, type_ctx):
+    full = structs.ObjectContext(type_ctx, tree_objects())
+    incremental = structs.ObjectContext(type_ctx, tree_objects())
+    for block, valid in BLOCKS:
+        for obj_ctx, options in [(full, {}), (incremental, {"incremental" : True})]:
+            if valid:
+                obj_ctx.apply_changes(block, atomic = True, **options)
+            else:
+                with pytest.raises(Exception):
+                    obj_ctx.apply_changes(block, atomic = True, **options)
+        assert object_state(full) == object_state(incremental)
+    full.validate()
+    incremental.validate()
+